@@ -17,9 +17,10 @@ mkdir -p /app/staticfiles
 echo "=> Collecting static files..."
 python manage.py collectstatic --noinput || echo "collectstatic failed (maybe no STATIC_ROOT), continuing..."
 
-# Lancement de Gunicorn
+# Lancement de Gunicorn (workers Uvicorn : ASGI, requis par le flux SSE /route_events/)
 echo "=> Starting Gunicorn..."
-exec gunicorn lignes_de_cretes.wsgi:application \
+exec gunicorn lignes_de_cretes.asgi:application \
+    --worker-class uvicorn.workers.UvicornWorker \
     --bind 0.0.0.0:${PORT:-8000} \
     --timeout 180 \
     --workers 3
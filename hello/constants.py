@@ -9,10 +9,25 @@ TRANSIT_WEIGHTS = {
 
 # Paramètres de tolérance et autres constantes métier (à étendre si besoin)
 TRANSIT_FAILURE_THRESHOLD = 20
+TRANSIT_PROBE_BATCH = 20               # arrêts classés par lot (top-k) avant interrogation Google
 MINIMAL_WALK_HOURS = 4
 MAX_DEPARTURE_DELAY_EVENING_HOURS = 18
 MAX_DEPARTURE_DELAY_DAY_HOURS = 6
 
+# Fenêtres de desserte vérifiées avant d'interroger Google (index Arrets_6)
+SERVICE_WINDOW_GO_EXTRA_HOURS = 4     # au-delà du délai de départ max, pour la durée du trajet aller
+SERVICE_WINDOW_RETURN_HOURS = 8       # avant l'heure de retour, pour le départ depuis l'arrêt retour
+
+# Réponses Google Routes réussies gardées en cache (s), servies seules en mode dégradé
+TRANSIT_RESPONSE_CACHE_TTL = 6 * 3600
+
+# Cache négatif des échecs TC par (arrêt, sens, créneau) : durée de vie en secondes selon la raison
+TRANSIT_NEGATIVE_CACHE_TTL = {
+    "no_transit": 6 * 3600,   # aucun step TRANSIT (pas de desserte sur ce créneau)
+    "too_late": 3600,         # premier départ trop éloigné de l'heure demandée
+    "error": 5 * 60,          # erreur réseau / API, probablement transitoire
+}
+
 LEVEL_DISTANCE_MAP = {
     'debutant': 8_000,
     'intermediaire': 16_000,
@@ -41,3 +56,25 @@ RANDOMNESS_DEFAULT = "0.2"
 
 # Algorithme de randonnée : pénalité pour dissuader la réutilisation d'arêtes
 REUSE_PENALTY_MULTIPLIER = 5.0
+
+# Algorithmes de randonnée en mode anytime : budget par recherche de tracé (durée en s, arêtes examinées).
+# Budget épuisé : le meilleur tracé valide trouvé jusque-là est retourné. None : pas de limite
+HIKING_BUDGET_S = 20
+HIKING_MAX_EXPANSIONS = 2_000_000
+
+# Altitudes distantes (Open-Elevation) : échantillonnage du tracé et découpage des requêtes
+ELEVATION_SIMPLIFY_EPSILON_DEG = 0.0001   # tolérance Douglas-Peucker (~10 m)
+ELEVATION_SAMPLE_SPACING_M = 100          # au moins un point échantillonné tous les 100 m
+ELEVATION_CHUNK_SIZE = 500                # points par requête
+ELEVATION_MAX_WORKERS = 4                 # requêtes simultanées
+
+# Profil altimétrique
+ELEVATION_SMOOTHING_WINDOW = 9            # points de la moyenne mobile
+ELEVATION_HYSTERESIS_M = 5                # variation minimale comptée dans les dénivelés
+ELEVATION_PROFILE_POINTS = 200            # points du profil envoyé au front
+
+# Orchestration : threads par requête pour les étapes d'I/O qui se recouvrent
+ROUTE_TASK_WORKERS = 4
+
+# Graine par défaut d'une requête : mêmes paramètres dans la même fenêtre de 15 min → même itinéraire
+ROUTE_SEED_WINDOW_S = 15 * 60
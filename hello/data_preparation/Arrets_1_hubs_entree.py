@@ -5,21 +5,21 @@ import requests
 from datetime import datetime, timedelta
 import time
 import sys
-from utils import slugify
+from utils import slugify, DEPARTURE_TIME_BUCKETS
 
-def get_duration_from_api(origin_coords, destination_coords):
+def get_duration_from_api(origin_coords, destination_coords, departure_hour=4):
     """Call Google Maps API to get duration in minutes"""
     load_dotenv()
     API_KEY = os.getenv("GOOGLE_API_KEY")
     origin = {"latitude": origin_coords[1], "longitude": origin_coords[0]}
     destination = {"latitude": destination_coords[1], "longitude": destination_coords[0]}
 
-    # Heure de départ : samedi prochain à 4h, en UTC
+    # Heure de départ : samedi prochain à departure_hour, en UTC
     now = datetime.now()
     days_ahead = (5 - now.weekday()) % 7  # 5 = samedi
     saturday = now + timedelta(days=days_ahead)
     departure_time = datetime.combine(
-        saturday.date(), datetime.strptime("04:00", "%H:%M").time()
+        saturday.date(), datetime.strptime(f"{departure_hour:02d}:00", "%H:%M").time()
     )
     departure_time_utc = departure_time.astimezone().isoformat()
 
@@ -72,33 +72,31 @@ def ajouter_durations_hubs(massif):
     
     # Pour chaque hub d'entrée
     for feature in hubs_entree['features']:
-        durations_from_hubs = {}
+        durations_by_bucket = {}
         entree_coords = feature['geometry']['coordinates']
-        
-        # Pour chaque hub de départ
-        for hub_depart in hubs_departs['features']:
-            hub_name = hub_depart['properties']['nom']
-            depart_coords = hub_depart['geometry']['coordinates']
-            
-            # Appel Google Maps API
-            duration = get_duration_from_api(depart_coords, entree_coords)
-            durations_from_hubs[hub_name] = duration
-            print(f"Durée de {hub_name} à entrée {feature['properties']['id']}: {duration} min")
-            time.sleep(0.1)  
-        
-        for hub_entree in hubs_entree['features']:
-            hub_name = hub_entree['properties']['id']
-            depart_coords = hub_entree['geometry']['coordinates']
-            # Appel Google Maps API
-            if entree_coords == depart_coords:
-                duration = 0
-            else:
-                duration = get_duration_from_api(depart_coords, entree_coords)
-            durations_from_hubs[hub_name] = duration
-            print(f"Durée de {hub_name} à entrée {feature['properties']['id']}: {duration} min")
-            time.sleep(0.1)  
-        
-        feature['properties']['durations_from_hubs'] = durations_from_hubs
+
+        # Hubs de départ puis hubs d'entrée (le départ peut se faire depuis un hub d'entrée)
+        origins = [(hub['properties']['nom'], hub['geometry']['coordinates']) for hub in hubs_departs['features']]
+        origins += [(hub['properties']['id'], hub['geometry']['coordinates']) for hub in hubs_entree['features']]
+
+        for hub_name, depart_coords in origins:
+            durations = []
+            # Un appel Google Maps API par créneau horaire de départ
+            for departure_hour in DEPARTURE_TIME_BUCKETS:
+                if entree_coords == depart_coords:
+                    duration = 0
+                else:
+                    duration = get_duration_from_api(depart_coords, entree_coords, departure_hour)
+                    time.sleep(0.1)
+                durations.append(duration)
+            durations_by_bucket[hub_name] = durations
+            print(f"Durées de {hub_name} à entrée {feature['properties']['id']}: {durations} min")
+
+        # durations_from_hubs : créneau de 4h, conservé pour les anciens consommateurs
+        feature['properties']['durations_from_hubs'] = {
+            name: durations[0] for name, durations in durations_by_bucket.items()
+        }
+        feature['properties']['durations_from_hubs_by_bucket'] = durations_by_bucket
     
     # Save updated geojson
     with open(f'data/output/{slug_massif}_hubs_entree.geojson', 'w') as f:
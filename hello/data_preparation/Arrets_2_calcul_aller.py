@@ -7,8 +7,68 @@ from datetime import datetime, timedelta
 import time
 from shapely.geometry import Point
 import json
-from utils import slugify
+import numpy as np
+from utils import slugify, DEPARTURE_TIME_BUCKETS, UNREACHABLE_MINUTES
 import math
+
+
+def export_duration_matrix(massif: str, stops_gdf, hubs_entree):
+    """
+    Exporte la matrice dense des durées (min) hub de départ → arrêt, par créneau horaire.
+
+    minutes[b, h, s] = durée hub h → hub d'entrée de s (créneau b) + durée hub d'entrée → s.
+    normalized[b, h, s] est la normalisation min-max de minutes[b, h, :] sur tous les arrêts.
+    Les arrêts sont indexés dans l'ordre du GeoDataFrame, identique aux clés du mapping arrêts-nœuds.
+    """
+    entry_features = hubs_entree.get("features", [])
+    entry_ids = [feat["properties"].get("id") for feat in entry_features]
+
+    hub_names = []
+    for feat in entry_features:
+        props = feat["properties"]
+        for name in props.get("durations_from_hubs_by_bucket") or props.get("durations_from_hubs", {}):
+            if name not in hub_names:
+                hub_names.append(name)
+
+    # Durées hub de départ → hub d'entrée : (créneaux, hubs, hubs d'entrée + 1 colonne « inconnu »)
+    hub_to_entry = np.full(
+        (len(DEPARTURE_TIME_BUCKETS), len(hub_names), len(entry_ids) + 1), UNREACHABLE_MINUTES, dtype=np.float32
+    )
+    for e, feat in enumerate(entry_features):
+        props = feat["properties"]
+        by_bucket = props.get("durations_from_hubs_by_bucket")
+        if not by_bucket:
+            # Ancien format : une seule durée (départ 4h) reprise pour tous les créneaux
+            by_bucket = {
+                name: [duration] * len(DEPARTURE_TIME_BUCKETS)
+                for name, duration in props.get("durations_from_hubs", {}).items()
+            }
+        for h, name in enumerate(hub_names):
+            durations = by_bucket.get(name)
+            if durations:
+                hub_to_entry[:, h, e] = [UNREACHABLE_MINUTES if d is None else d for d in durations]
+
+    entry_index = {entry_id: e for e, entry_id in enumerate(entry_ids)}
+    stop_entry = np.array([entry_index.get(hub_id, len(entry_ids)) for hub_id in stops_gdf["hubs_entree"]])
+    stop_duration = stops_gdf["duration"].fillna(UNREACHABLE_MINUTES).to_numpy(dtype=np.float32)
+
+    minutes = hub_to_entry[:, :, stop_entry] + stop_duration[np.newaxis, np.newaxis, :]
+    minv = minutes.min(axis=2, keepdims=True)
+    spread = minutes.max(axis=2, keepdims=True) - minv
+    normalized = np.where(spread > 0, (minutes - minv) / np.where(spread > 0, spread, 1), 0.0).astype(np.float32)
+
+    output_path = f"data/output/{slugify(massif)}_duration_matrix.npz"
+    np.savez_compressed(
+        output_path,
+        stop_ids=np.array([str(i) for i in range(len(stops_gdf))]),
+        hubs=np.array(hub_names),
+        buckets=np.array(DEPARTURE_TIME_BUCKETS),
+        minutes=minutes,
+        normalized=normalized,
+    )
+    print(f"✅ Matrice de durées exportée : {output_path} {minutes.shape}")
+
+
 def process_scores(massif: str):
     # Charger la clé API depuis le fichier .env
     load_dotenv()
@@ -127,6 +187,8 @@ def process_scores(massif: str):
     output_gdf.to_file(output_path, driver="GeoJSON")
     print(f"✅ Fichier exporté : {output_path}")
 
+    export_duration_matrix(massif, output_gdf, hubs_entree)
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,127 @@
+import sys
+import glob
+import json
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from scipy.spatial import KDTree
+from utils import slugify
+
+# Rayon d'association entre un arrêt du massif et un arrêt GTFS / une observation loguée
+MATCH_RADIUS_M = 150
+# Nombre minimal d'observations loguées pour indexer un arrêt absent des GTFS
+MIN_LOG_OBSERVATIONS = 10
+
+WEEKDAY_COLUMNS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def read_gtfs_service_hours(zip_path):
+    """Retourne un DataFrame (stop_lon, stop_lat, weekday, hour) des passages d'un flux GTFS."""
+    with zipfile.ZipFile(zip_path) as z:
+        names = set(z.namelist())
+        stops = pd.read_csv(z.open("stops.txt"), usecols=["stop_id", "stop_lat", "stop_lon"], dtype={"stop_id": str})
+        trips = pd.read_csv(z.open("trips.txt"), usecols=["trip_id", "service_id"], dtype=str)
+        stop_times = pd.read_csv(
+            z.open("stop_times.txt"), usecols=["trip_id", "stop_id", "departure_time"], dtype=str
+        )
+
+        # Jours de circulation de chaque service (calendar.txt, sinon calendar_dates.txt)
+        if "calendar.txt" in names:
+            calendar = pd.read_csv(z.open("calendar.txt"), dtype={"service_id": str})
+            service_days = calendar.melt(
+                id_vars="service_id", value_vars=WEEKDAY_COLUMNS, var_name="day", value_name="active"
+            )
+            service_days = service_days[service_days["active"] == 1]
+            service_days["weekday"] = service_days["day"].map(WEEKDAY_COLUMNS.index)
+        else:
+            dates = pd.read_csv(z.open("calendar_dates.txt"), dtype={"service_id": str, "date": str})
+            dates = dates[dates["exception_type"] == 1]
+            dates["weekday"] = pd.to_datetime(dates["date"], format="%Y%m%d").dt.weekday
+            service_days = dates
+        service_days = service_days[["service_id", "weekday"]].drop_duplicates()
+
+    stop_times = stop_times.dropna(subset=["departure_time"])
+    stop_times = stop_times.merge(trips, on="trip_id").merge(service_days, on="service_id")
+
+    # Les horaires GTFS peuvent dépasser 24:00 (service de nuit) : report sur le jour suivant
+    hours = stop_times["departure_time"].str.split(":").str[0].astype(int)
+    stop_times["weekday"] = (stop_times["weekday"] + hours // 24) % 7
+    stop_times["hour"] = hours % 24
+
+    passages = stop_times[["stop_id", "weekday", "hour"]].drop_duplicates().merge(stops, on="stop_id")
+    return passages[["stop_lon", "stop_lat", "weekday", "hour"]]
+
+
+def read_logged_service_hours(log_path):
+    """Retourne un DataFrame (stop_lon, stop_lat, weekday, hour) des trajets réussis logués en production."""
+    if not os.path.exists(log_path):
+        return pd.DataFrame(columns=["stop_lon", "stop_lat", "weekday", "hour"])
+    logs = pd.read_csv(log_path)
+    return logs.rename(columns={"lon": "stop_lon", "lat": "stop_lat"})[["stop_lon", "stop_lat", "weekday", "hour"]]
+
+
+def match_to_stops(stops_gdf, passages):
+    """Associe chaque passage à l'arrêt du massif le plus proche (< MATCH_RADIUS_M). Retourne l'index ou -1."""
+    if passages.empty:
+        return np.array([], dtype=int)
+    lat0 = np.radians(stops_gdf.geometry.y.mean())
+    scale = np.array([np.cos(lat0), 1.0])
+    tree = KDTree(np.column_stack([stops_gdf.geometry.x, stops_gdf.geometry.y]) * scale)
+    dist, idx = tree.query(passages[["stop_lon", "stop_lat"]].to_numpy(dtype=float) * scale)
+    radius_deg = MATCH_RADIUS_M / 111_000
+    return np.where(dist <= radius_deg, idx, -1)
+
+
+def build_service_windows(massif: str):
+    slug = slugify(massif)
+    stops_gdf = gpd.read_file(f"data/output/{slug}_arrets_final.geojson")
+    masks = np.zeros((len(stops_gdf), 7), dtype=np.int64)
+    covered = np.zeros(len(stops_gdf), dtype=bool)
+
+    # 1. Flux GTFS : tout arrêt associé est indexé, ses créneaux sans passage sont « morts »
+    for zip_path in sorted(glob.glob("data/input/gtfs/*.zip")):
+        print(f"🚌 Lecture GTFS : {zip_path}")
+        passages = read_gtfs_service_hours(zip_path)
+        matched = match_to_stops(stops_gdf, passages)
+        keep = matched >= 0
+        np.bitwise_or.at(
+            masks,
+            (matched[keep], passages["weekday"].to_numpy()[keep]),
+            np.left_shift(1, passages["hour"].to_numpy()[keep].astype(np.int64)),
+        )
+        covered[np.unique(matched[keep])] = True
+
+    # 2. Trajets réussis logués : complètent les GTFS, et indexent les arrêts suffisamment observés
+    logged = read_logged_service_hours("data/logs/transit_service_log.csv")
+    matched = match_to_stops(stops_gdf, logged)
+    keep = matched >= 0
+    observations = np.bincount(matched[keep], minlength=len(stops_gdf))
+    for delta in (-1, 0, 1):
+        # Une observation valide aussi l'heure précédente et suivante
+        hours = logged["hour"].to_numpy()[keep].astype(np.int64) + delta
+        valid = (hours >= 0) & (hours < 24)
+        np.bitwise_or.at(
+            masks,
+            (matched[keep][valid], logged["weekday"].to_numpy()[keep][valid].astype(int)),
+            np.left_shift(1, hours[valid]),
+        )
+    covered |= observations >= MIN_LOG_OBSERVATIONS
+
+    # Les clés sont les index du GeoDataFrame, identiques au mapping arrêts-nœuds
+    service_windows = {str(i): masks[i].tolist() for i in np.flatnonzero(covered)}
+
+    output_path = f"data/output/{slug}_service_windows.json"
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(service_windows, f)
+    print(f"✅ {len(service_windows)}/{len(stops_gdf)} arrêts indexés : {output_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python Arrets_6_fenetres_service.py <Massif>")
+        sys.exit(1)
+
+    massif_name = sys.argv[1]
+    build_service_windows(massif_name)
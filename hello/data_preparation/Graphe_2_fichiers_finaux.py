@@ -8,8 +8,95 @@ import json
 import os
 from pyproj import Geod
 import sys
+import glob
+import requests
 from utils import slugify
 
+OPEN_ELEVATION_URL = "https://api.open-elevation.com/api/v1/lookup"
+OPEN_ELEVATION_BATCH = 1000
+
+
+def sample_dem_elevations(node_coords):
+    """Altitudes des nœuds (lon, lat) sur les tuiles MNT de data/input/dem ; NaN si non couvert."""
+    elevations = np.full(len(node_coords), np.nan)
+    tif_paths = sorted(glob.glob("data/input/dem/*.tif"))
+    if not tif_paths:
+        return elevations
+
+    import rasterio
+    from rasterio.warp import transform as warp_transform
+
+    for tif_path in tif_paths:
+        todo = np.flatnonzero(np.isnan(elevations))
+        if not todo.size:
+            break
+        with rasterio.open(tif_path) as src:
+            xs, ys = node_coords[todo, 0], node_coords[todo, 1]
+            if src.crs and src.crs.to_string() not in ("EPSG:4326", "OGC:CRS84"):
+                xs, ys = warp_transform("EPSG:4326", src.crs, xs.tolist(), ys.tolist())
+                xs, ys = np.asarray(xs), np.asarray(ys)
+            left, bottom, right, top = src.bounds
+            inside = (xs >= left) & (xs <= right) & (ys >= bottom) & (ys <= top)
+            if not inside.any():
+                continue
+            values = np.array([v[0] for v in src.sample(zip(xs[inside], ys[inside]))], dtype=np.float64)
+            if src.nodata is not None:
+                values[values == src.nodata] = np.nan
+            elevations[todo[inside]] = values
+        print(f"🏔️ {tif_path} : {int(inside.sum())} nœuds échantillonnés")
+    return elevations
+
+
+def fetch_remote_elevations(node_coords):
+    """Altitudes via Open-Elevation, par lots de OPEN_ELEVATION_BATCH points ; NaN en cas d'échec."""
+    elevations = np.full(len(node_coords), np.nan)
+    for start in range(0, len(node_coords), OPEN_ELEVATION_BATCH):
+        batch = node_coords[start:start + OPEN_ELEVATION_BATCH]
+        locations = [{"latitude": float(lat), "longitude": float(lon)} for lon, lat in batch]
+        try:
+            response = requests.post(OPEN_ELEVATION_URL, json={"locations": locations}, timeout=120)
+            response.raise_for_status()
+            results = response.json().get("results") or []
+            if len(results) == len(batch):
+                elevations[start:start + len(batch)] = [r.get("elevation", np.nan) for r in results]
+        except Exception as e:
+            print(f"⚠️ Lot Open-Elevation {start}-{start + len(batch)} en échec : {e}")
+    return elevations
+
+
+def add_node_elevations(G, massif_slug):
+    """
+    Échantillonne l'altitude de chaque nœud (MNT local, puis Open-Elevation pour le reste),
+    l'écrit en attribut de nœud 'elevation' et les dénivelés 'ascent' / 'descent' sur chaque arête
+    (sens : du plus petit nœud au plus grand, dans l'ordre des tuples (lon, lat)).
+    Sauvegarde aussi le tableau des altitudes dans data/output/{slug}_node_elevations.npz.
+    """
+    graph_nodes = list(G.nodes)
+    node_coords = np.array(graph_nodes, dtype=np.float64)[:, :2]
+
+    elevations = sample_dem_elevations(node_coords)
+    missing = np.flatnonzero(np.isnan(elevations))
+    if missing.size:
+        print(f"🌐 {missing.size} nœuds hors MNT, interrogation Open-Elevation")
+        elevations[missing] = fetch_remote_elevations(node_coords[missing])
+    missing = np.isnan(elevations)
+    if missing.any():
+        print(f"⚠️ {int(missing.sum())} nœuds sans altitude, mis à 0")
+        elevations[missing] = 0.0
+
+    for node, ele in zip(graph_nodes, elevations.tolist()):
+        G.nodes[node]["elevation"] = ele
+    for u, v, data in G.edges(data=True):
+        low, high = (u, v) if u <= v else (v, u)
+        delta = G.nodes[high]["elevation"] - G.nodes[low]["elevation"]
+        data["ascent"] = max(delta, 0.0)
+        data["descent"] = max(-delta, 0.0)
+
+    elevations_path = f"data/output/{massif_slug}_node_elevations.npz"
+    np.savez_compressed(elevations_path, coords=node_coords, elevation=elevations.astype(np.float32))
+    print(f"✅ Altitudes des nœuds sauvegardées dans : {elevations_path}")
+
+
 def main():
     if len(sys.argv) < 2:
         print("❌ Usage: python Graphe_2_fichiers_finaux.py <massif_name>")
@@ -60,6 +147,10 @@ def main():
 
     print(f"✅ Graphe construit : {G.number_of_nodes()} nœuds, {G.number_of_edges()} arêtes.")
 
+    # === Altitudes des nœuds et dénivelés des arêtes ===
+    os.makedirs("data/output", exist_ok=True)
+    add_node_elevations(G, massif_slug)
+
     # === Association des arrêts de transport aux nœuds du graphe ===
     graph_nodes = list(G.nodes)
     node_coords = np.array(graph_nodes)
@@ -75,6 +166,8 @@ def main():
 
         stop_nodes[idx] = {
             'node': nearest_node,
+            # Position propre de l'arrêt : journal des dessertes (Arrets_6_fenetres_service)
+            'coord': stop_coord,
             'properties': stop.drop(labels='geometry').to_dict()
         }
 
@@ -56,7 +56,7 @@ def estimate_poi_grid_count(bbox, pas_lat=0.005, pas_lng=0.005):
 
 # ---------- Pipelines ----------
 def pipeline_arrets(massif_name, script_dir, start_step=0):
-    """Pipeline arrêts : étapes 0..5 (Arrets_0 -> Arrets_5)."""
+    """Pipeline arrêts : étapes 0..6 (Arrets_0 -> Arrets_6)."""
     slug_massif = slugify(massif_name)
 
     steps = [
@@ -66,6 +66,7 @@ def pipeline_arrets(massif_name, script_dir, start_step=0):
         ("Arrets_3_calcul_altitude.py", [massif_name]),
         ("Arrets_4_calcul_distance.py", [massif_name]),
         ("Arrets_5_normalisation.py", [massif_name]),
+        ("Arrets_6_fenetres_service.py", [massif_name]),
     ]
 
     for i, (script_name, args) in enumerate(steps):
@@ -165,6 +166,7 @@ def main():
         print("3. Arrets_3_calcul_altitude.py")
         print("4. Arrets_4_calcul_distance.py")
         print("5. Arrets_5_normalisation.py")
+        print("6. Arrets_6_fenetres_service.py")
         start_input = input("À partir de quelle étape voulez-vous reprendre ? (numéro, défaut=0) : ").strip()
         start_step = int(start_input) if start_input.isdigit() else 0
         pipeline_arrets(massif_name, script_dir, start_step=start_step)
@@ -191,7 +193,7 @@ def main():
     elif choice == "4":
         # pour "Tout" on demande étape de départ pour chaque sous-pipeline
         print("\n--- Pipeline 'Tout' : pour chaque bloc choisissez l'étape de départ ---")
-        print("\n[Arrêts] étapes 0..5 (défaut 0)")
+        print("\n[Arrêts] étapes 0..6 (défaut 0)")
         start_input = input("Arrêts : étape de départ (numéro, défaut=0) : ").strip()
         start_arrets = int(start_input) if start_input.isdigit() else 0
 
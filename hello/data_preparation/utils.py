@@ -16,4 +16,17 @@ def normalize_label(s: str) -> str:
 def slugify(name: str) -> str:
     """Transforme une chaîne en identifiant safe pour les fichiers"""
     cleaned = normalize_label(name)
-    return re.sub(r'[^a-z0-9]+', '_', cleaned).strip("_")
\ No newline at end of file
+    return re.sub(r'[^a-z0-9]+', '_', cleaned).strip("_")
+
+# Créneaux horaires de départ (heure de début) de la matrice de durées hubs → arrêts
+DEPARTURE_TIME_BUCKETS = (4, 7, 10, 13, 16, 19)
+UNREACHABLE_MINUTES = 10000
+
+
+def time_bucket_index(hour: int) -> int:
+    """Retourne l'index du créneau de DEPARTURE_TIME_BUCKETS contenant l'heure donnée."""
+    index = 0
+    for i, start_hour in enumerate(DEPARTURE_TIME_BUCKETS):
+        if hour >= start_hour:
+            index = i
+    return index
@@ -0,0 +1,54 @@
+"""
+Compaction du mapping arrêts-nœuds d'un massif :
+supprime les arrêts en échec permanent (compteurs SQLite) et réécrit le fichier une seule fois.
+"""
+
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hello.constants import TRANSIT_FAILURE_THRESHOLD
+from hello.data_preparation.utils import slugify
+from hello.routing.domain.failure_counters import blocked_stop_ids, reset_counters
+
+
+class Command(BaseCommand):
+    help = "Retire du mapping arrêts-nœuds les arrêts ayant atteint le seuil d'échecs de transport en commun."
+
+    def add_arguments(self, parser):
+        parser.add_argument("massif", help="Nom du massif (ex : Chartreuse)")
+        parser.add_argument("--threshold", type=int, default=TRANSIT_FAILURE_THRESHOLD,
+                            help="Nombre d'échecs à partir duquel un arrêt est supprimé")
+        parser.add_argument("--dry-run", action="store_true", help="Affiche les arrêts concernés sans rien modifier")
+
+    def handle(self, *args, **options):
+        massif_clean = slugify(options["massif"])
+        stops_path = os.path.join(settings.BASE_DIR, "data", "output", f"{massif_clean}_arrets_stop_node_mapping.json")
+        if not os.path.exists(stops_path):
+            raise CommandError(f"Fichier introuvable : {stops_path}")
+
+        with open(stops_path, "r", encoding="utf-8") as f:
+            stops_data = json.load(f)
+
+        blocked = blocked_stop_ids(massif_clean, options["threshold"]) & set(stops_data)
+        self.stdout.write(f"{len(blocked)} arrêts sur {len(stops_data)} à supprimer : {sorted(blocked)}")
+        if options["dry_run"]:
+            return
+
+        # Les anciens compteurs stockés dans le fichier ne sont plus utilisés
+        compacted = {}
+        for stop_id, stop_info in stops_data.items():
+            if stop_id in blocked:
+                continue
+            stop_info.pop("failure_count", None)
+            compacted[stop_id] = stop_info
+
+        tmp_path = f"{stops_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(compacted, f, ensure_ascii=False)
+        os.replace(tmp_path, stops_path)
+        reset_counters(massif_clean, blocked)
+
+        self.stdout.write(self.style.SUCCESS(f"Mapping compacté : {len(compacted)} arrêts dans {stops_path}"))
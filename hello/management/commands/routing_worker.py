@@ -0,0 +1,112 @@
+"""
+Worker de calcul d'itinéraires : traite la file durable (ROUTING_EXECUTOR_BACKEND = 'queue').
+Le web ne fait qu'enfiler et lire l'état ; lancer autant de workers que de cœurs à consacrer au calcul.
+"""
+
+import os
+import signal
+import socket
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hello.routing.trouver_chemin import compute_best_route
+from hello.routing.utils import job_queue
+from hello.routing.utils.files_tools import log_get_route_call
+from hello.routing.utils.route_cache import cache_result
+from hello.routing.domain.progress import update_route_status
+from hello.routing.domain.deadline import request_deadline, RouteCancelled
+
+JOB_RETENTION_S = 86400     # conservation des demandes terminées dans la file
+PURGE_INTERVAL_S = 3600
+
+
+class Command(BaseCommand):
+    help = "Traite les calculs d'itinéraire de la file durable (SQLite)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-jobs", type=int, default=0,
+                            help="Nombre de calculs avant arrêt (recyclage par le superviseur) ; 0 = illimité")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Attente (s) entre deux consultations d'une file vide")
+        parser.add_argument("--visibility-timeout", type=int, default=settings.ROUTING_JOB_VISIBILITY_TIMEOUT,
+                            help="Durée (s) du bail d'un calcul, prolongée à chaque étape")
+
+    def handle(self, *args, **options):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.visibility_timeout = options["visibility_timeout"]
+        self.stopping = False
+
+        def stop(signum, frame):
+            self.stdout.write("Arrêt demandé, fin du calcul en cours…")
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"Worker {self.worker_id} démarré (file : {job_queue.QUEUE_PATH})")
+        processed, last_purge = 0, 0.0
+        while not self.stopping and not (options["max_jobs"] and processed >= options["max_jobs"]):
+            if time.time() - last_purge > PURGE_INTERVAL_S:
+                job_queue.purge(JOB_RETENTION_S)
+                last_purge = time.time()
+
+            job_id, payload, attempts, expired = job_queue.claim(self.worker_id, self.visibility_timeout)
+            for expired_id in expired:
+                update_route_status(expired_id, message="Erreur : délai de traitement dépassé", progress=100,
+                                    finished=True, error="Délai de traitement dépassé")
+            if job_id is None:
+                time.sleep(options["poll_interval"])
+                continue
+
+            self._run(job_id, payload, attempts)
+            processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Worker {self.worker_id} arrêté après {processed} calculs"))
+
+    def _run(self, job_id, payload, attempts):
+        params = payload["params"]
+        log_fields = (params["massif"], params["address"], params["level"], payload.get("randomness_str"),
+                      params["departure_time"], params["return_time"], params["transit_priority"], params["pois"])
+        last_extend = time.monotonic()
+
+        def status_callback(message, progress=None, partial=None):
+            nonlocal last_extend
+            update_route_status(job_id, message=message, progress=progress, partial=partial)
+            # Prolonge le bail au fil des étapes (au plus une écriture par tiers de délai)
+            if time.monotonic() - last_extend > self.visibility_timeout / 3:
+                job_queue.extend(job_id, self.worker_id, self.visibility_timeout)
+                last_extend = time.monotonic()
+
+        self.stdout.write(f"Calcul {job_id} (tentative {attempts})")
+        update_route_status(job_id, message="Démarrage du calcul du tracé...", progress=0)
+        try:
+            geojson_data = compute_best_route(
+                **params, status_callback=status_callback, deadline=request_deadline(job_id),
+            )
+        except RouteCancelled:
+            self.stdout.write(f"Calcul {job_id} annulé")
+            job_queue.cancel(job_id)
+            return
+        except Exception as exc:
+            error_message = str(exc)
+            print("❌ ERREUR SERVEUR INTERNE (worker):")
+            print(traceback.format_exc())
+            if job_queue.fail(job_id, self.worker_id, error_message, settings.ROUTING_JOB_RETRY_DELAY_S):
+                update_route_status(job_id, message=f"Erreur, nouvelle tentative prévue : {error_message}")
+            else:
+                log_get_route_call(*log_fields, error_message)
+                update_route_status(job_id, message=f"Erreur : {error_message}", progress=100,
+                                    finished=True, error=error_message)
+            return
+
+        if payload.get("cache_key"):
+            cache_result(payload["cache_key"], geojson_data)
+        if not job_queue.complete(job_id, self.worker_id):
+            # Annulé ou repris par un autre worker pendant le calcul : statut laissé tel quel
+            self.stdout.write(f"Calcul {job_id} terminé mais plus attribué à ce worker, résultat non publié")
+            return
+        log_get_route_call(*log_fields, "Succès")
+        update_route_status(job_id, message="Calcul terminé", progress=100, finished=True, result=geojson_data)
@@ -0,0 +1,140 @@
+"""
+Échéance d'un calcul d'itinéraire : délai maximal et annulation coopérative.
+Passée de compute_best_route jusqu'aux sondes TC et aux algorithmes de randonnée,
+qui la consultent entre deux candidats ou deux recherches de chemin :
+- délai dépassé : les boucles s'arrêtent et gardent le meilleur résultat partiel ;
+- annulation : RouteCancelled interrompt le calcul.
+Une étape peut ouvrir son propre budget (budget()) : durée et/ou nombre d'expansions, compté
+par la fonction de poids (weight()) passée aux recherches de plus court chemin, qui interrompt
+la recherche en cours (BudgetExhausted) dès que le budget est épuisé.
+"""
+
+import logging
+import time
+from django.conf import settings
+
+from .progress import route_cancelled_since
+
+logger = logging.getLogger(__name__)
+
+CANCEL_POLL_INTERVAL_S = 1.0    # lecture de l'annulation au plus une fois par seconde
+CLOCK_CHECK_EXPANSIONS = 256    # lecture de l'horloge toutes les N arêtes examinées par weight()
+
+
+class RouteCancelled(BaseException):
+    """
+    Calcul annulé à la demande du client.
+    Hérite de BaseException (comme asyncio.CancelledError) pour traverser
+    les `except Exception` des essais de candidats.
+    """
+
+
+class DeadlineExceeded(TimeoutError):
+    """Délai de calcul dépassé sans résultat partiel utilisable."""
+
+
+class BudgetExhausted(Exception):
+    """
+    Délai ou budget d'expansions épuisé au milieu d'une recherche de chemin (levée par weight()) :
+    l'appelant abandonne cette recherche et garde son dernier tracé valide.
+    """
+
+
+class Deadline:
+    """
+    timeout_s : délai à partir de la création (None : pas de délai).
+    cancel_check : fonction sans argument, vraie si le calcul a été annulé.
+    max_expansions : nombre maximal d'arêtes examinées par les recherches utilisant weight().
+    """
+
+    def __init__(self, timeout_s=None, cancel_check=None, max_expansions=None):
+        self.expires_at = time.monotonic() + timeout_s if timeout_s else None
+        self.max_expansions = max_expansions
+        self.expansions = 0
+        self._cancel_check = cancel_check
+        self._cancelled = False
+        self._last_poll = 0.0
+        self._parent = None
+
+    def budget(self, timeout_s=None, max_expansions=None):
+        """
+        Budget d'une étape (mode anytime) : échéance la plus proche entre la sienne et celle
+        du calcul, compteur d'expansions propre ; l'annulation reste celle du calcul.
+        """
+        if timeout_s is None and max_expansions is None:
+            return self
+        child = Deadline(timeout_s, max_expansions=max_expansions)
+        if self.expires_at is not None:
+            child.expires_at = min(child.expires_at or self.expires_at, self.expires_at)
+        child._parent = self
+        return child
+
+    def weight(self, attr="length", penalties=None):
+        """
+        Fonction de poids networkx qui compte les arêtes examinées (expansions) et lève
+        BudgetExhausted dès que max_expansions est atteint ou que le délai est dépassé
+        (horloge lue toutes les CLOCK_CHECK_EXPANSIONS arêtes) : une seule recherche ne peut
+        pas dépasser le budget. Les recherches qui doivent aboutir utilisent un poids non compté.
+        penalties : longueurs pénalisées {(u, v): longueur} propres au calcul (voir geotools).
+        """
+        penalties = {} if penalties is None else penalties
+
+        def counted(u, v, data):
+            self.expansions += 1
+            if self.max_expansions is not None and self.expansions >= self.max_expansions:
+                raise BudgetExhausted(f"{self.expansions} arêtes examinées")
+            if not self.expansions % CLOCK_CHECK_EXPANSIONS and self.exhausted():
+                raise BudgetExhausted("Délai dépassé")
+            return penalties.get((u, v), data.get(attr, 1))
+        return counted
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        if self._parent is not None and self._parent.cancelled:
+            return True
+        if not self._cancelled and self._cancel_check:
+            now = time.monotonic()
+            if now - self._last_poll >= CANCEL_POLL_INTERVAL_S:
+                self._last_poll = now
+                try:
+                    self._cancelled = bool(self._cancel_check())
+                except Exception as e:
+                    logger.warning(f"Lecture de l'annulation impossible : {e}")
+        return self._cancelled
+
+    def remaining(self):
+        """Secondes restantes (inf sans délai)."""
+        return float("inf") if self.expires_at is None else self.expires_at - time.monotonic()
+
+    def expired(self):
+        """Délai dépassé ou budget d'expansions épuisé."""
+        if self.max_expansions is not None and self.expansions >= self.max_expansions:
+            return True
+        return self.remaining() <= 0
+
+    def exhausted(self):
+        """
+        Vrai si le délai est dépassé (l'appelant garde son meilleur résultat partiel) ;
+        lève RouteCancelled si le calcul a été annulé.
+        """
+        if self.cancelled:
+            raise RouteCancelled()
+        return self.expired()
+
+    def check(self):
+        """Lève RouteCancelled ou DeadlineExceeded : pour les étapes sans résultat partiel possible."""
+        if self.exhausted():
+            raise DeadlineExceeded("Délai de calcul dépassé")
+
+
+def request_deadline(request_id, timeout_s=None):
+    """
+    Échéance d'un calcul lancé pour request_id : ROUTE_DEADLINE_S par défaut,
+    annulé si son dernier abonné le quitte (unsubscribe_route) après son démarrage.
+    """
+    started_at = time.time()
+    timeout_s = settings.ROUTE_DEADLINE_S if timeout_s is None else timeout_s
+    return Deadline(timeout_s, cancel_check=lambda: route_cancelled_since(request_id, started_at))
@@ -0,0 +1,140 @@
+"""
+Échantillonnage local des altitudes sur des tuiles MNT GeoTIFF (ELEVATION_DEM_DIR).
+Chaque tuile est convertie une fois en .npy (data/cache/dem) puis ouverte en mémoire partagée (mmap) :
+les requêtes ne lisent que les pixels voisins des points demandés.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEM_CACHE_DIR = os.path.join(settings.BASE_DIR, "data", "cache", "dem")
+GEOGRAPHIC_CRS = ("EPSG:4326", "OGC:CRS84")
+
+_TILES = None  # (signature du dossier, [DemTile])
+_TILES_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class DemTile:
+    name: str
+    array: np.ndarray      # (lignes, colonnes) float32 en mmap, NaN = nodata
+    transform: tuple       # affine GDAL (a, b, c, d, e, f) : x = a*col + b*row + c, y = d*col + e*row + f
+    crs: str
+
+
+def _cache_tile(tif_path):
+    """Convertit une tuile GeoTIFF en .npy + métadonnées (si absente ou périmée) et l'ouvre en mmap."""
+    name = os.path.splitext(os.path.basename(tif_path))[0]
+    npy_path = os.path.join(DEM_CACHE_DIR, f"{name}.npy")
+    meta_path = os.path.join(DEM_CACHE_DIR, f"{name}.json")
+
+    if not (os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(tif_path)):
+        import rasterio  # dépendance lourde, chargée seulement à la conversion
+
+        with rasterio.open(tif_path) as src:
+            band = src.read(1).astype(np.float32)
+            if src.nodata is not None:
+                band[band == src.nodata] = np.nan
+            meta = {"transform": list(src.transform)[:6], "crs": src.crs.to_string() if src.crs else "EPSG:4326"}
+        os.makedirs(DEM_CACHE_DIR, exist_ok=True)
+        tmp_path = npy_path + ".tmp.npy"
+        np.save(tmp_path, band)
+        os.replace(tmp_path, npy_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        logger.info(f"Tuile MNT {name} convertie : {band.shape[1]}x{band.shape[0]} px")
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return DemTile(
+        name=name,
+        array=np.load(npy_path, mmap_mode="r"),
+        transform=tuple(meta["transform"]),
+        crs=meta["crs"],
+    )
+
+
+def load_tiles():
+    """Tuiles MNT disponibles, chargées une fois par processus (rechargées si le dossier change)."""
+    global _TILES
+    tif_paths = sorted(glob.glob(os.path.join(str(settings.ELEVATION_DEM_DIR), "*.tif")))
+    signature = tuple((p, os.path.getmtime(p)) for p in tif_paths)
+
+    with _TILES_LOCK:
+        if _TILES is not None and _TILES[0] == signature:
+            return _TILES[1]
+        tiles = []
+        for tif_path in tif_paths:
+            try:
+                tiles.append(_cache_tile(tif_path))
+            except Exception as e:
+                logger.warning(f"Tuile MNT ignorée ({tif_path}) : {e}")
+        _TILES = (signature, tiles)
+        return tiles
+
+
+def _to_tile_crs(tile, lons, lats):
+    if tile.crs in GEOGRAPHIC_CRS:
+        return lons, lats
+    from rasterio.warp import transform as warp_transform
+
+    xs, ys = warp_transform("EPSG:4326", tile.crs, lons.tolist(), lats.tolist())
+    return np.asarray(xs), np.asarray(ys)
+
+
+def _sample_tile(tile, xs, ys):
+    """Interpolation bilinéaire vectorisée ; NaN hors de la tuile ou sur nodata."""
+    a, b, c, d, e, f = tile.transform
+    det = a * e - b * d
+    # Affine inverse, puis passage en coordonnées de centres de pixels
+    cols = (e * (xs - c) - b * (ys - f)) / det - 0.5
+    rows = (-d * (xs - c) + a * (ys - f)) / det - 0.5
+
+    height, width = tile.array.shape
+    inside = (cols >= -0.5) & (cols <= width - 0.5) & (rows >= -0.5) & (rows <= height - 0.5)
+    values = np.full(len(xs), np.nan)
+    if not inside.any() or height < 2 or width < 2:
+        return values
+
+    cols, rows = cols[inside], rows[inside]
+    c0 = np.clip(np.floor(cols).astype(np.int64), 0, width - 2)
+    r0 = np.clip(np.floor(rows).astype(np.int64), 0, height - 2)
+    fx = np.clip(cols - c0, 0.0, 1.0)
+    fy = np.clip(rows - r0, 0.0, 1.0)
+
+    z00 = tile.array[r0, c0]
+    z01 = tile.array[r0, c0 + 1]
+    z10 = tile.array[r0 + 1, c0]
+    z11 = tile.array[r0 + 1, c0 + 1]
+    values[inside] = (
+        z00 * (1 - fx) * (1 - fy) + z01 * fx * (1 - fy)
+        + z10 * (1 - fx) * fy + z11 * fx * fy
+    )
+    return values
+
+
+def sample_elevations(lons, lats):
+    """
+    Altitudes (m) des points (lon, lat) sur les tuiles MNT locales.
+    Retourne un tableau ; NaN pour les points non couverts.
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    result = np.full(len(lons), np.nan)
+
+    for tile in load_tiles():
+        todo = np.flatnonzero(np.isnan(result))
+        if not todo.size:
+            break
+        xs, ys = _to_tile_crs(tile, lons[todo], lats[todo])
+        result[todo] = _sample_tile(tile, xs, ys)
+    return result
@@ -1,33 +1,181 @@
 """
 Gestion des altitudes et des élévations.
-Récupération, lissage et calcul de dénivelés.
+Récupération des altitudes (nœuds précalculés, MNT local, cache, Open-Elevation).
+Le lissage et les dénivelés sont calculés dans elevation_profile.
 """
 
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import requests
+from django.conf import settings
+from simplification.cutil import simplify_coords_idx
+
+from . import elevation_cache
+from .dem_tiles import sample_elevations
+from ..utils.geotools import cumulative_distances
+from ..utils.load_shedding import record_upstream_latency
+from hello.constants import (
+    ELEVATION_SIMPLIFY_EPSILON_DEG, ELEVATION_SAMPLE_SPACING_M,
+    ELEVATION_CHUNK_SIZE, ELEVATION_MAX_WORKERS,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def get_elevations(path):
+def load_node_elevations(npz_path):
+    """
+    Charge les altitudes des nœuds du graphe précalculées par Graphe_2.
+    Retourne {"index": {(lon, lat): i}, "elevation": tableau float32}.
+    """
+    with np.load(npz_path) as npz:
+        coords = npz["coords"]
+        elevation = npz["elevation"]
+    index = {(lon, lat): i for i, (lon, lat) in enumerate(coords.tolist())}
+    return {"index": index, "elevation": elevation}
+
+
+def elevations_from_nodes(path, node_elevations):
+    """Altitudes des points de path lues dans le tableau des nœuds ; NaN pour les points hors graphe."""
+    rows = np.fromiter(
+        (node_elevations["index"].get((p[0], p[1]), -1) for p in path), dtype=np.int64, count=len(path)
+    )
+    elevations = np.full(len(path), np.nan)
+    known = rows >= 0
+    elevations[known] = node_elevations["elevation"][rows[known]]
+    return elevations
+
+
+def get_elevations(path, node_elevations=None, known_elevations=None, nodes_only=False):
+    """
+    Récupère les altitudes des points de path (liste de tuples (lon, lat)).
+    Sources, dans l'ordre :
+    - altitudes des nœuds du graphe précalculées (node_elevations, voir load_node_elevations) ;
+    - altitudes déjà obtenues pour ce calcul (known_elevations, {(lon, lat): altitude}) ;
+    - tuiles MNT locales (ELEVATION_DEM_DIR), interpolation bilinéaire ;
+    - Open-Elevation si ELEVATION_REMOTE_FALLBACK, sinon zéro.
+    nodes_only (mode dégradé) : deux premières sources seulement, points manquants interpolés.
+    """
+    if not path:
+        return []
+    coords = np.asarray([(p[0], p[1]) for p in path], dtype=np.float64)
+
+    if node_elevations is not None:
+        elevations = elevations_from_nodes(path, node_elevations)
+    else:
+        elevations = np.full(len(coords), np.nan)
+
+    if known_elevations:
+        for i in np.flatnonzero(np.isnan(elevations)).tolist():
+            elevations[i] = known_elevations.get((path[i][0], path[i][1]), np.nan)
+
+    if nodes_only:
+        known = ~np.isnan(elevations)
+        if not known.any():
+            logger.warning("Aucune altitude de nœud sur le tracé, altitudes mises à 0")
+            return [0.0] * len(coords)
+        if not known.all():
+            cumdist = cumulative_distances(coords)
+            elevations = np.interp(cumdist, cumdist[known], elevations[known])
+        return elevations.tolist()
+
+    todo = np.flatnonzero(np.isnan(elevations))
+    if todo.size:
+        try:
+            elevations[todo] = sample_elevations(coords[todo, 0], coords[todo, 1])
+        except Exception as e:
+            logger.warning(f"Échantillonnage MNT local impossible : {e}")
+
+    missing = np.flatnonzero(np.isnan(elevations))
+    if missing.size and settings.ELEVATION_REMOTE_FALLBACK:
+        logger.info(f"{missing.size}/{len(coords)} points hors MNT local, cache puis repli Open-Elevation")
+        elevations[missing] = _resampled_remote_elevations(coords[missing])
+
+    missing = np.flatnonzero(np.isnan(elevations))
+    if missing.size:
+        logger.warning(f"{missing.size}/{len(coords)} points sans altitude, mis à 0")
+        elevations[missing] = 0
+
+    return elevations.tolist()
+
+
+def _sample_indices(coords, cumdist):
+    """
+    Index des points à interroger : sommets conservés par Douglas-Peucker,
+    plus au moins un point tous les ELEVATION_SAMPLE_SPACING_M mètres, extrémités comprises.
+    """
+    keep = np.asarray(simplify_coords_idx(coords, ELEVATION_SIMPLIFY_EPSILON_DEG), dtype=np.int64)
+    spacing_bins = np.floor(cumdist / ELEVATION_SAMPLE_SPACING_M)
+    regular = np.flatnonzero(np.diff(spacing_bins, prepend=-1) > 0)
+    return np.unique(np.concatenate([keep, regular, [0, len(coords) - 1]]))
+
+
+def _resampled_remote_elevations(coords):
+    """
+    Altitudes distantes d'une polyligne (lon, lat) sans envoyer tous ses sommets :
+    simplification, lecture du cache disque partagé, requêtes par lots de ELEVATION_CHUNK_SIZE
+    en parallèle pour les seuls points échantillonnés absents du cache, puis interpolation linéaire
+    sur la distance cumulée pour les points restants. L'échantillonnage ne dépend que du tracé :
+    une demande répétée retrouve tous ses échantillons en cache, sans appel distant.
+    Seules les altitudes réellement obtenues sont écrites dans le cache. NaN si tout a échoué.
+    """
+    cumdist = cumulative_distances(coords)
+    sampled = _sample_indices(coords, cumdist) if len(coords) > 2 else np.arange(len(coords))
+
+    try:
+        elevations = elevation_cache.lookup(coords[:, 0], coords[:, 1])
+    except Exception as e:
+        logger.warning(f"Lecture cache altitudes impossible : {e}")
+        elevations = np.full(len(coords), np.nan)
+
+    to_fetch = sampled[np.isnan(elevations[sampled])]
+    logger.info(
+        f"Altitudes distantes : {len(to_fetch)} points interrogés pour {len(coords)} "
+        f"({len(sampled) - len(to_fetch)} échantillons en cache)"
+    )
+    if to_fetch.size:
+        chunks = [to_fetch[i:i + ELEVATION_CHUNK_SIZE] for i in range(0, len(to_fetch), ELEVATION_CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(ELEVATION_MAX_WORKERS, len(chunks))) as executor:
+            results = executor.map(
+                lambda chunk: get_remote_elevations(coords[chunk].tolist(), default=np.nan), chunks
+            )
+            elevations[to_fetch] = np.concatenate([np.asarray(r, dtype=np.float64) for r in results])
+
+        try:
+            elevation_cache.store(coords[to_fetch, 0], coords[to_fetch, 1], elevations[to_fetch])
+        except Exception as e:
+            logger.warning(f"Écriture cache altitudes impossible : {e}")
+
+    valid = ~np.isnan(elevations)
+    if not valid.any():
+        return elevations
+    return np.interp(cumdist, cumdist[valid], elevations[valid])
+
+
+def get_remote_elevations(path, default=0):
     """
     Récupère les altitudes depuis l'API Open-Elevation.
     path : liste de tuples (lon, lat)
 
     Essaie jusqu'à 3 fois en cas d'erreur ou de réponse vide.
     Si aucune tentative ne donne de résultat utilisable (ou que l'API renvoie
-    un objet nul), on renvoie une liste de zéros.
+    un objet nul), on renvoie une liste de `default` (zéros par défaut).
     """
     url = "https://api.open-elevation.com/api/v1/lookup"
     
-    locations = [{"latitude": lat, "longitude": lon} for lon, lat in path]
+    locations = [{"latitude": p[1], "longitude": p[0]} for p in path]
     all_elevations = []
 
     for attempt in range(1, 4):
         try:
             logger.debug(f"Attempt {attempt}/3 for {len(path)} elevation points")
-            response = requests.post(url, json={"locations": locations}, timeout=60)
+            started = time.monotonic()
+            try:
+                response = requests.post(url, json={"locations": locations}, timeout=60)
+            finally:
+                record_upstream_latency("open_elevation", time.monotonic() - started)
             logger.debug(f"API response status: {response.status_code}")
             response.raise_for_status()
 
@@ -52,37 +200,8 @@ def get_elevations(path):
                 time.sleep(1)
                 continue
             else:
-                logger.warning("All 3 elevation attempts failed, using zeros")
-                all_elevations = [0] * len(path)
+                logger.warning("All 3 elevation attempts failed, using default values")
+                all_elevations = [default] * len(path)
 
     logger.info(f"Retrieved {len(all_elevations)} elevations total")
     return all_elevations
-
-
-def smooth_elevations(elevations, window=9):
-    """
-    Lisse les altitudes avec une moyenne mobile.
-    window : taille de la fenêtre de lissage (impair recommandé)
-    """
-    smoothed = []
-    n = len(elevations)
-    half_window = window // 2
-    for i in range(n):
-        start = max(0, i - half_window)
-        end = min(n, i + half_window + 1)
-        smoothed.append(sum(elevations[start:end]) / (end - start))
-    return smoothed
-
-
-def compute_total_ascent(elevations, min_diff=2):
-    """
-    Calcule le dénivelé positif total.
-    min_diff : variation minimale à prendre en compte pour éviter le bruit
-    """
-    total_ascent = 0
-    for i in range(1, len(elevations)):
-        delta = elevations[i] - elevations[i-1]
-        if delta > min_diff:
-            total_ascent += delta
-    ascent = round(total_ascent)
-    return ascent
@@ -0,0 +1,102 @@
+"""
+Cache disque des altitudes, partagé entre workers (SQLite).
+Clé : coordonnée quantifiée au 1e-5 degré (~1 m), une seule clé entière par point.
+Consulté avant tout appel distant ; seules les altitudes effectivement obtenues y sont écrites.
+"""
+
+import logging
+import os
+import threading
+from django.conf import settings
+
+import numpy as np
+
+from ..utils.sqlite_tools import connect
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.join(settings.BASE_DIR, "data", "cache", "elevations.sqlite3")
+QUANTUM = 1e5          # 1e-5 degré
+SQL_BATCH = 900        # sous la limite de variables SQLite
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS elevations (key INTEGER PRIMARY KEY, elevation REAL NOT NULL)"
+
+_stats = {"hits": 0, "misses": 0, "writes": 0}
+_stats_lock = threading.Lock()
+
+
+def _connect():
+    conn = connect(CACHE_PATH)
+    conn.execute(_SCHEMA)
+    return conn
+
+
+def quantized_keys(lons, lats):
+    """Clé entière par point : longitude et latitude quantifiées sur 32 bits chacune."""
+    qlon = np.round(np.asarray(lons, dtype=np.float64) * QUANTUM).astype(np.int64)
+    qlat = np.round(np.asarray(lats, dtype=np.float64) * QUANTUM).astype(np.int64)
+    return (qlon << 32) | (qlat & 0xFFFFFFFF)
+
+
+def lookup(lons, lats):
+    """Altitudes en cache des points ; NaN pour les absents."""
+    keys = quantized_keys(lons, lats)
+    found = {}
+    unique_keys = np.unique(keys).tolist()
+    conn = _connect()
+    try:
+        for start in range(0, len(unique_keys), SQL_BATCH):
+            batch = unique_keys[start:start + SQL_BATCH]
+            rows = conn.execute(
+                f"SELECT key, elevation FROM elevations WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update(rows)
+    finally:
+        conn.close()
+
+    elevations = np.array([found.get(k, np.nan) for k in keys.tolist()], dtype=np.float64)
+    hits = int(np.count_nonzero(~np.isnan(elevations)))
+    with _stats_lock:
+        _stats["hits"] += hits
+        _stats["misses"] += len(elevations) - hits
+    return elevations
+
+
+def store(lons, lats, elevations):
+    """Écrit les altitudes obtenues (les NaN sont ignorés)."""
+    elevations = np.asarray(elevations, dtype=np.float64)
+    valid = ~np.isnan(elevations)
+    if not valid.any():
+        return
+    keys = quantized_keys(np.asarray(lons)[valid], np.asarray(lats)[valid])
+    rows = list(zip(keys.tolist(), elevations[valid].tolist()))
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT OR REPLACE INTO elevations (key, elevation) VALUES (?, ?)", rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    with _stats_lock:
+        _stats["writes"] += len(rows)
+
+
+def cache_stats():
+    """Compteurs du processus (hits, misses, writes, hit_rate) et nombre d'entrées du cache."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+    try:
+        conn = _connect()
+        try:
+            stats["entries"] = conn.execute("SELECT COUNT(*) FROM elevations").fetchone()[0]
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Lecture cache altitudes impossible : {e}")
+        stats["entries"] = None
+    return stats
@@ -0,0 +1,110 @@
+"""
+Profil altimétrique d'un tracé : lissage, dénivelés, extrêmes, pentes
+et profil sous-échantillonné pour l'affichage, calculés sur des tableaux NumPy.
+"""
+
+import numpy as np
+
+from ..utils.geotools import cumulative_distances
+from hello.constants import ELEVATION_SMOOTHING_WINDOW, ELEVATION_HYSTERESIS_M, ELEVATION_PROFILE_POINTS
+
+
+def moving_average(values, window=ELEVATION_SMOOTHING_WINDOW):
+    """
+    Moyenne mobile centrée par somme cumulée (O(n)).
+    Aux extrémités, la fenêtre est tronquée (moyenne sur les points disponibles).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return values
+    half = window // 2
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    idx = np.arange(n)
+    start = np.maximum(idx - half, 0)
+    end = np.minimum(idx + half + 1, n)
+    return (csum[end] - csum[start]) / (end - start)
+
+
+def _turning_points(values):
+    """Extrémités et points où la pente change de signe (les seuls utiles au calcul par hystérésis)."""
+    diffs = np.diff(values)
+    moving = np.flatnonzero(diffs != 0)
+    if not moving.size:
+        return values[[0, -1]]
+    signs = np.sign(diffs[moving])
+    turning = moving[1:][signs[1:] != signs[:-1]]
+    return values[np.concatenate([[0], turning, [len(values) - 1]])]
+
+
+def hysteresis_gain(values, threshold=ELEVATION_HYSTERESIS_M):
+    """
+    Dénivelés positif et négatif avec hystérésis : une variation n'est comptée
+    qu'une fois la tendance inversée d'au moins `threshold` mètres (filtre le bruit du MNT).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return 0.0, 0.0
+
+    ascent = descent = 0.0
+    points = _turning_points(values).tolist()
+    anchor, extreme, trend = points[0], points[0], 0
+    for v in points[1:]:
+        if trend == 0:
+            if abs(v - anchor) >= threshold:
+                trend, extreme = (1 if v > anchor else -1), v
+        elif trend == 1:
+            if v > extreme:
+                extreme = v
+            elif extreme - v >= threshold:
+                ascent += extreme - anchor
+                anchor, extreme, trend = extreme, v, -1
+        else:
+            if v < extreme:
+                extreme = v
+            elif v - extreme >= threshold:
+                descent += anchor - extreme
+                anchor, extreme, trend = extreme, v, 1
+
+    if trend == 1:
+        ascent += extreme - anchor
+    elif trend == -1:
+        descent += anchor - extreme
+    return ascent, descent
+
+
+def compute_elevation_profile(path, elevations, window=ELEVATION_SMOOTHING_WINDOW,
+                              threshold=ELEVATION_HYSTERESIS_M, display_points=ELEVATION_PROFILE_POINTS):
+    """
+    Calcule le profil d'un tracé [(lon, lat), ...] à partir des altitudes brutes.
+    Retourne {smoothed, ascent, descent, min, max, max_slope, profile} ; profile contient
+    distance (m), elevation et slope (%) sur display_points points régulièrement espacés.
+    """
+    smoothed = moving_average(elevations, window)
+    if not len(smoothed):
+        return {"smoothed": smoothed, "ascent": 0, "descent": 0, "min": None, "max": None,
+                "max_slope": 0.0, "profile": {"distance": [], "elevation": [], "slope": []}}
+
+    ascent, descent = hysteresis_gain(smoothed, threshold)
+    cumdist = cumulative_distances([(p[0], p[1]) for p in path])
+
+    # Profil d'affichage : interpolation sur une grille régulière en distance
+    n_points = max(2, min(display_points, len(smoothed)))
+    grid = np.linspace(0.0, cumdist[-1], n_points)
+    profile_ele = np.interp(grid, cumdist, smoothed)
+    step = np.diff(grid)
+    slopes = np.divide(np.diff(profile_ele), step, out=np.zeros_like(step), where=step > 0) * 100
+
+    return {
+        "smoothed": smoothed,
+        "ascent": round(ascent),
+        "descent": round(descent),
+        "min": round(float(smoothed.min())),
+        "max": round(float(smoothed.max())),
+        "max_slope": round(float(np.abs(slopes).max()), 1) if slopes.size else 0.0,
+        "profile": {
+            "distance": np.round(grid).astype(int).tolist(),
+            "elevation": np.round(profile_ele).astype(int).tolist(),
+            "slope": np.round(slopes, 1).tolist(),
+        },
+    }
@@ -0,0 +1,102 @@
+"""
+Compteurs d'échec des arrêts de transport en commun, stockés dans SQLite.
+Les incréments d'une requête sont accumulés en mémoire puis écrits en une transaction,
+sans réécrire le mapping arrêts-nœuds (réservé à la commande compact_stops).
+"""
+
+import logging
+import os
+from datetime import datetime, timezone
+from django.conf import settings
+
+from ..utils.sqlite_tools import connect
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_PATH = os.path.join(settings.BASE_DIR, "data", "state", "transit_failures.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS failure_counts (
+    massif TEXT NOT NULL,
+    stop_id TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (massif, stop_id)
+)
+"""
+
+
+def _connect():
+    conn = connect(COUNTERS_PATH)
+    conn.execute(_SCHEMA)
+    return conn
+
+
+class FailureCounters:
+    """Tampon des échecs / succès d'une requête pour un massif, écrit par flush()."""
+
+    def __init__(self, massif_clean):
+        self.massif = massif_clean
+        self._pending = {}  # stop_id -> (remise à zéro, incrément)
+
+    def failure(self, stop_id):
+        reset, delta = self._pending.get(stop_id, (False, 0))
+        self._pending[stop_id] = (reset, delta + 1)
+        logger.warning(f"Échec enregistré pour l'arrêt {stop_id} (+{delta + 1} dans cette requête)")
+
+    def success(self, stop_id):
+        self._pending[stop_id] = (True, 0)
+
+    def flush(self):
+        """Applique les compteurs en attente de façon atomique (incréments relatifs, pas d'écrasement)."""
+        if not self._pending:
+            return
+        now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        resets = [(self.massif, sid, delta, now) for sid, (reset, delta) in self._pending.items() if reset]
+        increments = [(self.massif, sid, delta, now) for sid, (reset, delta) in self._pending.items() if not reset]
+        conn = _connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO failure_counts (massif, stop_id, count, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(massif, stop_id) DO UPDATE SET count = excluded.count, updated_at = excluded.updated_at",
+                resets,
+            )
+            conn.executemany(
+                "INSERT INTO failure_counts (massif, stop_id, count, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(massif, stop_id) DO UPDATE SET count = count + excluded.count, updated_at = excluded.updated_at",
+                increments,
+            )
+            conn.execute("COMMIT")
+            self._pending.clear()
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+def blocked_stop_ids(massif_clean, threshold):
+    """Identifiants des arrêts dont le compteur d'échec atteint le seuil."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT stop_id FROM failure_counts WHERE massif = ? AND count >= ?", (massif_clean, threshold)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {row[0] for row in rows}
+
+
+def reset_counters(massif_clean, stop_ids):
+    """Supprime les compteurs des arrêts donnés (après compaction du mapping)."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "DELETE FROM failure_counts WHERE massif = ? AND stop_id = ?",
+            [(massif_clean, sid) for sid in stop_ids],
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
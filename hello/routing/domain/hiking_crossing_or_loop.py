@@ -8,22 +8,23 @@ from networkx import NetworkXNoPath, shortest_path
 logger = logging.getLogger(__name__)
 
 from ..utils.geotools import (
-    find_nearest_node,
-    save_original_weights, restore_original_weights,
+    find_nearest_node, penalized_weight,
     get_path_length, get_path_coordinates, penalize_path_edges,
 )
 from ..utils.poi_tools import (
     get_massif_center, filter_poi_by_path_distance, compute_midpoint,
     collect_buffer_pois, build_optimal_poi_path,
 )
+from .deadline import Deadline
+from hello.constants import HIKING_BUDGET_S, HIKING_MAX_EXPANSIONS
 
 
-def _direct_path_fallback(start_coord, end_coord, G):
+def _direct_path_fallback(start_coord, end_coord, G, weight="length"):
     """Chemin direct le plus court entre départ et arrivée."""
     start_node = find_nearest_node(G, start_coord[::-1])
     end_node = find_nearest_node(G, end_coord[::-1])
     try:
-        path = shortest_path(G, start_node, end_node, weight="length")
+        path = shortest_path(G, start_node, end_node, weight=weight)
         length = get_path_length(G, path)
         logger.info(f"Trajet direct : {length/1000:.1f} km")
         return path, length
@@ -31,16 +32,25 @@ def _direct_path_fallback(start_coord, end_coord, G):
         return [], 0
 
 
-def best_hiking_crossing(start_coord, end_coord, max_distance_m, G, poi_data, randomness=0.3):
-    """Traversée optimisant la distance et les POI le long d'un axe départ → arrivée."""
+def best_hiking_crossing(start_coord, end_coord, max_distance_m, G, poi_data, randomness=0.3, rng=None,
+                         deadline=None, budget_s=HIKING_BUDGET_S, max_expansions=HIKING_MAX_EXPANSIONS,
+                         penalties=None):
+    """
+    Traversée optimisant la distance et les POI le long d'un axe départ → arrivée.
+    Mode anytime : budget_s (durée) et max_expansions (arêtes examinées) bornent la sélection des POI,
+    comme l'échéance du calcul (deadline) ; une fois épuisés, le meilleur tracé trouvé est fermé vers l'arrivée.
+    penalties : pénalités de réutilisation à respecter ({(u, v): longueur}, ex. aller d'une boucle).
+    """
+    deadline = (deadline or Deadline()).budget(budget_s, max_expansions)
+    weight = penalized_weight(penalties) if penalties else "length"
     logger.info(f"Recherche traversée : {start_coord} → {end_coord}, max {max_distance_m/1000:.1f} km")
 
-    all_pois = collect_buffer_pois(poi_data, start_coord, end_coord, max_distance_m, randomness)
+    all_pois = collect_buffer_pois(poi_data, start_coord, end_coord, max_distance_m, randomness, rng=rng)
     if not all_pois:
-        return _direct_path_fallback(start_coord, end_coord, G)
+        return _direct_path_fallback(start_coord, end_coord, G, weight=weight)
 
     selected_pois, final_path = build_optimal_poi_path(
-        start_coord, end_coord, all_pois, max_distance_m, G
+        start_coord, end_coord, all_pois, max_distance_m, G, deadline=deadline, penalties=penalties,
     )
 
     if not selected_pois:
@@ -48,30 +58,35 @@ def best_hiking_crossing(start_coord, end_coord, max_distance_m, G, poi_data, ra
         poi_node = find_nearest_node(G, all_pois[0]["coord"][::-1])
         end_node = find_nearest_node(G, end_coord[::-1])
         try:
-            path_to_poi = shortest_path(G, start_node, poi_node, weight="length")
-            path_from_poi = shortest_path(G, poi_node, end_node, weight="length")
+            path_to_poi = shortest_path(G, start_node, poi_node, weight=weight)
+            path_from_poi = shortest_path(G, poi_node, end_node, weight=weight)
             final_path = path_to_poi + path_from_poi[1:]
             selected_pois = [all_pois[0]]
         except Exception:
-            return _direct_path_fallback(start_coord, end_coord, G)
+            return _direct_path_fallback(start_coord, end_coord, G, weight=weight)
 
     try:
         length = get_path_length(G, final_path)
-        logger.info(f"Traversée : {length/1000:.1f} km, {len(selected_pois)} POI")
+        logger.info(
+            f"Traversée : {length/1000:.1f} km, {len(selected_pois)} POI ({deadline.expansions} arêtes examinées)"
+        )
         return final_path, length
     except Exception:
-        return _direct_path_fallback(start_coord, end_coord, G)
+        return _direct_path_fallback(start_coord, end_coord, G, weight=weight)
 
 
-def best_hiking_loop(start_coord, max_distance_m, G, poi_data, randomness=0.3, massif_name="Chartreuse"):
-    """Boucle : aller vers un point intermédiaire (40%), retour par un tracé différent (60%)."""
+def best_hiking_loop(start_coord, max_distance_m, G, poi_data, randomness=0.3, massif_name="Chartreuse",
+                     rng=None, deadline=None, budget_s=HIKING_BUDGET_S, max_expansions=HIKING_MAX_EXPANSIONS):
+    """
+    Boucle : aller vers un point intermédiaire (40%), retour par un tracé différent (60%).
+    Aller et retour partagent le même budget (mode anytime, voir best_hiking_crossing).
+    """
+    deadline = (deadline or Deadline()).budget(budget_s, max_expansions)
     logger.info(f"Boucle : départ={start_coord}, max {max_distance_m/1000:.1f} km")
 
     massif_center = get_massif_center(massif_name)
     midpoint = compute_midpoint(start_coord, massif_center, max_distance_m, poi_data)
 
-    original_weights = save_original_weights(G)
-
     path_go, dist_go = best_hiking_crossing(
         start_coord=start_coord,
         end_coord=midpoint,
@@ -79,6 +94,8 @@ def best_hiking_loop(start_coord, max_distance_m, G, poi_data, randomness=0.3, m
         G=G,
         poi_data=poi_data,
         randomness=randomness,
+        rng=rng,
+        deadline=deadline, budget_s=None, max_expansions=None,
     )
 
     if not path_go:
@@ -86,7 +103,9 @@ def best_hiking_loop(start_coord, max_distance_m, G, poi_data, randomness=0.3, m
         return [], 0
 
     go_coords = get_path_coordinates(G, path_go)
-    penalize_path_edges(G, path_go, original_weights)
+    # Retour par un tracé différent : arêtes de l'aller pénalisées pour ce calcul seulement
+    penalties = {}
+    penalize_path_edges(G, path_go, penalties)
 
     filtered_pois = filter_poi_by_path_distance(poi_data, go_coords, max_distance_m=200)
     logger.info(f"POI disponibles pour le retour : {len(filtered_pois.get('features', []))}")
@@ -98,10 +117,10 @@ def best_hiking_loop(start_coord, max_distance_m, G, poi_data, randomness=0.3, m
         G=G,
         poi_data=filtered_pois,
         randomness=randomness,
+        rng=rng,
+        deadline=deadline, budget_s=None, max_expansions=None, penalties=penalties,
     )
 
-    restore_original_weights(G, original_weights)
-
     if not path_return:
         logger.warning("Aucun chemin retour pour la boucle")
         return [], 0
@@ -7,14 +7,22 @@ from networkx import NetworkXNoPath, shortest_path
 
 logger = logging.getLogger(__name__)
 
-from ..utils.geotools import find_nearest_node, save_original_weights, restore_original_weights, get_path_length, determine_rotation_direction
+from ..utils.geotools import find_nearest_node, get_path_length, determine_rotation_direction, penalize_path_edges
 from ..utils.poi_tools import get_massif_center, find_poi_candidates, select_best_poi
-from hello.constants import REUSE_PENALTY_MULTIPLIER
+from .deadline import BudgetExhausted, Deadline
+from hello.constants import HIKING_BUDGET_S, HIKING_MAX_EXPANSIONS
 
 
 def _run_tour_loop(G, start_coord, poi_data, massif_center, rotation_dir,
-                   max_distance_m, randomness, original_weights):
-    """Boucle principale du tour : sélection successive de POI dans la direction de rotation."""
+                   max_distance_m, randomness, rng=None, deadline=None):
+    """
+    Boucle principale du tour : sélection successive de POI dans la direction de rotation.
+    Les arêtes déjà parcourues sont pénalisées dans un dict propre au calcul (graphe partagé non modifié).
+    Délai dépassé ou budget épuisé : le tour s'arrête au dernier POI atteint (tracé valide à chaque étape).
+    """
+    deadline = deadline or Deadline()
+    penalties = {}
+    weight = deadline.weight(penalties=penalties)
     current_coord = start_coord
     current_node = find_nearest_node(G, start_coord[::-1])
     remaining = max_distance_m
@@ -24,6 +32,12 @@ def _run_tour_loop(G, start_coord, poi_data, massif_center, rotation_dir,
     used_edges = {}
 
     while remaining > 10000:
+        if deadline.exhausted():
+            logger.warning(
+                f"Budget épuisé ({deadline.expansions} arêtes examinées), tour arrêté au dernier POI "
+                f"(restant : {remaining/1000:.1f} km)"
+            )
+            break
         candidates = find_poi_candidates(
             current_coord, poi_data, 5000, visited_pois, path_coords,
             path_exclusion_m=2000, massif_center=massif_center, rotation_direction=rotation_dir,
@@ -39,23 +53,20 @@ def _run_tour_loop(G, start_coord, poi_data, massif_center, rotation_dir,
             logger.info(f"Aucun POI, arrêt (restant : {remaining/1000:.1f} km)")
             break
 
-        best = select_best_poi(candidates, randomness)
+        best = select_best_poi(candidates, randomness, rng=rng)
         poi_node = find_nearest_node(G, best["coord"][::-1])
 
-        segment = shortest_path(G, current_node, poi_node, weight="length")
+        try:
+            segment = shortest_path(G, current_node, poi_node, weight=weight)
+        except BudgetExhausted as e:
+            logger.warning(f"Budget épuisé en cours de recherche ({e}), tour arrêté au dernier POI")
+            break
         seg_len = get_path_length(G, segment)
         if seg_len > remaining:
             logger.info(f"POI trop loin ({seg_len/1000:.1f} km > {remaining/1000:.1f} km restants)")
             break
 
-        for i in range(len(segment) - 1):
-            u, v = segment[i], segment[i + 1]
-            key = (u, v) if (u, v) in original_weights else (v, u)
-            count = used_edges.get(key, 0)
-            used_edges[key] = count + 1
-            new_w = original_weights[key] * (1 + REUSE_PENALTY_MULTIPLIER * (count + 1))
-            if G.has_edge(u, v): G[u][v]["length"] = new_w
-            if G.has_edge(v, u): G[v][u]["length"] = new_w
+        penalize_path_edges(G, segment, penalties, used_edges=used_edges)
 
         path_nodes.extend(segment[1:])
         for node in segment[1:]:
@@ -71,26 +82,28 @@ def _run_tour_loop(G, start_coord, poi_data, massif_center, rotation_dir,
     return path_nodes
 
 
-def best_hiking_massif_tour(start_coord, max_distance_m, G, poi_data, stops_data,
-                             randomness=0.3, massif_name="Chartreuse"):
-    """Tour progressif du massif en suivant les POI dans le sens de rotation choisi."""
+def best_hiking_massif_tour(start_coord, max_distance_m, G, poi_data, stop_table,
+                             randomness=0.3, massif_name="Chartreuse", rng=None, deadline=None,
+                             budget_s=HIKING_BUDGET_S, max_expansions=HIKING_MAX_EXPANSIONS):
+    """
+    Tour progressif du massif en suivant les POI dans le sens de rotation choisi.
+    Mode anytime : budget_s (durée) et max_expansions (arêtes examinées) bornent la progression.
+    """
+    deadline = (deadline or Deadline()).budget(budget_s, max_expansions)
     logger.info(f"Tour massif : départ={start_coord}, max {max_distance_m/1000:.1f} km")
 
     massif_center = get_massif_center(massif_name)
-    rotation_dir = determine_rotation_direction()
+    rotation_dir = determine_rotation_direction(rng)
     logger.info(f"Sens : {'horaire' if rotation_dir == 'clockwise' else 'anti-horaire'}")
 
-    original_weights = save_original_weights(G)
     try:
         path_nodes = _run_tour_loop(
             G, start_coord, poi_data, massif_center,
-            rotation_dir, max_distance_m, randomness, original_weights
+            rotation_dir, max_distance_m, randomness, rng=rng, deadline=deadline,
         )
     except NetworkXNoPath:
-        restore_original_weights(G, original_weights)
         return [], 0
 
-    restore_original_weights(G, original_weights)
     total_distance = get_path_length(G, path_nodes)
     logger.info(f"Tour terminé : {total_distance/1000:.1f} km")
     return path_nodes, total_distance
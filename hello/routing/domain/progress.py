@@ -1,87 +1,335 @@
+"""
+Statut des calculs d'itinéraire en arrière-plan, partagé entre workers (SQLite, WAL).
+L'avancement (petit enregistrement, mis à jour à chaque étape) et le résultat (GeoJSON complet,
+écrit une fois) sont dans deux tables distinctes ; les mises à jour partielles sont atomiques.
+Chaque mise à jour ajoute aussi un événement au journal route_events (avancement, résultats
+intermédiaires), relu par le flux SSE `/route_events/`.
+Un calcul (request_id, partagé par les demandes identiques regroupées) est suivi par des abonnés :
+chaque client reçoit son propre identifiant (client_id), résolu vers le calcul par resolve_route_id ;
+le calcul n'est annulé que lorsque son dernier abonné s'en va (unsubscribe_route).
+Les demandes plus anciennes que ROUTE_STATUS_TTL_S sont supprimées automatiquement.
+"""
+
 import json
 import logging
 import os
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timezone
 from django.conf import settings
 
+from ..utils.sqlite_tools import connect
+
 logger = logging.getLogger(__name__)
 
-STATUS_DIR = os.path.join(settings.BASE_DIR, "data", "logs", "route_status")
+STATUS_PATH = os.path.join(settings.BASE_DIR, "data", "state", "route_status.sqlite3")
+PURGE_INTERVAL_S = 600
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS route_status (
+    request_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    finished INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at TEXT NOT NULL,
+    updated_ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS route_status_updated ON route_status (updated_ts);
+CREATE TABLE IF NOT EXISTS route_results (
+    request_id TEXT PRIMARY KEY,
+    result TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS route_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS route_events_request ON route_events (request_id, id);
+CREATE TABLE IF NOT EXISTS route_cancellations (
+    request_id TEXT PRIMARY KEY,
+    cancelled_ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS route_subscribers (
+    client_id TEXT PRIMARY KEY,
+    request_id TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS route_subscribers_request ON route_subscribers (request_id);
+"""
 
-def _ensure_status_dir():
-    os.makedirs(STATUS_DIR, exist_ok=True)
+# Une connexion par thread, réutilisée d'une mise à jour à l'autre
+_local = threading.local()
+_last_purge = 0.0
+_purge_lock = threading.Lock()
 
 
-def _status_file_path(request_id):
-    _ensure_status_dir()
-    return os.path.join(STATUS_DIR, f"{request_id}.json")
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect(STATUS_PATH)
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
 
 
-def _write_json_atomic(path, data):
-    tmp_path = f"{path}.tmp"
-    with open(tmp_path, "w", encoding="utf-8") as fh:
-        json.dump(data, fh, ensure_ascii=False, indent=2)
-    os.replace(tmp_path, path)
+def _now():
+    now = time.time()
+    return datetime.fromtimestamp(now, timezone.utc).isoformat().replace("+00:00", "Z"), now
 
 
-def initialize_route_status(request_id, message="Démarrage du calcul du tracé...", progress=0):
-    path = _status_file_path(request_id)
-    state = {
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _write(request_id, fields, result=None, reset=False, partial=None):
+    """
+    Écrit les champs fournis du statut (et le résultat éventuel) en une transaction,
+    avec l'événement "status" correspondant (et "partial" si un résultat intermédiaire est fourni).
+    reset : remplace l'enregistrement et supprime un éventuel résultat précédent et ses événements ;
+    les abonnés d'un calcul précédent restent résolus mais ne comptent plus pour l'annulation.
+    """
+    updated_at, updated_ts = _now()
+    fields = {**fields, "updated_at": updated_at, "updated_ts": updated_ts}
+    assignments = ", ".join(f"{col} = excluded.{col}" for col in fields)
+    # Statut par défaut si la demande est inconnue (mise à jour sans initialisation)
+    defaults = {"status": "Statut introuvable", **fields}
+    columns = ", ".join(defaults)
+    placeholders = ", ".join("?" * len(defaults))
+
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if reset:
+            conn.execute("DELETE FROM route_status WHERE request_id = ?", (request_id,))
+            conn.execute("DELETE FROM route_results WHERE request_id = ?", (request_id,))
+            conn.execute("DELETE FROM route_events WHERE request_id = ?", (request_id,))
+            conn.execute("UPDATE route_subscribers SET active = 0 WHERE request_id = ?", (request_id,))
+        conn.execute(
+            f"INSERT INTO route_status (request_id, {columns}) VALUES (?, {placeholders}) "
+            f"ON CONFLICT(request_id) DO UPDATE SET {assignments}",
+            (request_id, *defaults.values()),
+        )
+        if result is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO route_results (request_id, result) VALUES (?, ?)",
+                (request_id, _dumps(result)),
+            )
+        if partial is not None:
+            _append_event(conn, request_id, "partial", partial)
+        _append_event(conn, request_id, "status", _read(request_id, conn))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _maybe_purge()
+
+
+def _append_event(conn, request_id, kind, data):
+    conn.execute(
+        "INSERT INTO route_events (request_id, kind, data) VALUES (?, ?, ?)",
+        (request_id, kind, _dumps(data)),
+    )
+
+
+def _read(request_id, conn=None):
+    row = (conn or _conn()).execute(
+        "SELECT status, progress, finished, error, updated_at FROM route_status WHERE request_id = ?",
+        (request_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    status, progress, finished, error, updated_at = row
+    return {
         "request_id": request_id,
-        "status": message,
+        "status": status,
         "progress": progress,
-        "finished": False,
-        "error": None,
-        "result": None,
-        "updated_at": datetime.utcnow().isoformat() + "Z"
+        "finished": bool(finished),
+        "error": error,
+        "updated_at": updated_at,
     }
-    _write_json_atomic(path, state)
-    return state
 
 
-def update_route_status(request_id, message=None, progress=None, finished=None, error=None, result=None):
-    path = _status_file_path(request_id)
-    try:
-        with open(path, "r", encoding="utf-8") as fh:
-            state = json.load(fh)
-    except FileNotFoundError:
-        state = {
-            "request_id": request_id,
-            "status": "Statut introuvable",
-            "progress": 0,
-            "finished": False,
-            "error": None,
-            "result": None,
-            "updated_at": datetime.utcnow().isoformat() + "Z"
-        }
+def initialize_route_status(request_id, message="Démarrage du calcul du tracé...", progress=0):
+    _write(request_id, {"status": message, "progress": progress, "finished": 0, "error": None}, reset=True)
+    return {**_read(request_id), "result": None}
 
+
+def update_route_status(request_id, message=None, progress=None, finished=None, error=None, result=None,
+                        partial=None):
+    """
+    Mise à jour partielle : seuls les champs fournis changent. Retourne l'enregistrement d'avancement.
+    partial : résultat intermédiaire ({"stage": ..., ...}) publié sur le flux d'événements.
+    """
+    fields = {}
     if message is not None:
-        state["status"] = message
+        fields["status"] = message
     if progress is not None:
-        state["progress"] = progress
+        fields["progress"] = progress
     if finished is not None:
-        state["finished"] = bool(finished)
+        fields["finished"] = int(bool(finished))
     if error is not None:
-        state["error"] = error
-    if result is not None:
-        state["result"] = result
-    state["updated_at"] = datetime.utcnow().isoformat() + "Z"
-    _write_json_atomic(path, state)
+        fields["error"] = error
+    _write(request_id, fields, result=result, partial=partial)
+    return _read(request_id)
+
+
+def get_route_status(request_id, include_result=True):
+    """Statut d'une demande (avec son résultat si terminé et include_result), ou None si inconnue/expirée."""
+    state = _read(request_id)
+    if state is None:
+        return None
+    state["result"] = None
+    if include_result and state["finished"]:
+        row = _conn().execute(
+            "SELECT result FROM route_results WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        if row:
+            state["result"] = json.loads(row[0])
     return state
 
 
-def get_route_status(request_id):
-    path = _status_file_path(request_id)
+def _cancel(conn, request_id):
+    """
+    Annule la demande (dans la transaction en cours) : les calculs démarrés avant cet instant
+    s'arrêtent à leur prochaine vérification d'échéance. False si inconnue ou déjà terminée.
+    """
+    updated_at, updated_ts = _now()
+    cursor = conn.execute(
+        "UPDATE route_status SET status = ?, progress = 100, finished = 1, error = ?, "
+        "updated_at = ?, updated_ts = ? WHERE request_id = ? AND finished = 0",
+        ("Calcul annulé", "Calcul annulé", updated_at, updated_ts, request_id),
+    )
+    cancelled = cursor.rowcount == 1
+    if cancelled:
+        conn.execute(
+            "INSERT OR REPLACE INTO route_cancellations (request_id, cancelled_ts) VALUES (?, ?)",
+            (request_id, updated_ts),
+        )
+        _append_event(conn, request_id, "status", _read(request_id, conn))
+    return cancelled
+
+
+def subscribe_route(client_id, request_id, running_only=False):
+    """
+    Rattache le client au calcul request_id. running_only : seulement si le calcul est en cours
+    (False sinon, dans la même transaction qu'un éventuel départ du dernier abonné).
+    """
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        with open(path, "r", encoding="utf-8") as fh:
-            return json.load(fh)
-    except FileNotFoundError:
-        return None
-    
-def update_status(message, status_callback, progress=None):
+        subscribed = not running_only or conn.execute(
+            "SELECT 1 FROM route_status WHERE request_id = ? AND finished = 0", (request_id,)
+        ).fetchone() is not None
+        if subscribed:
+            conn.execute(
+                "INSERT OR REPLACE INTO route_subscribers (client_id, request_id, active) VALUES (?, ?, 1)",
+                (client_id, request_id),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return subscribed
+
+
+def unsubscribe_route(client_id, cancel=True):
+    """
+    Détache le client de son calcul ; si c'était le dernier abonné et cancel, le calcul est annulé.
+    Retourne (request_id, annulé) ; request_id vaut None si le client est inconnu.
+    """
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT request_id, active FROM route_subscribers WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        request_id, cancelled = (row[0] if row else None), False
+        if row:
+            conn.execute("DELETE FROM route_subscribers WHERE client_id = ?", (client_id,))
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM route_subscribers WHERE request_id = ? AND active = 1", (request_id,)
+            ).fetchone()[0]
+            # Abonné d'un calcul précédent (inactif) : le calcul en cours n'est pas le sien
+            if cancel and row[1] and remaining == 0:
+                cancelled = _cancel(conn, request_id)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return request_id, cancelled
+
+
+def resolve_route_id(client_id):
+    """Calcul suivi par le client, ou None si le client est inconnu (ou expiré)."""
+    row = _conn().execute(
+        "SELECT request_id FROM route_subscribers WHERE client_id = ?", (client_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def route_cancelled_since(request_id, since_ts):
+    """Vrai si la demande a été annulée après since_ts (horodatage time.time())."""
+    row = _conn().execute(
+        "SELECT cancelled_ts FROM route_cancellations WHERE request_id = ?", (request_id,)
+    ).fetchone()
+    return row is not None and row[0] >= since_ts
+
+
+def get_route_events(request_id, after_id=0, limit=100):
+    """Événements (id, kind, data) de la demande postérieurs à after_id, dans l'ordre."""
+    rows = _conn().execute(
+        "SELECT id, kind, data FROM route_events WHERE request_id = ? AND id > ? ORDER BY id LIMIT ?",
+        (request_id, after_id, limit),
+    ).fetchall()
+    return [(event_id, kind, json.loads(data)) for event_id, kind, data in rows]
+
+
+def purge_route_status(max_age_s=None):
+    """Supprime les statuts (et résultats) non mis à jour depuis max_age_s secondes."""
+    max_age_s = settings.ROUTE_STATUS_TTL_S if max_age_s is None else max_age_s
+    cutoff = time.time() - max_age_s
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM route_cancellations WHERE cancelled_ts < ?", (cutoff,))
+        for table in ("route_results", "route_events", "route_subscribers"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE request_id IN "
+                "(SELECT request_id FROM route_status WHERE updated_ts < ?)",
+                (cutoff,),
+            )
+        removed = conn.execute("DELETE FROM route_status WHERE updated_ts < ?", (cutoff,)).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if removed:
+        logger.info(f"{removed} statuts de calcul expirés supprimés")
+    return removed
+
+
+def _maybe_purge():
+    """Expiration au plus une fois toutes les PURGE_INTERVAL_S secondes par processus."""
+    global _last_purge
+    with _purge_lock:
+        if time.time() - _last_purge < PURGE_INTERVAL_S:
+            return
+        _last_purge = time.time()
+    try:
+        purge_route_status()
+    except Exception as e:
+        logger.warning(f"Erreur expiration des statuts : {e}")
+
+
+def update_status(message, status_callback, progress=None, partial=None):
+    """Signale l'avancement ; partial : résultat intermédiaire transmis au callback s'il est fourni."""
     if status_callback:
         try:
-            status_callback(message, progress)
+            if partial is None:
+                status_callback(message, progress)
+            else:
+                status_callback(message, progress, partial=partial)
         except Exception as e:
-            logger.warning("status_callback error: %s", e)
\ No newline at end of file
+            logger.warning("status_callback error: %s", e)
@@ -10,6 +10,7 @@ from .transit_back import choose_return_stop, compute_return_transit
 from .route_init import initialize_route_parameters
 from .hiking_crossing_or_loop import best_hiking_crossing, best_hiking_loop
 from .progress import update_status
+from .deadline import Deadline
 
 
 def _is_loop(candidate, departure_stop_id, departure_stop_info):
@@ -20,34 +21,43 @@ def _is_loop(candidate, departure_stop_id, departure_stop_info):
     return dist < 5000
 
 
-def _compute_hike(candidate, is_loop, departure_stop_info, massif_clean, max_distance_m, G, poi_data, randomness):
+def _compute_hike(candidate, is_loop, departure_stop_info, massif_clean, max_distance_m, G, poi_data, randomness,
+                  rng=None, deadline=None):
     """Calcule le chemin de randonnée en mode crossing ou en mode boucle"""
     if is_loop:
         return best_hiking_loop(
             start_coord=departure_stop_info["node"],
             max_distance_m=max_distance_m,
             G=G, poi_data=poi_data,
-            randomness=randomness, massif_name=massif_clean,
+            randomness=randomness, massif_name=massif_clean, rng=rng, deadline=deadline,
         )
     return best_hiking_crossing(
         start_coord=departure_stop_info["node"],
         end_coord=candidate["stop_info"]["node"],
         max_distance_m=max_distance_m,
-        G=G, poi_data=poi_data, randomness=randomness,
+        G=G, poi_data=poi_data, randomness=randomness, rng=rng, deadline=deadline,
     )
 
 
 def _try_candidates(candidates, departure_stop_id, departure_stop_info, massif, massif_clean,
                     max_distance_m, G, poi_data, randomness, travel_go,
-                    departure_time, return_time, level, stops_data, address, status_callback):
-    """Teste les candidats d'arrêt de retour en calculant le trajet de retour TC puis le chemin de randonnée associé."""
+                    departure_time, return_time, level, failure_counters, address, status_callback, rng=None,
+                    deadline=None, transit_cache_only=False):
+    """
+    Teste les candidats d'arrêt de retour en calculant le trajet de retour TC puis le chemin de randonnée associé.
+    Délai dépassé : arrêt des essais (le repli sans retour TC prend le relais).
+    """
+    deadline = deadline or Deadline()
     for candidate in candidates:
+        if deadline.exhausted():
+            logger.warning("Délai de calcul dépassé : arrêt des essais d'arrêts retour")
+            break
         update_status("Test d'arrêts pour le trajet retour", status_callback, 40)
         try:
             _, travel_return, duration = compute_return_transit(
                 [candidate], return_time, address,
-                stops_data=stops_data, departure_time=departure_time,
-                status_callback=status_callback,
+                failure_counters=failure_counters, departure_time=departure_time,
+                status_callback=status_callback, deadline=deadline, cache_only=transit_cache_only,
             )
         except Exception as e:
             logger.warning(f"Pas de retour TC pour {candidate.get('stop_id')}: {e}")
@@ -63,7 +73,8 @@ def _try_candidates(candidates, departure_stop_id, departure_stop_info, massif,
         try:
             path, dist = _compute_hike(
                 candidate, _is_loop(candidate, departure_stop_id, departure_stop_info),
-                departure_stop_info, massif_clean, adjusted_max, G, poi_data, randomness,
+                departure_stop_info, massif_clean, adjusted_max, G, poi_data, randomness, rng=rng,
+                deadline=deadline,
             )
         except Exception as e:
             logger.warning(f"Échec chemin pour {candidate.get('stop_id')}: {e}")
@@ -74,7 +85,7 @@ def _try_candidates(candidates, departure_stop_id, departure_stop_info, massif,
     return None, None, None, None
 
 
-def _fallback(candidates, departure_stop_info, max_distance_m, G, poi_data, randomness):
+def _fallback(candidates, departure_stop_info, max_distance_m, G, poi_data, randomness, rng=None, deadline=None):
     if not candidates:
         return [], 0
     try:
@@ -82,7 +93,7 @@ def _fallback(candidates, departure_stop_info, max_distance_m, G, poi_data, rand
             start_coord=departure_stop_info["node"],
             end_coord=candidates[0]["stop_info"]["node"],
             max_distance_m=max_distance_m,
-            G=G, poi_data=poi_data, randomness=randomness,
+            G=G, poi_data=poi_data, randomness=randomness, rng=rng, deadline=deadline,
         )
         logger.warning(f"Trajet de repli calculé vers {candidates[0].get('stop_id')}")
         return path, dist
@@ -92,18 +103,20 @@ def _fallback(candidates, departure_stop_info, max_distance_m, G, poi_data, rand
 
 
 def compute_crossing_route(departure_stop_info, departure_stop_id, massif, massif_clean,
-                            max_distance_m, G, poi_data, stops_data, randomness,
+                            max_distance_m, G, poi_data, stop_table, randomness,
                             travel_go, departure_time, return_time, level,
-                            transit_priority, address, status_callback):
+                            transit_priority, address, status_callback, duration_scores=None,
+                            failure_counters=None, rng=None, deadline=None, transit_cache_only=False):
     update_status("Recherche des arrêts retour", status_callback, 35)
     return_error_message = None
 
     try:
         return_candidates = choose_return_stop(
             departure_stop_info=departure_stop_info,
-            stops_data=stops_data,
+            stop_table=stop_table,
             distance_max_m=max_distance_m,
             transit_priority=transit_priority,
+            duration_scores=duration_scores, return_time=return_time,
         )
         logger.info(f"{len(return_candidates)} candidats retour trouvés")
     except Exception as e:
@@ -114,13 +127,15 @@ def compute_crossing_route(departure_stop_info, departure_stop_id, massif, massi
     candidate, travel_return, path, dist = _try_candidates(
         return_candidates, departure_stop_id, departure_stop_info,
         massif, massif_clean, max_distance_m, G, poi_data, randomness,
-        travel_go, departure_time, return_time, level, stops_data, address, status_callback,
+        travel_go, departure_time, return_time, level, failure_counters, address, status_callback, rng=rng,
+        deadline=deadline, transit_cache_only=transit_cache_only,
     )
 
     if candidate is None:
         return_error_message = return_error_message or "Aucun itinéraire retour TC valide trouvé"
         logger.warning(f"{return_error_message}")
-        path, dist = _fallback(return_candidates, departure_stop_info, max_distance_m, G, poi_data, randomness)
+        path, dist = _fallback(return_candidates, departure_stop_info, max_distance_m, G, poi_data, randomness,
+                               rng=rng, deadline=deadline)
         travel_return = None
 
     return {
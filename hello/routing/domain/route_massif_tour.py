@@ -7,26 +7,30 @@ from networkx import NetworkXNoPath, shortest_path
 
 logger = logging.getLogger(__name__)
 from ..utils.geotools import find_nearest_node
-from .transit_back import choose_return_stop, compute_return_transit
+from .transit_back import rank_return_stops, compute_return_transit
 from .hiking_massif_tour import best_hiking_massif_tour
 from .progress import update_status
 
 
-def _find_return_candidates(arrival_stop_info, stops_data, transit_priority):
-    """Cherche des arrêts retour en élargissant le rayon si nécessaire (20 → 50 km)."""
-    for radius in (20000, 50000):
-        try:
-            candidates = choose_return_stop(
-                departure_stop_info=arrival_stop_info,
-                stops_data=stops_data,
-                distance_max_m=radius,
-                transit_priority=transit_priority,
-            )
-            if candidates:
-                logger.info(f"{len(candidates)} candidats retour trouvés dans {radius/1000:.0f} km")
-                return candidates
-        except Exception as e:
-            logger.warning(f"Erreur recherche retour {radius/1000:.0f}km : {e}")
+def _find_return_candidates(arrival_stop_info, stop_table, transit_priority, duration_scores=None,
+                            return_time=None):
+    """Cherche des arrêts retour en élargissant le rayon si nécessaire (20 → 50 km), en une seule requête spatiale."""
+    radii = (20000, 50000)
+    try:
+        rankings = rank_return_stops(
+            departure_stop_info=arrival_stop_info,
+            stop_table=stop_table,
+            distances_max_m=radii,
+            transit_priority=transit_priority,
+            duration_scores=duration_scores, return_time=return_time,
+        )
+    except Exception as e:
+        logger.warning(f"Erreur recherche retour : {e}")
+        return []
+    for radius, candidates in zip(radii, rankings):
+        if candidates:
+            logger.info(f"{len(candidates)} candidats retour trouvés dans {radius/1000:.0f} km")
+            return candidates
     return []
 
 
@@ -51,25 +55,32 @@ def _extend_to_stop(G, hike_path, hike_distance, final_coord, selected_candidate
 
 
 def compute_massif_tour_route(departure_stop_info, max_distance_m, massif_clean, G, poi_data,
-                               stops_data, randomness, departure_time, return_time,
-                               address, transit_priority, status_callback):
+                               stop_table, randomness, departure_time, return_time,
+                               address, transit_priority, status_callback, duration_scores=None,
+                               failure_counters=None, prefetch_draft=None, rng=None, deadline=None,
+                               transit_cache_only=False):
     update_status("Mode tour du massif choisi", status_callback, 45)
 
     hike_path, hike_distance = best_hiking_massif_tour(
         start_coord=departure_stop_info["node"],
         max_distance_m=max_distance_m,
-        G=G, poi_data=poi_data, stops_data=stops_data,
-        randomness=randomness, massif_name=massif_clean,
+        G=G, poi_data=poi_data, stop_table=stop_table,
+        randomness=randomness, massif_name=massif_clean, rng=rng, deadline=deadline,
     )
     if not hike_path:
         raise RuntimeError("Aucun chemin de randonnée trouvé pour massif_tour")
 
     logger.info(f"Distance randonnée tour : {hike_distance/1000:.1f} km")
+    if prefetch_draft:
+        # Le tour est fixé : altitudes et POI proches se calculent pendant la recherche du retour TC
+        prefetch_draft(hike_path)
     final_coord = hike_path[-1]
     arrival_stop_info = {"node": final_coord, "properties": {}}
 
     update_status("Recherche des arrêts retour depuis l'arrivée", status_callback, 60)
-    return_candidates = _find_return_candidates(arrival_stop_info, stops_data, transit_priority)
+    return_candidates = _find_return_candidates(
+        arrival_stop_info, stop_table, transit_priority, duration_scores, return_time=return_time,
+    )
 
     selected_candidate = travel_return = return_error_message = None
 
@@ -77,8 +88,8 @@ def compute_massif_tour_route(departure_stop_info, max_distance_m, massif_clean,
         try:
             selected_candidate, travel_return, _ = compute_return_transit(
                 return_candidates, return_time, address,
-                stops_data=stops_data, departure_time=departure_time,
-                status_callback=status_callback,
+                failure_counters=failure_counters, departure_time=departure_time,
+                status_callback=status_callback, deadline=deadline, cache_only=transit_cache_only,
             )
         except Exception:
             return_error_message = "Aucun arrêt retour valide trouvé après élargissement à 50km"
@@ -3,16 +3,19 @@ Mode POI : itinéraire contraint par des points d'intérêt choisis par l'utilis
 """
 import logging
 
+import numpy as np
 from networkx import shortest_path
 
 logger = logging.getLogger(__name__)
 
-from ..utils.geotools import find_nearest_node, haversine, get_path_coordinates, get_path_length
+from ..utils.geotools import find_nearest_node, get_path_coordinates, get_path_length
 from .transit_go import get_best_transit_route
 from .transit_back import choose_return_stop, compute_return_transit
 from .route_init import initialize_route_parameters
 from ..utils.poi_tools import resolve_pois, sort_pois_polar
+from ..utils.compact_route import slim_transit
 from .progress import update_status
+from .deadline import Deadline
 from hello.constants import REUSE_PENALTY_MULTIPLIER
 
 
@@ -39,25 +42,29 @@ def _chain_pois(G, pois):
 
 
 
-def _find_transit_go(pois, stops_data, search_radius, randomness, departure_time,
-                     return_time, address, transit_priority, hubs_entree_data, status_callback):
+def _find_transit_go(pois, stop_table, search_radius, randomness, departure_time,
+                     return_time, address, transit_priority, hubs_entree_data, status_callback,
+                     duration_scores=None, failure_counters=None, rng=None, deadline=None):
     """Trouve le transport aller vers le premier POI."""
     update_status("Calcul du transport aller", status_callback, 45)
     first_poi = pois[0]
     first_poi_latlon = (first_poi["coord"][1], first_poi["coord"][0])
 
-    nearby_stops = {
-        sid: info for sid, info in stops_data.items()
-        if haversine(first_poi_latlon, (info["node"][1], info["node"][0])) <= search_radius
-    }
-    if not nearby_stops:
+    nearby_idx, _ = stop_table.ring(first_poi_latlon, 0.0, search_radius)
+    if not len(nearby_idx):
         raise RuntimeError(f"Aucun arrêt de transport trouvé autour du POI {first_poi['id']}")
 
+    nearby_stops = np.zeros(len(stop_table), dtype=bool)
+    nearby_stops[nearby_idx] = True
+
     travel_go, departure_stop_id, departure_stop_info = get_best_transit_route(
         randomness=randomness, departure_time=departure_time, return_time=return_time,
-        stops_data=nearby_stops, address=address, transit_priority=transit_priority,
-        hubs_entree_data=hubs_entree_data,
+        stop_table=stop_table, stop_mask=nearby_stops, address=address, transit_priority=transit_priority,
+        hubs_entree_data=hubs_entree_data, duration_scores=duration_scores,
+        failure_counters=failure_counters, rng=rng, deadline=deadline,
     )
+    update_status("Transport aller trouvé", status_callback,
+                  partial={"stage": "transit_go", "transit_go": slim_transit(travel_go)})
     return travel_go, departure_stop_id, departure_stop_info
 
 
@@ -77,8 +84,9 @@ def _extract_transit_arrival(travel_go, departure_stop_info):
     return departure_stop_info["node"][1], departure_stop_info["node"][0]
 
 
-def _find_transit_return(pois, stops_data, search_radius, return_time, address,
-                         departure_time, transit_priority, status_callback):
+def _find_transit_return(pois, stop_table, search_radius, return_time, address,
+                         departure_time, transit_priority, status_callback, duration_scores=None,
+                         failure_counters=None, deadline=None, transit_cache_only=False):
     """Trouve le transport retour depuis le dernier POI."""
     update_status("Calcul du transport retour", status_callback, 55)
     last_poi = pois[-1]
@@ -86,16 +94,19 @@ def _find_transit_return(pois, stops_data, search_radius, return_time, address,
 
     return_candidates = choose_return_stop(
         departure_stop_info=last_poi_stop_info,
-        stops_data=stops_data,
+        stop_table=stop_table,
         distance_max_m=max(search_radius, 10000),
         transit_priority=transit_priority,
+        duration_scores=duration_scores, return_time=return_time,
     )
+    deadline = deadline or Deadline()
     for candidate in return_candidates:
+        deadline.check()
         try:
             best_candidate, travel_return, _ = compute_return_transit(
                 [candidate], return_time, address,
-                stops_data=stops_data, departure_time=departure_time,
-                status_callback=status_callback,
+                failure_counters=failure_counters, departure_time=departure_time,
+                status_callback=status_callback, deadline=deadline, cache_only=transit_cache_only,
             )
             return best_candidate, travel_return
         except Exception:
@@ -142,16 +153,21 @@ def _build_final_path(G, transit_arrival_lat, transit_arrival_lon, pois,
 
 
 def compute_poi_route(randomness, massif, departure_time, return_time, level, address,
-                      transit_priority, pois, stops_data, G, poi_data,
-                      hubs_entree_data, status_callback=None):
+                      transit_priority, pois, stop_table, G, poi_data,
+                      hubs_entree_data, status_callback=None, duration_scores=None,
+                      failure_counters=None, prefetch_draft=None, rng=None, deadline=None,
+                      transit_cache_only=False):
     selected_pois = resolve_pois(poi_data, pois, G)
-    selected_pois = sort_pois_polar(selected_pois, massif)
+    selected_pois = sort_pois_polar(selected_pois, massif, rng=rng)
     update_status("POI ordonnés géographiquement", status_callback, 15)
 
     path_nodes, traversed_edges, penalized_weight = _chain_pois(G, selected_pois)
     poi_coords = get_path_coordinates(G, path_nodes)
     poi_distance = get_path_length(G, path_nodes)
     update_status("Chemin construit entre les points sélectionnés", status_callback, 25)
+    if prefetch_draft:
+        # Le chemin entre POI est l'essentiel du tracé final : altitudes et POI proches en fond pendant les appels TC
+        prefetch_draft(poi_coords)
 
     max_distance_m, route_type = initialize_route_parameters(
         massif_name=massif, departure_time=departure_time, return_time=return_time,
@@ -161,14 +177,17 @@ def compute_poi_route(randomness, massif, departure_time, return_time, level, ad
     logger.info(f"Distance max : {max_distance_m/1000:.1f} km | distance POI : {poi_distance/1000:.1f} km")
 
     travel_go, _, departure_stop_info = _find_transit_go(
-        selected_pois, stops_data, search_radius, randomness,
+        selected_pois, stop_table, search_radius, randomness,
         departure_time, return_time, address, transit_priority, hubs_entree_data, status_callback,
+        duration_scores=duration_scores, failure_counters=failure_counters, rng=rng, deadline=deadline,
     )
     transit_arrival_lat, transit_arrival_lon = _extract_transit_arrival(travel_go, departure_stop_info)
 
     return_candidate, travel_return = _find_transit_return(
-        selected_pois, stops_data, search_radius, return_time,
+        selected_pois, stop_table, search_radius, return_time,
         address, departure_time, transit_priority, status_callback,
+        duration_scores=duration_scores, failure_counters=failure_counters, deadline=deadline,
+        transit_cache_only=transit_cache_only,
     )
 
     update_status("Construction du chemin final", status_callback, 60)
@@ -0,0 +1,85 @@
+"""
+Créneaux de desserte des arrêts (jour de semaine, heure).
+Permet d'écarter les arrêts sans service avant tout appel à l'API Google,
+et logue les trajets réussis pour enrichir l'index (Arrets_6_fenetres_service).
+"""
+
+import csv
+import logging
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_LOG_PATH = os.path.join(settings.BASE_DIR, "data", "logs", "transit_service_log.csv")
+
+
+def _local(dt):
+    """Ramène une date à l'heure de Paris (les dates naïves sont supposées déjà locales)."""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(ZoneInfo("Europe/Paris"))
+
+
+def window_hour_masks(start, end):
+    """Masques horaires (7 entiers de 24 bits, lundi → dimanche) couvrant [start, end] heure par heure."""
+    masks = np.zeros(7, dtype=np.int64)
+    current = _local(start).replace(minute=0, second=0, microsecond=0)
+    end = min(_local(end), current + timedelta(days=7))
+    while current <= end:
+        masks[current.weekday()] |= 1 << current.hour
+        current += timedelta(hours=1)
+    return masks
+
+
+def served_mask(stop_table, start, end):
+    """
+    Booléen par arrêt de la StopTable : au moins un passage entre start et end.
+    Un arrêt absent de l'index de desserte est considéré comme desservi.
+    """
+    window = window_hour_masks(start, end)
+    return ~stop_table.service_known | ((stop_table.service & window) != 0).any(axis=1)
+
+
+def _transit_time_at_stop(response, direction):
+    """Heure de passage à l'arrêt : arrivée du dernier step TRANSIT (aller) ou départ du premier (retour)."""
+    steps = response.get("routes", [{}])[0].get("legs", [{}])[0].get("steps", [])
+    transit_steps = [s for s in steps if s.get("travelMode") == "TRANSIT"]
+    if not transit_steps:
+        return None
+    if direction == "go":
+        time_str = transit_steps[-1]["transitDetails"]["stopDetails"]["arrivalTime"]
+    else:
+        time_str = transit_steps[0]["transitDetails"]["stopDetails"]["departureTime"]
+    return datetime.fromisoformat(time_str.replace("Z", "+00:00")).astimezone(ZoneInfo("Europe/Paris"))
+
+
+def log_transit_service(stop_coord, direction, response):
+    """
+    Ajoute le créneau d'un trajet réussi au journal des dessertes (lon, lat, direction, weekday, hour).
+    stop_coord : position de l'arrêt lui-même (stop_info["coord"]), pas celle de son nœud de graphe,
+    pour être rapprochée des arrêts par Arrets_6_fenetres_service.
+    """
+    try:
+        when = _transit_time_at_stop(response, direction)
+        if when is None:
+            return
+        os.makedirs(os.path.dirname(SERVICE_LOG_PATH), exist_ok=True)
+        file_exists = os.path.isfile(SERVICE_LOG_PATH)
+        with open(SERVICE_LOG_PATH, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["date", "lon", "lat", "direction", "weekday", "hour"])
+            if not file_exists:
+                writer.writeheader()
+            writer.writerow({
+                "date": when.date().isoformat(),
+                "lon": stop_coord[0],
+                "lat": stop_coord[1],
+                "direction": direction,
+                "weekday": when.weekday(),
+                "hour": when.hour,
+            })
+    except Exception as e:
+        logger.warning(f"Erreur journalisation desserte : {e}")
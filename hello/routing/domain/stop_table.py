@@ -0,0 +1,199 @@
+"""
+Table colonnaire et immuable des arrêts de transport en commun d'un massif.
+Construite une fois à partir du mapping arrêts-nœuds, elle est partagée entre les requêtes :
+les scores d'une requête vivent dans des tableaux temporaires, jamais dans la table.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from hello.data_preparation.utils import time_bucket_index
+from ..utils.geotools import haversine_m
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # index facultatif : repli sur une passe de distances complète
+    cKDTree = None
+
+EARTH_RADIUS_M = 6371000
+# Marge relative du pré-filtre projeté avant le calcul haversine exact
+RING_QUERY_MARGIN = 1.01
+
+
+def _frozen(array):
+    array = np.asarray(array)
+    array.setflags(write=False)
+    return array
+
+
+@dataclass(frozen=True, eq=False)
+class StopTable:
+    ids: np.ndarray            # (S,) identifiants des arrêts (clés du mapping)
+    lon: np.ndarray            # (S,) longitude du nœud de graphe associé
+    lat: np.ndarray            # (S,) latitude du nœud de graphe associé
+    elevation: np.ndarray      # (S,) elevation_normalized
+    nature: np.ndarray         # (S,) distance_to_pnr_border_normalized
+    duration: np.ndarray       # (S,) durée hub d'entrée → arrêt (min)
+    hub_entree: np.ndarray     # (S,) identifiant du hub d'entrée
+    service: np.ndarray        # (S, 7) masques horaires de desserte (bit h = passage à h heures)
+    service_known: np.ndarray  # (S,) l'arrêt figure dans l'index de desserte
+    duration_norm: np.ndarray = None  # (créneaux, hubs, S) durées normalisées précalculées, ou None
+    matrix_hubs: tuple = ()    # hubs de départ de duration_norm
+    properties: tuple = ()     # propriétés d'origine, pour reconstruire stop_info
+    coord: np.ndarray = None   # (S, 2) position propre de l'arrêt (lon, lat), distincte du nœud
+    _index: dict = field(default=None, init=False, repr=False)
+    _tree: object = field(default=None, init=False, repr=False)
+    _lat0: float = field(default=0.0, init=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_index", {stop_id: i for i, stop_id in enumerate(self.ids.tolist())})
+        # Index spatial en projection équirectangulaire centrée sur le massif (mètres)
+        if cKDTree is not None and len(self.ids):
+            lat0 = float(np.radians(self.lat.mean()))
+            object.__setattr__(self, "_lat0", lat0)
+            object.__setattr__(self, "_tree", cKDTree(self._project(self.lat, self.lon)))
+
+    def _project(self, lat, lon):
+        lat, lon = np.radians(lat), np.radians(lon)
+        return np.column_stack([
+            EARTH_RADIUS_M * np.atleast_1d(lon) * np.cos(self._lat0),
+            EARTH_RADIUS_M * np.atleast_1d(lat),
+        ])
+
+    @classmethod
+    def from_mapping(cls, stops_data, service_windows=None, duration_matrix=None):
+        """Construit la table depuis le mapping arrêts-nœuds, l'index de desserte et la matrice de durées."""
+        ids = list(stops_data)
+        infos = [stops_data[stop_id] for stop_id in ids]
+        props = [info.get("properties", {}) for info in infos]
+
+        def column(key, default):
+            return np.array([default if p.get(key) is None else float(p[key]) for p in props], dtype=np.float64)
+
+        service = np.zeros((len(ids), 7), dtype=np.int64)
+        service_known = np.zeros(len(ids), dtype=bool)
+        for i, stop_id in enumerate(ids):
+            masks = (service_windows or {}).get(stop_id)
+            if masks is not None:
+                service[i] = masks
+                service_known[i] = True
+
+        duration_norm, matrix_hubs = None, ()
+        if duration_matrix is not None:
+            # Réaligne la matrice sur l'ordre de la table ; arrêt absent de la matrice = le plus lent
+            position = {stop_id: j for j, stop_id in enumerate(duration_matrix["stop_ids"].tolist())}
+            cols = np.array([position.get(stop_id, -1) for stop_id in ids], dtype=np.int64)
+            normalized = duration_matrix["normalized"]
+            duration_norm = np.where(cols >= 0, normalized[:, :, np.maximum(cols, 0)], 1.0).astype(np.float32)
+            matrix_hubs = tuple(duration_matrix["hubs"].tolist())
+
+        return cls(
+            ids=_frozen(np.array(ids, dtype=str)),
+            lon=_frozen(np.array([info["node"][0] for info in infos], dtype=np.float64)),
+            lat=_frozen(np.array([info["node"][1] for info in infos], dtype=np.float64)),
+            elevation=_frozen(column("elevation_normalized", 0.0)),
+            nature=_frozen(column("distance_to_pnr_border_normalized", 0.0)),
+            duration=_frozen(column("duration", 10000.0)),
+            hub_entree=_frozen(np.array(
+                [str(p.get("hub_entree") or p.get("hubs_entree") or "") for p in props], dtype=str
+            )),
+            service=_frozen(service),
+            service_known=_frozen(service_known),
+            duration_norm=None if duration_norm is None else _frozen(duration_norm),
+            matrix_hubs=matrix_hubs,
+            properties=tuple(props),
+            # Mappings antérieurs sans position propre : repli sur le nœud
+            coord=_frozen(np.array(
+                [info.get("coord") or info["node"] for info in infos], dtype=np.float64
+            ).reshape(-1, 2)),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subset(self, mask):
+        """Nouvelle table restreinte aux arrêts du masque booléen."""
+        mask = np.asarray(mask, dtype=bool)
+        return StopTable(
+            ids=_frozen(self.ids[mask]),
+            lon=_frozen(self.lon[mask]),
+            lat=_frozen(self.lat[mask]),
+            elevation=_frozen(self.elevation[mask]),
+            nature=_frozen(self.nature[mask]),
+            duration=_frozen(self.duration[mask]),
+            hub_entree=_frozen(self.hub_entree[mask]),
+            service=_frozen(self.service[mask]),
+            service_known=_frozen(self.service_known[mask]),
+            duration_norm=None if self.duration_norm is None else _frozen(self.duration_norm[:, :, mask]),
+            matrix_hubs=self.matrix_hubs,
+            properties=tuple(p for p, keep in zip(self.properties, mask) if keep),
+            coord=None if self.coord is None else _frozen(self.coord[mask]),
+        )
+
+    def index_of(self, stop_id):
+        return self._index[stop_id]
+
+    def stop_info(self, i):
+        """
+        Vue dict {"node": (lon, lat), "coord": (lon, lat), "properties": {...}} d'un arrêt :
+        node (nœud du graphe) pour les calculs d'itinéraire, coord (arrêt lui-même) pour le journal des dessertes.
+        """
+        node = (float(self.lon[i]), float(self.lat[i]))
+        coord = node if self.coord is None else (float(self.coord[i][0]), float(self.coord[i][1]))
+        return {"node": node, "coord": coord, "properties": self.properties[i]}
+
+    def duration_row(self, hub_name, departure_time):
+        """Ligne de la matrice précalculée (durées normalisées) pour ce hub et ce créneau, ou None."""
+        if self.duration_norm is None or hub_name not in self.matrix_hubs:
+            return None
+        bucket = time_bucket_index(departure_time.hour)
+        return self.duration_norm[bucket, self.matrix_hubs.index(hub_name)]
+
+    def distances_from(self, coord):
+        """Distances haversine (m) de coord (lat, lon) à tous les arrêts, en une passe vectorisée."""
+        return haversine_m(coord[0], coord[1], self.lat, self.lon)
+
+    def ring(self, coord, r_min, r_max):
+        """
+        Arrêts dont la distance à coord (lat, lon) est dans [r_min, r_max] (m).
+        Retourne (index, distances). Pré-filtre par l'index spatial si disponible,
+        puis distance haversine exacte sur les seuls candidats.
+        """
+        if self._tree is None:
+            dists = self.distances_from(coord)
+            idx = np.flatnonzero((dists >= r_min) & (dists <= r_max))
+            return idx, dists[idx]
+
+        idx = np.asarray(
+            self._tree.query_ball_point(self._project(coord[0], coord[1])[0], r_max * RING_QUERY_MARGIN),
+            dtype=np.int64,
+        )
+        idx.sort()
+        dists = haversine_m(coord[0], coord[1], self.lat[idx], self.lon[idx])
+        keep = (dists >= r_min) & (dists <= r_max)
+        return idx[keep], dists[keep]
+
+    def base_scores(self, duration_scores, weights, idx=None):
+        """Score TC (durée, altitude, nature) des arrêts (tous, ou ceux de idx), dans un tableau temporaire."""
+        if idx is None:
+            idx = slice(None)
+        return (
+            weights["duration"] * (1 - duration_scores[idx])
+            + weights["elevation"] * self.elevation[idx]
+            + weights["nature"] * self.nature[idx]
+        )
+
+
+def iter_top_k(scores, k=20):
+    """
+    Parcourt les index par score décroissant, par lots de k (argpartition) :
+    on ne trie que les arrêts réellement testés. Les scores -inf sont ignorés.
+    """
+    remaining = np.flatnonzero(np.isfinite(scores))
+    while remaining.size:
+        kk = min(k, remaining.size)
+        part = np.argpartition(-scores[remaining], kk - 1)[:kk]
+        top = remaining[part[np.argsort(-scores[remaining[part]], kind="stable")]]
+        yield from top.tolist()
+        remaining = np.setdiff1d(remaining, top, assume_unique=True)
@@ -5,22 +5,82 @@ Calcul de l'itinéraire de transport en commun retour.
 import json
 import logging
 import os
+import numpy as np
+import requests
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
-from ..utils.geotools import haversine, geocode_address
-from ..utils.maps_tools import call_maps_routes_api
+from ..utils.geotools import geocode_address
+from ..utils.maps_tools import call_maps_routes_api, TransitNotCached
 from .transit_go import coords_from_station_label
 from .progress import update_status
-from hello.constants import TRANSIT_WEIGHTS, TRANSIT_FAILURE_THRESHOLD, RETURN_STOP_MAX_DISTANCE_RATIO
+from .service_windows import served_mask, log_transit_service
+from .transit_failures import get_cached_failure, cache_failure
+from .deadline import Deadline
+from hello.constants import (
+    TRANSIT_WEIGHTS, RETURN_STOP_MAX_DISTANCE_RATIO, SERVICE_WINDOW_RETURN_HOURS,
+)
 
 
-def choose_return_stop(departure_stop_info, stops_data, distance_max_m, transit_priority="balanced"):
+def rank_return_stops(departure_stop_info, stop_table, distances_max_m, transit_priority="balanced",
+                      duration_scores=None, return_time=None):
+    """
+    Classe les arrêts retour pour une ou plusieurs distances max (ex. élargissement 20 → 50 km).
+    Une seule requête spatiale en anneau sur la plus grande distance, un seul calcul de scores :
+    chaque distance max est ensuite répartie en tranches sur ces mêmes tableaux.
+    Retourne une liste de classements (un par distance max, éventuellement vide), voir choose_return_stop.
+    """
+    weights = TRANSIT_WEIGHTS.get(transit_priority, TRANSIT_WEIGHTS["balanced"])
+    if duration_scores is None:
+        duration_scores = np.zeros(len(stop_table))
+    departure_coord = tuple(departure_stop_info["node"])
+    max_return_dists = [d * RETURN_STOP_MAX_DISTANCE_RATIO for d in distances_max_m]
+
+    idx, dists = stop_table.ring((departure_coord[1], departure_coord[0]), 0.0, max(max_return_dists))
+    if return_time is not None:
+        window_start = return_time - timedelta(hours=SERVICE_WINDOW_RETURN_HOURS)
+        served = served_mask(stop_table, window_start, return_time)[idx]
+        logger.info(f"{int((~served).sum())} arrêts retour sans desserte écartés")
+        idx, dists = idx[served], dists[served]
+    tc_scores = stop_table.base_scores(duration_scores, weights, idx)
+
+    rankings = []
+    for max_return_dist in max_return_dists:
+        tranches = [
+            (1, 0.50 * max_return_dist, 0.75 * max_return_dist),
+            (2, 0.25 * max_return_dist, 0.50 * max_return_dist),
+            (3, 0.0,                    0.25 * max_return_dist),
+            (4, 0.75 * max_return_dist, max_return_dist),
+        ]
+        ordered = []
+        for priority, dist_min, dist_max in tranches:
+            in_tranche = np.flatnonzero((dists >= dist_min) & (dists <= dist_max))
+            ordered.extend(in_tranche[np.argsort(-tc_scores[in_tranche], kind="stable")].tolist())
+
+        rankings.append([
+            {
+                "score": float(tc_scores[j]),
+                "stop_id": str(stop_table.ids[idx[j]]),
+                "stop_info": stop_table.stop_info(idx[j]),
+                "dist": float(dists[j]),
+                "tc_score": float(tc_scores[j]),
+                "dist_score": float(dists[j]) / max_return_dist if max_return_dist > 0 else 0,
+            }
+            for j in ordered
+        ])
+    return rankings
+
+
+def choose_return_stop(departure_stop_info, stop_table, distance_max_m, transit_priority="balanced",
+                       duration_scores=None, return_time=None):
     """
     Choisit un arrêt retour plausible en privilégiant les distances plus élevées.
+    duration_scores : durées normalisées alignées sur stop_table, issues du calcul aller.
+    return_time : si fourni, écarte les arrêts sans départ
+    dans les SERVICE_WINDOW_RETURN_HOURS précédant l'heure de retour.
 
     Logique par tranches :
     - Tranche 1 : 50-75% de distance max, triée par tc_score
@@ -28,55 +88,13 @@ def choose_return_stop(departure_stop_info, stops_data, distance_max_m, transit_
     - Tranche 3 : 0-25% de distance max, triée par tc_score
     - Tranche 4 : 75-100% de distance max, triée par tc_score
     """
-    weights = TRANSIT_WEIGHTS.get(transit_priority, TRANSIT_WEIGHTS["balanced"])
-    departure_coord = tuple(departure_stop_info["node"])
-    max_return_dist = distance_max_m * RETURN_STOP_MAX_DISTANCE_RATIO
-
-    tranches = [
-        (1, 0.50 * max_return_dist, 0.75 * max_return_dist),
-        (2, 0.25 * max_return_dist, 0.50 * max_return_dist),
-        (3, 0.0,                    0.25 * max_return_dist),
-        (4, 0.75 * max_return_dist, max_return_dist),
-    ]
-
-    all_candidates = []
-    for priority, dist_min, dist_max in tranches:
-        candidates = []
-        for stop_id, stop_info in stops_data.items():
-            stop_coord = tuple(stop_info["node"])
-            dist = haversine(
-                (departure_coord[1], departure_coord[0]),
-                (stop_coord[1], stop_coord[0]),
-            )
-            if not (dist_min <= dist <= dist_max):
-                continue
-            props = stop_info.get("properties", {})
-            tc_score = (
-                weights["duration"] * (1 - props.get("duration_min_go_normalized", 0))
-                + weights["elevation"] * props.get("elevation_normalized", 0)
-                + weights["nature"] * props.get("distance_to_pnr_border_normalized", 0)
-            )
-            candidates.append((priority, tc_score, stop_id, stop_info, dist))
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        all_candidates.extend(candidates)
-
-    if not all_candidates:
+    ranked = rank_return_stops(
+        departure_stop_info, stop_table, [distance_max_m], transit_priority,
+        duration_scores=duration_scores, return_time=return_time,
+    )[0]
+    if not ranked:
         raise RuntimeError("Aucun arrêt retour plausible trouvé")
 
-    all_candidates.sort(key=lambda x: (x[0], -x[1]))
-
-    ranked = [
-        {
-            "score": tc_score,
-            "stop_id": stop_id,
-            "stop_info": stop_info,
-            "dist": dist,
-            "tc_score": tc_score,
-            "dist_score": dist / max_return_dist if max_return_dist > 0 else 0,
-        }
-        for priority, tc_score, stop_id, stop_info, dist in all_candidates
-    ]
-
     best = ranked[0]
     logger.info(
         f"Arrêts retour classés. Premier candidat : {best['stop_id']} "
@@ -125,8 +143,11 @@ def _validate_return_transit_date(transit_steps, return_time, departure_time, re
     )
 
 
-def get_transit_route_for_stop(return_stop_info, return_time, address, departure_time=None):
-    """Renvoie la réponse Google et la durée retour (en secondes) pour un arrêt donné."""
+def get_transit_route_for_stop(return_stop_info, return_time, address, departure_time=None, cache_only=False):
+    """
+    Renvoie la réponse Google et la durée retour (en secondes) pour un arrêt donné.
+    cache_only (mode dégradé) : réponse déjà en cache uniquement (TransitNotCached sinon).
+    """
     stop_coord = tuple(return_stop_info["node"])
     address_coords = coords_from_station_label(address) or geocode_address(address)
 
@@ -134,12 +155,14 @@ def get_transit_route_for_stop(return_stop_info, return_time, address, departure
         origin_latlon=(stop_coord[1], stop_coord[0]),
         destination_latlon=address_coords,
         arrival_time=return_time,
+        cache_only=cache_only,
     )
 
     steps = resp.get("routes", [{}])[0].get("legs", [{}])[0].get("steps", [])
     transit_steps = [s for s in steps if s.get("travelMode") == "TRANSIT"]
 
     if not transit_steps:
+        cache_failure(stop_coord, "back", return_time, "no_transit")
         raise RuntimeError("Aucun step TRANSIT pour retour")
 
     duration_sec = int(resp["routes"][0]["legs"][0]["duration"].replace("s", ""))
@@ -152,35 +175,51 @@ def get_transit_route_for_stop(return_stop_info, return_time, address, departure
 
 def compute_return_transit(
     return_candidates, return_time, address,
-    stops_data=None, departure_time=None, status_callback=None
+    failure_counters=None, departure_time=None, status_callback=None, deadline=None,
+    cache_only=False,
 ):
     """
     Teste le classement des arrêts retour et renvoie le premier itinéraire TC valide.
+    Les arrêts ayant échoué récemment pour ce créneau (cache négatif) ne sont pas réinterrogés.
+    deadline : vérifiée avant chaque arrêt interrogé (DeadlineExceeded une fois le délai dépassé).
+    cache_only (mode dégradé) : seuls les trajets déjà en cache sont testés, sans appel à Google.
     Retourne : (candidate, transit_response, duration_seconds)
     """
     if not return_candidates:
         raise RuntimeError("Aucun candidat d'arrêt retour fourni")
 
+    deadline = deadline or Deadline()
     last_exception = None
     for candidate in return_candidates:
+        deadline.check()
         stop_info = candidate.get("stop_info")
         stop_id = candidate.get("stop_id")
+        cached_reason = get_cached_failure(stop_info["node"], "back", return_time)
+        if cached_reason:
+            logger.info(f"Arrêt retour {stop_id} ignoré : échec récent sur ce créneau ({cached_reason})")
+            last_exception = last_exception or RuntimeError(f"Échec récent pour l'arrêt {stop_id} ({cached_reason})")
+            continue
         update_status("Tentative d'itinéraire de retour", status_callback, 60)
         try:
             resp, duration_sec = get_transit_route_for_stop(
-                stop_info, return_time, address, departure_time=departure_time
+                stop_info, return_time, address, departure_time=departure_time, cache_only=cache_only,
             )
-            stop_info["failure_count"] = 0
+            if failure_counters:
+                failure_counters.success(stop_id)
+            log_transit_service(stop_info.get("coord", stop_info["node"]), "back", resp)
             update_status("Retour transport en commun valide trouvé", status_callback)
             return candidate, resp, duration_sec
+        except TransitNotCached as exc:
+            # Pas un échec de l'arrêt : seulement aucune réponse en cache à tester
+            last_exception = exc
+            continue
         except Exception as exc:
             last_exception = exc
+            if isinstance(exc, requests.RequestException):
+                cache_failure(stop_info["node"], "back", return_time, "error")
             update_status("Tests de plusieurs arrêts pour le trajet retour...", status_callback, 60)
-            stop_info["failure_count"] = stop_info.get("failure_count", 0) + 1
-            logger.warning(f"Compteur échec pour {stop_id} = {stop_info['failure_count']}")
-            if stops_data and stop_info["failure_count"] >= TRANSIT_FAILURE_THRESHOLD:
-                logger.warning(f"Suppression définitive de l'arrêt {stop_id}")
-                stops_data.pop(stop_id, None)
+            if failure_counters:
+                failure_counters.failure(stop_id)
             continue
 
     raise RuntimeError(
@@ -0,0 +1,42 @@
+"""
+Cache négatif des échecs de transport en commun.
+Mémorise (arrêt, sens, créneau horaire) → raison de l'échec pour une durée courte,
+afin de ne pas réinterroger Google sur un arrêt qui vient d'échouer pour le même créneau.
+Le cache Django "transit" est partagé entre les workers (cache fichier).
+"""
+
+import logging
+from zoneinfo import ZoneInfo
+from django.core.cache import caches
+
+from hello.constants import TRANSIT_NEGATIVE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _failure_key(stop_coord, direction, when):
+    """Clé (coordonnées de l'arrêt, sens 'go'/'back', date et heure locales du trajet)."""
+    if when.tzinfo is not None:
+        when = when.astimezone(ZoneInfo("Europe/Paris"))
+    lon, lat = stop_coord[0], stop_coord[1]
+    return f"transit_failure:{direction}:{lon:.5f}:{lat:.5f}:{when:%Y%m%d%H}"
+
+
+def get_cached_failure(stop_coord, direction, when):
+    """Retourne la raison d'un échec récent pour ce créneau, ou None."""
+    try:
+        return caches["transit"].get(_failure_key(stop_coord, direction, when))
+    except Exception as e:
+        logger.warning(f"Lecture cache négatif impossible : {e}")
+        return None
+
+
+def cache_failure(stop_coord, direction, when, reason):
+    """Mémorise un échec ; la durée de vie dépend de la raison (TRANSIT_NEGATIVE_CACHE_TTL)."""
+    ttl = TRANSIT_NEGATIVE_CACHE_TTL.get(reason)
+    if not ttl:
+        return
+    try:
+        caches["transit"].set(_failure_key(stop_coord, direction, when), reason, timeout=ttl)
+    except Exception as e:
+        logger.warning(f"Écriture cache négatif impossible : {e}")
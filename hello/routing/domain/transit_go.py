@@ -6,6 +6,8 @@ import json
 import logging
 import os
 import random
+import numpy as np
+import requests
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from django.conf import settings
@@ -14,10 +16,15 @@ logger = logging.getLogger(__name__)
 
 from ..utils.geotools import haversine
 from ..utils.maps_tools import call_maps_routes_api
+from .service_windows import served_mask, log_transit_service
+from .stop_table import iter_top_k
+from .transit_failures import get_cached_failure, cache_failure
+from .deadline import Deadline
 from hello.data_preparation.utils import normalize_label
 from hello.constants import (
-    TRANSIT_WEIGHTS, TRANSIT_FAILURE_THRESHOLD,
+    TRANSIT_WEIGHTS, TRANSIT_PROBE_BATCH,
     MINIMAL_WALK_HOURS, MAX_DEPARTURE_DELAY_DAY_HOURS, MAX_DEPARTURE_DELAY_EVENING_HOURS,
+    SERVICE_WINDOW_GO_EXTRA_HOURS,
 )
 
 
@@ -61,83 +68,41 @@ def _find_nearest_hub(address_coords, hubs_departs):
     return best[1].get("properties", {}).get("nom") or best[1].get("properties", {}).get("id")
 
 
-def _compute_and_normalize_durations(stops_data, hubs_entree_features, departure_hub_name):
+def _compute_and_normalize_durations(stop_table, hubs_entree_features, departure_hub_name):
     """
     Calcule duration_min_go (hub_départ→hub_entrée + hub_entrée→stop) pour chaque stop
-    et normalise entre 0 et 1.
+    et normalise entre 0 et 1. Repli utilisé quand la matrice de durées est absente.
+    Retourne un tableau aligné sur stop_table.
     """
-    duration_values = []
-    for stop_id, stop_info in (stops_data or {}).items():
-        props = stop_info.setdefault("properties", {})
-        hub_entree_id = props.get("hub_entree")
-
-        dur_hub_to_hub_entree = 10000.0
-        matched = None
-        for hf in hubs_entree_features:
-            hid = hf.get("properties", {}).get("id") or hf.get("properties", {}).get("nom")
-            if hid == hub_entree_id:
-                matched = hf
-                break
+    hubs_by_id = {}
+    for hf in hubs_entree_features:
+        hid = hf.get("properties", {}).get("id") or hf.get("properties", {}).get("nom")
+        hubs_by_id.setdefault(str(hid), hf)
+
+    # Une recherche par hub d'entrée distinct, puis diffusion sur les arrêts
+    hub_ids, inverse = np.unique(stop_table.hub_entree, return_inverse=True)
+    hub_durations = np.full(len(hub_ids), 10000.0)
+    for k, hub_entree_id in enumerate(hub_ids.tolist()):
+        matched = hubs_by_id.get(hub_entree_id)
         if matched:
             dur_map = matched.get("properties", {}).get("durations_from_hubs", {})
             if departure_hub_name and isinstance(dur_map, dict):
-                dur_hub_to_hub_entree = float(dur_map.get(departure_hub_name, 10000))
-
-        if "duration" in props and props.get("duration") is not None:
-            dur_hub_entree_to_stop = float(props["duration"])
-        elif "duration_min_go" in props and props.get("duration_min_go") is not None:
-            dur_hub_entree_to_stop = float(props["duration_min_go"])
-        else:
-            dur_hub_entree_to_stop = 10000.0
-
-        total_min = dur_hub_to_hub_entree + dur_hub_entree_to_stop
-        props["duration_min_go"] = total_min
-        duration_values.append(total_min)
-
-    if not duration_values:
-        return stops_data
-
-    minv = min(duration_values)
-    maxv = max(duration_values)
-    for stop_id, stop_info in (stops_data or {}).items():
-        props = stop_info.setdefault("properties", {})
-        val = props.get("duration_min_go")
-        if val is None:
-            props["duration_min_go_normalized"] = 1.0
-        elif maxv == minv:
-            props["duration_min_go_normalized"] = 0.0
-        else:
-            props["duration_min_go_normalized"] = (val - minv) / (maxv - minv)
-
-    return stops_data
-
-
-def _score_stops(stops_data, transit_priority, randomness):
-    """Calcule les scores et retourne la liste triée (score_final, stop_id, stop_info)."""
-    weights = TRANSIT_WEIGHTS.get(transit_priority, TRANSIT_WEIGHTS["balanced"])
-    scored = []
-    for stop_id, stop_info in stops_data.items():
-        props = stop_info.get("properties", {})
-        score = (
-            weights["duration"] * (1 - props.get("duration_min_go_normalized", 0))
-            + weights["elevation"] * props.get("elevation_normalized", 0)
-            + weights["nature"] * props.get("distance_to_pnr_border_normalized", 0)
-        )
-        score_final = (1 - randomness) * score + randomness * random.random()
-        scored.append((score_final, stop_id, stop_info))
-    scored.sort(reverse=True, key=lambda x: x[0])
-    return scored
+                hub_durations[k] = float(dur_map.get(departure_hub_name, 10000))
 
+    durations = hub_durations[inverse] + stop_table.duration
+    if durations.size == 0:
+        return durations
+    minv, maxv = durations.min(), durations.max()
+    if maxv == minv:
+        return np.zeros_like(durations)
+    return (durations - minv) / (maxv - minv)
 
-def get_best_transit_route(randomness=0.1, departure_time=None, return_time=None,
-                           stops_data=None, address='', transit_priority="balanced",
-                           hubs_entree_data=None):
+
+def compute_duration_scores(stop_table, hubs_entree_data, address, departure_time):
     """
-    Sélectionne le meilleur arrêt selon le score et récupère un itinéraire de transport en commun via Google Maps.
-    Règles temporelles :
-    - Départ matin/journée : max +6h
-    - Départ soir (>18h) : max +18h
-    - L'arrivée sur place doit laisser au moins 4h de marche avant le retour
+    Durée normalisée (0 = plus rapide) de l'adresse de départ vers chaque arrêt,
+    en tableau aligné sur stop_table. Utilise la matrice précalculée si disponible,
+    sinon le calcul à la volée.
     """
     address_coords = coords_from_station_label(address)
     if not address_coords:
@@ -155,16 +120,89 @@ def get_best_transit_route(randomness=0.1, departure_time=None, return_time=None
     departure_hub_name = _find_nearest_hub(address_coords, hubs_departs)
     logger.info(f"Hub de départ sélectionné : {departure_hub_name}")
 
-    stops_data = _compute_and_normalize_durations(stops_data, hubs_entree_features, departure_hub_name)
-    scored_stops = _score_stops(stops_data, transit_priority, randomness)
+    if stop_table.duration_norm is not None:
+        row = stop_table.duration_row(departure_hub_name, departure_time)
+        if row is not None:
+            return row
+        logger.warning(f"Hub {departure_hub_name} absent de la matrice de durées, calcul à la volée")
+    return _compute_and_normalize_durations(stop_table, hubs_entree_features, departure_hub_name)
+
+
+def _score_stops(stop_table, duration_scores, transit_priority, randomness,
+                 stop_mask=None, service_window=None, rng=None):
+    """
+    Calcule les scores dans un tableau temporaire et parcourt les index d'arrêts
+    par score décroissant (sélection top-k, sans trier tous les arrêts).
+    Les arrêts hors stop_mask ou sans desserte sur service_window (début, fin) sont écartés.
+    Génère des couples (score_final, index).
+    """
+    weights = TRANSIT_WEIGHTS.get(transit_priority, TRANSIT_WEIGHTS["balanced"])
+    noise = np.random.default_rng((rng or random).getrandbits(64)).random(len(stop_table))
+    scores = (1 - randomness) * stop_table.base_scores(duration_scores, weights) + randomness * noise
+
+    eligible = np.ones(len(stop_table), dtype=bool) if stop_mask is None else np.asarray(stop_mask, dtype=bool)
+    if service_window:
+        served = served_mask(stop_table, *service_window)
+        skipped = int((eligible & ~served).sum())
+        if skipped:
+            logger.info(f"{skipped} arrêts sans desserte sur le créneau écartés")
+        eligible = eligible & served
+    scores[~eligible] = -np.inf
+
+    for i in iter_top_k(scores, k=TRANSIT_PROBE_BATCH):
+        yield float(scores[i]), i
+
+
+def get_best_transit_route(randomness=0.1, departure_time=None, return_time=None,
+                           stop_table=None, address='', transit_priority="balanced",
+                           hubs_entree_data=None, duration_scores=None, stop_mask=None,
+                           failure_counters=None, rng=None, deadline=None):
+    """
+    Sélectionne le meilleur arrêt selon le score et récupère un itinéraire de transport en commun via Google Maps.
+    stop_table : StopTable du massif ; les arrêts sans desserte sur le créneau sont écartés sans appel Google.
+    duration_scores : durées normalisées déjà calculées (compute_duration_scores), sinon calculées ici.
+    stop_mask : booléens restreignant les arrêts candidats (ex. arrêts proches d'un POI).
+    failure_counters : FailureCounters de la requête, qui enregistre échecs et succès par arrêt.
+    rng : générateur aléatoire de la requête (random.Random graine fixée), module random par défaut.
+    deadline : échéance vérifiée avant chaque arrêt interrogé (sans transport aller, pas de résultat partiel).
+    Règles temporelles :
+    - Départ matin/journée : max +6h
+    - Départ soir (>18h) : max +18h
+    - L'arrivée sur place doit laisser au moins 4h de marche avant le retour
+    """
+    address_coords = coords_from_station_label(address)
+    if not address_coords:
+        raise RuntimeError(f"Impossible de géocoder l'adresse de départ : '{address}'")
+
+    if duration_scores is None:
+        duration_scores = compute_duration_scores(
+            stop_table, hubs_entree_data, address, departure_time
+        )
 
     if departure_time.tzinfo is None:
         departure_time = departure_time.replace(tzinfo=ZoneInfo("Europe/Paris"))
     if return_time.tzinfo is None:
         return_time = return_time.replace(tzinfo=ZoneInfo("Europe/Paris"))
 
-    for score_final, stop_id, stop_info in scored_stops:
+    max_delay_h = MAX_DEPARTURE_DELAY_EVENING_HOURS if departure_time.hour >= 18 else MAX_DEPARTURE_DELAY_DAY_HOURS
+    latest_arrival = min(
+        departure_time + timedelta(hours=max_delay_h + SERVICE_WINDOW_GO_EXTRA_HOURS), return_time
+    )
+    scored_stops = _score_stops(
+        stop_table, duration_scores, transit_priority, randomness,
+        stop_mask=stop_mask, service_window=(departure_time, latest_arrival), rng=rng,
+    )
+
+    deadline = deadline or Deadline()
+    for score_final, i in scored_stops:
+        deadline.check()
+        stop_id = str(stop_table.ids[i])
+        stop_info = stop_table.stop_info(i)
         dest_coords = stop_info["node"]
+        cached_reason = get_cached_failure(dest_coords, "go", departure_time)
+        if cached_reason:
+            logger.info(f"Arrêt {stop_id} ignoré : échec récent sur ce créneau ({cached_reason})")
+            continue
         try:
             data = call_maps_routes_api(
                 origin_latlon=address_coords,
@@ -177,21 +215,20 @@ def get_best_transit_route(randomness=0.1, departure_time=None, return_time=None
 
             if not transit_steps:
                 logger.warning(f"Aucun step TRANSIT pour {stop_id}")
-                stop_info["failure_count"] = stop_info.get("failure_count", 0) + 1
-                logger.warning(f"Compteur échec pour {stop_id} = {stop_info['failure_count']}")
-                if stop_info["failure_count"] >= TRANSIT_FAILURE_THRESHOLD:
-                    logger.warning(f"Suppression définitive de l'arrêt {stop_id}")
-                    stops_data.pop(stop_id)
+                cache_failure(dest_coords, "go", departure_time, "no_transit")
+                if failure_counters:
+                    failure_counters.failure(stop_id)
                 continue
 
-            stop_info["failure_count"] = 0
+            if failure_counters:
+                failure_counters.success(stop_id)
 
             dep_time_str = transit_steps[0]["transitDetails"]["stopDetails"]["departureTime"]
             dep_time = datetime.fromisoformat(dep_time_str).astimezone(ZoneInfo("Europe/Paris"))
 
-            max_delay_h = MAX_DEPARTURE_DELAY_EVENING_HOURS if departure_time.hour >= 18 else MAX_DEPARTURE_DELAY_DAY_HOURS
             if not (dep_time - departure_time) <= timedelta(hours=max_delay_h):
                 logger.info(f"Départ trop éloigné ({dep_time - departure_time}), on ignore {stop_id}")
+                cache_failure(dest_coords, "go", departure_time, "too_late")
                 continue
 
             arrival_time_str = transit_steps[-1]["transitDetails"]["stopDetails"]["arrivalTime"]
@@ -204,10 +241,13 @@ def get_best_transit_route(randomness=0.1, departure_time=None, return_time=None
                 continue
 
             logger.info(f"Itinéraire valide trouvé depuis l'arrêt {stop_id} (score={score_final:.3f})")
+            log_transit_service(stop_info.get("coord", dest_coords), "go", data)
             return data, stop_id, stop_info
 
         except Exception as e:
             logger.warning(f"Tentative échouée pour l'arrêt {stop_id} ({score_final:.3f}): {e}")
+            if isinstance(e, requests.RequestException):
+                cache_failure(dest_coords, "go", departure_time, "error")
             continue
 
     raise RuntimeError("Aucun itinéraire de transport en commun trouvé respectant les contraintes temporelles")
@@ -2,27 +2,44 @@
 Orchestration principale : charge les données, choisit le mode, délègue, finalise.
 """
 
-import json
 import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from hello.data_preparation.utils import slugify
 
 logger = logging.getLogger(__name__)
 
 from .utils.files_tools import load_massif_data, build_geojson, save_result
-from .domain.transit_go import get_best_transit_route
+from .utils.poi_tools import extract_pois_near_path
+from .utils.task_graph import run_task_graph
+from .utils.compact_route import encode_polyline, slim_transit, COORD_PRECISION
+from .utils.load_shedding import (
+    degraded_stages, upstream_stages, merge_stages, TRANSIT_CACHE_ONLY, ELEVATION_NODES_ONLY, SKIP_NEAR_POIS,
+)
+from .domain.transit_go import get_best_transit_route, compute_duration_scores
 from .domain.route_init import initialize_route_parameters
-from .domain.elevation import get_elevations, smooth_elevations, compute_total_ascent
+from .domain.elevation import get_elevations
+from .domain.elevation_profile import compute_elevation_profile
 from .domain.progress import update_status
+from .domain.deadline import Deadline
+from .domain.failure_counters import FailureCounters
 from .domain.route_crossing_or_loop import compute_crossing_route
 from .domain.route_massif_tour import compute_massif_tour_route
 from .domain.route_poi import compute_poi_route
+from hello.constants import ROUTE_TASK_WORKERS
 
 
 def _dispatch_route(pois, massif, massif_clean, departure_time, return_time, level,
-                    address, transit_priority, randomness, stops_data, G, poi_data,
-                    hubs_entree_data, status_callback):
+                    address, transit_priority, randomness, stop_table, G, poi_data,
+                    hubs_entree_data, status_callback, failure_counters=None,
+                    prefetch_draft=None, rng=None, deadline=None, transit_cache_only=False):
     """Choisit le mode de calcul et retourne route_data standardisé."""
+    # Durées normalisées adresse → arrêts, partagées entre choix de l'arrêt aller et des arrêts retour
+    duration_scores = compute_duration_scores(
+        stop_table, hubs_entree_data, address, departure_time
+    )
+
     # Mode de calcul de type POI
     if pois:
         update_status("Calcul du chemin avec les points d'intérêt", status_callback, 10)
@@ -30,18 +47,23 @@ def _dispatch_route(pois, massif, massif_clean, departure_time, return_time, lev
             randomness=randomness, massif=massif,
             departure_time=departure_time, return_time=return_time,
             level=level, address=address, transit_priority=transit_priority,
-            pois=pois, stops_data=stops_data, G=G, poi_data=poi_data,
+            pois=pois, stop_table=stop_table, G=G, poi_data=poi_data,
             hubs_entree_data=hubs_entree_data, status_callback=status_callback,
+            duration_scores=duration_scores, failure_counters=failure_counters,
+            prefetch_draft=prefetch_draft, rng=rng, deadline=deadline,
+            transit_cache_only=transit_cache_only,
         )
 
     # Mode de calcul de type tour massif ou traversée
     update_status("Calcul du transport aller", status_callback, 15)
     travel_go, departure_stop_id, departure_stop_info = get_best_transit_route(
         randomness=randomness, departure_time=departure_time, return_time=return_time,
-        stops_data=stops_data, address=address, transit_priority=transit_priority,
-        hubs_entree_data=hubs_entree_data,
+        stop_table=stop_table, address=address, transit_priority=transit_priority,
+        hubs_entree_data=hubs_entree_data, duration_scores=duration_scores,
+        failure_counters=failure_counters, rng=rng, deadline=deadline,
     )
-    update_status("Point de départ déterminé", status_callback, 25)
+    update_status("Point de départ déterminé", status_callback, 25,
+                  partial={"stage": "transit_go", "transit_go": slim_transit(travel_go)})
 
     max_distance_m, route_type = initialize_route_parameters(
         massif_name=massif, departure_time=departure_time, return_time=return_time,
@@ -53,17 +75,22 @@ def _dispatch_route(pois, massif, massif_clean, departure_time, return_time, lev
         route_data = compute_crossing_route(
             departure_stop_info=departure_stop_info, departure_stop_id=departure_stop_id,
             massif=massif, massif_clean=massif_clean, max_distance_m=max_distance_m,
-            G=G, poi_data=poi_data, stops_data=stops_data, randomness=randomness,
+            G=G, poi_data=poi_data, stop_table=stop_table, randomness=randomness,
             travel_go=travel_go, departure_time=departure_time, return_time=return_time,
             level=level, transit_priority=transit_priority, address=address,
-            status_callback=status_callback,
+            status_callback=status_callback, duration_scores=duration_scores,
+            failure_counters=failure_counters, rng=rng, deadline=deadline,
+            transit_cache_only=transit_cache_only,
         )
     elif route_type == "massif_tour":
         route_data = compute_massif_tour_route(
             departure_stop_info=departure_stop_info, max_distance_m=max_distance_m,
-            massif_clean=massif_clean, G=G, poi_data=poi_data, stops_data=stops_data,
+            massif_clean=massif_clean, G=G, poi_data=poi_data, stop_table=stop_table,
             randomness=randomness, departure_time=departure_time, return_time=return_time,
             address=address, transit_priority=transit_priority, status_callback=status_callback,
+            duration_scores=duration_scores, failure_counters=failure_counters,
+            prefetch_draft=prefetch_draft, rng=rng, deadline=deadline,
+            transit_cache_only=transit_cache_only,
         )
     else:
         raise ValueError(f"route_type inconnu : {route_type}")
@@ -73,6 +100,86 @@ def _dispatch_route(pois, massif, massif_clean, departure_time, return_time, lev
     return route_data
 
 
+def _draft_prefetcher(executor, node_elevations, poi_data, elevations=True, near_pois=True):
+    """
+    Callback passé aux modes de calcul : prefetch(path) lance, pendant que le retour TC est cherché,
+    la récupération des altitudes et l'extraction des POI proches d'un tracé provisoire déjà fixé.
+    Retourne (prefetch, [{"path", "elevations", "near_pois"}]) ; prefetch vaut None si rien n'est à lancer.
+    """
+    drafts = []
+    if not (elevations or near_pois):
+        return None, drafts
+
+    def prefetch(path):
+        draft = [(p[0], p[1]) for p in path]
+        if draft:
+            drafts.append({
+                "path": draft,
+                "elevations": executor.submit(get_elevations, draft, node_elevations) if elevations else None,
+                "near_pois": executor.submit(_near_pois, draft, poi_data) if near_pois else None,
+            })
+
+    return prefetch, drafts
+
+
+def _collect_drafts(drafts):
+    """Altitudes déjà obtenues sur les tracés provisoires : {(lon, lat): altitude}."""
+    known = {}
+    for draft in drafts:
+        if draft["elevations"] is None:
+            continue
+        try:
+            known.update(zip(draft["path"], draft["elevations"].result()))
+        except Exception as e:
+            logger.warning(f"Altitudes du tracé provisoire indisponibles : {e}")
+    return known
+
+
+def _find_run(path, run):
+    """Indice de début de run, suite contiguë de points de path, ou None."""
+    n = len(run)
+    for i in range(len(path) - n + 1):
+        if path[i] == run[0] and path[i:i + n] == run:
+            return i
+    return None
+
+
+def _near_pois(path, poi_data):
+    try:
+        return extract_pois_near_path(path, poi_data, max_distance_m=200)
+    except Exception as e:
+        logger.warning(f"erreur POI : {e}")
+        return []
+
+
+def _near_pois_final(path, poi_data, drafts):
+    """
+    POI proches du tracé final. Si un tracé provisoire en est une portion contiguë, ses POI déjà extraits
+    sont repris et seuls les tronçons avant et après sont examinés (la distance au tracé est
+    le minimum sur ses segments : même résultat qu'une extraction complète).
+    """
+    path = [(p[0], p[1]) for p in path]
+    for draft in drafts:
+        if draft["near_pois"] is None:
+            continue
+        start = _find_run(path, draft["path"])
+        if start is None:
+            continue
+        try:
+            found = draft["near_pois"].result()
+        except Exception as e:
+            logger.warning(f"POI du tracé provisoire indisponibles : {e}")
+            break
+        end = start + len(draft["path"]) - 1
+        # Tronçons avant et après, points de jonction inclus pour couvrir les segments de raccord
+        for segment in (path[:start + 1], path[end:]):
+            if len(segment) > 1:
+                found = found + _near_pois(segment, poi_data)
+        ids = {id(feat) for feat in found}
+        return [feat for feat in (poi_data or {}).get("features", []) if id(feat) in ids]
+    return _near_pois(path, poi_data)
+
+
 def compute_best_route(
     randomness=0.2,
     massif="Chartreuse",
@@ -83,64 +190,114 @@ def compute_best_route(
     transit_priority: str = "balanced",
     pois=None,
     status_callback=None,
+    seed=None,
+    deadline=None,
+    degraded=None,
 ):
+    # deadline : échéance (délai, annulation) consultée entre les candidats et les recherches de chemin
+    deadline = deadline or Deadline()
+    # degraded : étapes dégradées décidées à la soumission (None : décision au démarrage du calcul),
+    # complétées par les API amont que ce processus a vues lentes
+    stages = degraded_stages() if degraded is None else merge_stages(degraded, upstream_stages())
+    if stages:
+        logger.warning(f"Mode dégradé : {', '.join(stages)}")
+        update_status("Service chargé : calcul simplifié", status_callback)
+
+    # Tous les tirages aléatoires de la requête passent par ce générateur : même graine, même itinéraire
+    if seed is None:
+        seed = random.getrandbits(52)  # entier exact côté JavaScript
+    rng = random.Random(seed)
+    logger.info(f"Graine de la requête : {seed}")
+
     # Étape 1 : Chargement des données du massif
     massif_clean = slugify(massif)
     massif_data = load_massif_data(massif)
-    stops_data = massif_data["stops_data"]
-    stops_path = massif_data["stops_path"]
+    stop_table = massif_data["stop_table"]
     G = massif_data["G"]
     poi_data = massif_data["poi_data"]
     hubs_entree_data = massif_data["hubs_entree_data"]
     update_status("Données du massif chargées", status_callback, 5)
+    deadline.check()
 
     departure_time = datetime.fromisoformat(departure_time)
     return_time = datetime.fromisoformat(return_time)
 
     # Étape 2 : Calcul du chemin optimal selon le mode (POI, tour massif, traversée)
-    route_data = _dispatch_route(
-        pois=pois, massif=massif, massif_clean=massif_clean,
-        departure_time=departure_time, return_time=return_time,
-        level=level, address=address, transit_priority=transit_priority,
-        randomness=randomness, stops_data=stops_data, G=G, poi_data=poi_data,
-        hubs_entree_data=hubs_entree_data, status_callback=status_callback,
-    )
+    # Les tracés provisoires connus avant le retour TC (tour du massif, chemin entre POI) lancent
+    # altitudes et POI proches en fond ; en traversée, le tracé dépend de l'arrêt retour retenu
+    with ThreadPoolExecutor(max_workers=ROUTE_TASK_WORKERS) as executor:
+        # Mode dégradé : altitudes des nœuds seulement, ou POI proches non extraits, rien à lancer en fond
+        prefetch_draft, drafts = _draft_prefetcher(
+            executor, massif_data["node_elevations"], poi_data,
+            elevations=ELEVATION_NODES_ONLY not in stages, near_pois=SKIP_NEAR_POIS not in stages,
+        )
+        failure_counters = FailureCounters(massif_clean)
+        try:
+            route_data = _dispatch_route(
+                pois=pois, massif=massif, massif_clean=massif_clean,
+                departure_time=departure_time, return_time=return_time,
+                level=level, address=address, transit_priority=transit_priority,
+                randomness=randomness, stop_table=stop_table, G=G, poi_data=poi_data,
+                hubs_entree_data=hubs_entree_data, status_callback=status_callback,
+                failure_counters=failure_counters, prefetch_draft=prefetch_draft,
+                rng=rng, deadline=deadline, transit_cache_only=TRANSIT_CACHE_ONLY in stages,
+            )
+        finally:
+            # Compteurs d'échec des arrêts TC : un seul lot SQLite, même si le calcul a échoué
+            try:
+                failure_counters.flush()
+            except Exception as e:
+                logger.warning(f"Erreur sauvegarde compteurs d'échec : {e}")
 
-    path = route_data.get("path") or []
-    dist = route_data.get("dist") or 0
-    logger.info(f"Distance randonnée finale : {dist/1000:.1f} km")
+        path = route_data.get("path") or []
+        dist = route_data.get("dist") or 0
+        logger.info(f"Distance randonnée finale : {dist/1000:.1f} km")
+        if deadline.exhausted():
+            logger.warning("Délai de calcul dépassé : finalisation du meilleur tracé obtenu")
 
-    # Étape 3 : Calcul des altitudes 
-    update_status("Calcul des altitudes", status_callback, 90)
-    if not path:
-        smoothed_elevations, total_ascent, elevation_failed = [], 0, True
-    else:
-        elevations = get_elevations(path)
-        elevation_failed = all(ele == 0 for ele in elevations)
-        smoothed_elevations = smooth_elevations(elevations, window=9)
-        total_ascent = compute_total_ascent(smoothed_elevations)
+        # Étape 3 : Altitudes et POI proches du tracé, en parallèle
+        # Tracé provisoire (sans altitudes) publié pour affichage avant la fin du calcul
+        update_status("Calcul des altitudes", status_callback, 90, partial={
+            "stage": "draft_path",
+            "path": encode_polyline([(p[1], p[0]) for p in path], (COORD_PRECISION, COORD_PRECISION)),
+            "precision": [COORD_PRECISION, COORD_PRECISION],
+        })
+        tasks = {
+            "draft_elevations": (lambda: _collect_drafts(drafts), []),
+            "elevations": (
+                lambda draft_elevations: get_elevations(
+                    path, massif_data["node_elevations"], known_elevations=draft_elevations,
+                    nodes_only=ELEVATION_NODES_ONLY in stages,
+                ),
+                ["draft_elevations"],
+            ),
+            "profile": (lambda elevations: compute_elevation_profile(path, elevations), ["elevations"]),
+            "near_pois": (lambda: [] if SKIP_NEAR_POIS in stages else _near_pois_final(path, poi_data, drafts), []),
+        }
+        results = run_task_graph(tasks, executor)
+
+    elevations, profile = results["elevations"], results["profile"]
+    elevation_failed = not path or all(ele == 0 for ele in elevations)
 
     # Etape 4 : Construction du GeoJSON final et sauvegarde
-    path = [[lon, lat, round(ele)] for (lon, lat), ele in zip(path, smoothed_elevations)]
+    path = [[p[0], p[1], round(ele)] for p, ele in zip(path, profile["smoothed"].tolist())]
 
     result = build_geojson(
         path=path, dist=dist,
         route_type=route_data["route_type"],
         travel_go=route_data["travel_go"],
         travel_return=route_data["travel_return"],
-        total_ascent=total_ascent,
+        total_ascent=profile["ascent"],
         elevation_failed=elevation_failed,
         return_error_message=route_data.get("return_error_message"),
         poi_data=poi_data,
+        elevation_profile=profile,
+        near_pois=results["near_pois"],
+        massif=massif_clean,
+        seed=seed,
+        degraded_stages=stages,
     )
 
     save_result(result, address, massif_clean, level, randomness, status_callback)
 
-    # Etape 5 : Sauvegarde des compteurs d'échec pour les arrêts de transport en commun
-    try:
-        with open(stops_path, "w", encoding="utf-8") as f:
-            json.dump(stops_data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.warning(f"Erreur sauvegarde compteurs d'échec : {e}")
-
     return result
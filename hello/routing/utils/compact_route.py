@@ -0,0 +1,106 @@
+"""
+Format de réponse compact (opt-in, `format=compact`) d'un itinéraire.
+Le tracé est encodé en polyline (latitude, longitude au 1e-5 degré, altitude au mètre),
+les POI proches sont remplacés par leur indice dans le fichier POI du massif
+et les trajets en transports ne gardent que les champs affichés par le front.
+"""
+
+import numpy as np
+
+COORD_PRECISION = 5
+ELEVATION_PRECISION = 0
+
+# Champs du détail Google Routes (transitDetails) réellement affichés
+_STOP_FIELDS = ("name", "location")
+_LINE_FIELDS = ("name", "nameShort")
+
+
+def encode_polyline(rows, precisions):
+    """
+    Encode une suite de points multidimensionnels au format polyline de Google
+    (deltas zigzag sur 5 bits). `precisions` : nombre de décimales conservées par dimension.
+    """
+    if not len(rows):
+        return ""
+    values = np.asarray(rows, dtype=np.float64)
+    scale = 10.0 ** np.asarray(precisions, dtype=np.float64)
+    quantized = np.round(values * scale).astype(np.int64)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, quantized.shape[1]), dtype=np.int64))
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chunks = []
+    for value in zigzag.ravel().tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def _slim_stop(stop):
+    return {key: stop[key] for key in _STOP_FIELDS if key in stop}
+
+
+def _slim_step(step):
+    details = step.get("transitDetails") or {}
+    stop_details = details.get("stopDetails") or {}
+    line = details.get("transitLine") or {}
+    agencies = line.get("agencies") or []
+    return {
+        "travelMode": "TRANSIT",
+        "transitDetails": {
+            "stopDetails": {
+                "departureStop": _slim_stop(stop_details.get("departureStop") or {}),
+                "arrivalStop": _slim_stop(stop_details.get("arrivalStop") or {}),
+                "departureTime": stop_details.get("departureTime"),
+                "arrivalTime": stop_details.get("arrivalTime"),
+            },
+            "headsign": details.get("headsign"),
+            "transitLine": {
+                **{key: line[key] for key in _LINE_FIELDS if key in line},
+                "vehicle": {"name": {"text": ((line.get("vehicle") or {}).get("name") or {}).get("text")}},
+                "agencies": [{"uri": agencies[0].get("uri")}] if agencies else [],
+            },
+        },
+    }
+
+
+def slim_transit(travel):
+    """Réponse Google Routes réduite aux étapes en transport et aux champs affichés (même structure)."""
+    if not isinstance(travel, dict) or "routes" not in travel:
+        return travel
+    return {
+        "routes": [
+            {"legs": [
+                {"steps": [_slim_step(step) for step in leg.get("steps", []) if step.get("travelMode") == "TRANSIT"]}
+                for leg in route.get("legs", [])
+            ]}
+            for route in travel.get("routes", [])
+        ]
+    }
+
+
+def compact_route(result):
+    """
+    Version compacte d'un résultat de build_geojson :
+    {format, route_id, generated_filename, path, precision, properties}.
+    `path` contient les points (lat, lon, ele) encodés ; les propriétés remplacent
+    near_pois par near_poi_ids (indices dans data/output/<massif>_poi_scores.geojson).
+    """
+    feature = result["features"][0]
+    coords = feature["geometry"]["coordinates"]
+    props = dict(feature["properties"])
+
+    rows = [(c[1], c[0], c[2] if len(c) > 2 else 0) for c in coords]
+    props.pop("near_pois", None)
+    props["transit_go"] = slim_transit(props.get("transit_go"))
+    props["transit_back"] = slim_transit(props.get("transit_back"))
+
+    return {
+        "format": "compact",
+        "route_id": result.get("route_id"),
+        "generated_filename": result.get("generated_filename"),
+        "path": encode_polyline(rows, (COORD_PRECISION, COORD_PRECISION, ELEVATION_PRECISION)),
+        "precision": [COORD_PRECISION, COORD_PRECISION, ELEVATION_PRECISION],
+        "properties": props,
+    }
@@ -2,28 +2,147 @@
 Chargement des fichiers de données associés à un massif, construction et sauvegarde du résultat.
 """
 
+import csv
+import hashlib
 import json
 import logging
 import os
 import pickle
+import threading
 from datetime import datetime
+from xml.sax.saxutils import escape
 
 logger = logging.getLogger(__name__)
 
-import gpxpy
-import gpxpy.gpx
-from shapely.geometry import LineString, mapping, shape
+import numpy as np
+from shapely.geometry import LineString, mapping
 from django.conf import settings
 
 from hello.data_preparation.utils import slugify
+from hello.constants import TRANSIT_FAILURE_THRESHOLD
+from hello.routing.domain.failure_counters import blocked_stop_ids
+from hello.routing.domain.stop_table import StopTable
+from hello.routing.domain.elevation import load_node_elevations
+from hello.routing.utils.route_store import put_route
+
+
+# Données immuables partagées entre requêtes : massif -> (signature des fichiers, objet)
+_STOP_TABLES = {}
+_NODE_ELEVATIONS = {}
+_MASSIF_FILES = {}
+_STOP_TABLES_LOCK = threading.Lock()
+
+
+def _load_stop_table(massif_clean, stops_path):
+    """
+    Construit (ou reprend du cache) la StopTable d'un massif à partir du mapping arrêts-nœuds,
+    de la matrice de durées (Arrets_2) et de l'index de desserte (Arrets_6), tous deux optionnels.
+    Le cache est invalidé dès qu'un de ces fichiers change.
+    """
+    matrix_path = f"data/output/{massif_clean}_duration_matrix.npz"
+    windows_path = f"data/output/{massif_clean}_service_windows.json"
+    signature = tuple(
+        os.path.getmtime(path) if os.path.exists(path) else None
+        for path in (stops_path, matrix_path, windows_path)
+    )
+
+    with _STOP_TABLES_LOCK:
+        cached = _STOP_TABLES.get(massif_clean)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        with open(stops_path, "r", encoding="utf-8") as f:
+            stops_data = json.load(f)
+
+        duration_matrix = None
+        if os.path.exists(matrix_path):
+            with np.load(matrix_path) as npz:
+                duration_matrix = {key: npz[key] for key in npz.files}
+        else:
+            logger.info(f"Matrice de durées absente ({matrix_path}), calcul à la volée")
+
+        service_windows = None
+        if os.path.exists(windows_path):
+            with open(windows_path, "r", encoding="utf-8") as f:
+                service_windows = json.load(f)
+
+        stop_table = StopTable.from_mapping(stops_data, service_windows, duration_matrix)
+        _STOP_TABLES[massif_clean] = (signature, stop_table)
+        logger.info(f"Table des arrêts {massif_clean} construite : {len(stop_table)} arrêts")
+        return stop_table
+
+
+def _load_node_elevations(massif_clean):
+    """Altitudes des nœuds du graphe (Graphe_2), mises en cache ; None si le fichier est absent."""
+    npz_path = f"data/output/{massif_clean}_node_elevations.npz"
+    if not os.path.exists(npz_path):
+        logger.info(f"Altitudes des nœuds absentes ({npz_path}), échantillonnage à la demande")
+        return None
+    signature = os.path.getmtime(npz_path)
+
+    with _STOP_TABLES_LOCK:
+        cached = _NODE_ELEVATIONS.get(massif_clean)
+        if cached and cached[0] == signature:
+            return cached[1]
+        node_elevations = load_node_elevations(npz_path)
+        _NODE_ELEVATIONS[massif_clean] = (signature, node_elevations)
+        return node_elevations
+
+
+def _load_massif_files(massif_clean, files):
+    """
+    Graphe, POI et hubs d'entrée du massif, mis en cache et relus seulement si un fichier change.
+    Partagés entre requêtes (et préchargés par les workers) : en lecture seule, les pénalités
+    de réutilisation d'arêtes sont tenues à part (geotools.penalize_path_edges).
+    """
+    signature = tuple(os.path.getmtime(files[key]) for key in ("graph", "poi", "hubs"))
+
+    with _STOP_TABLES_LOCK:
+        cached = _MASSIF_FILES.get(massif_clean)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        with open(files["graph"], "rb") as f:
+            G = pickle.load(f)
+
+        with open(files["poi"], "r", encoding="utf-8") as f:
+            poi_data = json.load(f)
+
+        with open(files["hubs"], "r", encoding="utf-8") as f:
+            hubs_entree_data = json.load(f)
+
+        _MASSIF_FILES[massif_clean] = (signature, (G, poi_data, hubs_entree_data))
+        logger.info(f"Graphe {massif_clean} chargé : {G.number_of_nodes()} nœuds")
+        return G, poi_data, hubs_entree_data
+
+
+def massif_data_version(massif_name):
+    """
+    Version des données d'un massif : empreinte des dates de modification de ses fichiers
+    (mapping, graphe, POI, hubs, matrice de durées, desserte, altitudes des nœuds).
+    """
+    massif_clean = slugify(massif_name)
+    suffixes = (
+        "arrets_stop_node_mapping.json", "hiking_graph.gpickle", "poi_scores.geojson", "hubs_entree.geojson",
+        "duration_matrix.npz", "service_windows.json", "node_elevations.npz",
+    )
+    signature = []
+    for suffix in suffixes:
+        path = f"data/output/{massif_clean}_{suffix}"
+        signature.append(f"{suffix}:{os.path.getmtime(path) if os.path.exists(path) else None}")
+    return hashlib.sha256("|".join(signature).encode("utf-8")).hexdigest()[:16]
 
 
 def load_massif_data(massif_name: str) -> dict:
     """
     Charge les fichiers de données d'un massif et les retourne dans un dict.
 
-    Retourne: {stops_data, stops_path, G, poi_data, hubs_entree_data}
+    Retourne: {stop_table, stops_path, G, poi_data, hubs_entree_data, node_elevations}
     Lève FileNotFoundError si un fichier est manquant.
+    StopTable, graphe, POI et hubs sont mis en cache entre requêtes (lecture seule) ; la matrice de durées (Arrets_2)
+    et l'index de desserte (Arrets_6) y sont intégrés s'ils existent.
+    node_elevations (altitudes des nœuds, Graphe_2) est optionnel : None si absent.
+    Les arrêts ayant atteint TRANSIT_FAILURE_THRESHOLD échecs sont exclus (sans réécrire le fichier).
     """
     massif_clean = slugify(massif_name)
 
@@ -38,43 +157,57 @@ def load_massif_data(massif_name: str) -> dict:
         if not os.path.exists(path):
             raise FileNotFoundError(f"Fichier introuvable : {path}")
 
-    with open(files["stops"], "r", encoding="utf-8") as f:
-        stops_data = json.load(f)
-
-    with open(files["graph"], "rb") as f:
-        G = pickle.load(f)
+    stop_table = _load_stop_table(massif_clean, files["stops"])
 
-    with open(files["poi"], "r", encoding="utf-8") as f:
-        poi_data = json.load(f)
+    try:
+        blocked = blocked_stop_ids(massif_clean, TRANSIT_FAILURE_THRESHOLD)
+    except Exception as e:
+        logger.warning(f"Lecture compteurs d'échec impossible : {e}")
+        blocked = set()
+    if blocked:
+        stop_table = stop_table.subset(~np.isin(stop_table.ids, list(blocked)))
+        logger.info(f"{len(blocked)} arrêts exclus (échecs répétés), en attente de compaction")
 
-    with open(files["hubs"], "r", encoding="utf-8") as f:
-        hubs_entree_data = json.load(f)
+    G, poi_data, hubs_entree_data = _load_massif_files(massif_clean, files)
 
     return {
-        "stops_data": stops_data,
+        "stop_table": stop_table,
         "stops_path": files["stops"],
         "G": G,
         "poi_data": poi_data,
         "hubs_entree_data": hubs_entree_data,
+        "node_elevations": _load_node_elevations(massif_clean),
     }
 
 
 def build_geojson(path, dist, route_type, travel_go, travel_return,
-                  total_ascent, elevation_failed, return_error_message, poi_data):
+                  total_ascent, elevation_failed, return_error_message, poi_data,
+                  elevation_profile=None, near_pois=None, massif=None, seed=None, degraded_stages=None):
     from hello.routing.utils.poi_tools import extract_pois_near_path
 
     extra_props = {}
+    if elevation_profile is not None:
+        extra_props["path_descent"] = elevation_profile["descent"]
+        extra_props["elevation_min"] = elevation_profile["min"]
+        extra_props["elevation_max"] = elevation_profile["max"]
+        extra_props["max_slope"] = elevation_profile["max_slope"]
+        extra_props["elevation_profile"] = elevation_profile["profile"]
     if elevation_failed:
         extra_props["elevation_error"] = True
     if return_error_message:
         extra_props["return_error"] = True
         extra_props["return_error_message"] = return_error_message
 
-    try:
-        near_pois = extract_pois_near_path(path, poi_data, max_distance_m=200)
-    except Exception as e:
-        logger.warning(f"erreur POI : {e}")
-        near_pois = []
+    if near_pois is None:
+        try:
+            near_pois = extract_pois_near_path(path, poi_data, max_distance_m=200)
+        except Exception as e:
+            logger.warning(f"erreur POI : {e}")
+            near_pois = []
+
+    # Indices des POI dans le fichier POI du massif (référencés par le format compact)
+    poi_index = {id(feat): i for i, feat in enumerate(poi_data.get("features", []))} if poi_data else {}
+    near_poi_ids = [poi_index[id(feat)] for feat in near_pois if id(feat) in poi_index]
 
     props = {
         "start_coord": path[0] if path else None,
@@ -85,6 +218,12 @@ def build_geojson(path, dist, route_type, travel_go, travel_return,
         "transit_back": travel_return,
         "path_elevation": total_ascent,
         "near_pois": near_pois,
+        "near_poi_ids": near_poi_ids,
+        "massif": massif,
+        "seed": seed,
+        # Étapes sautées ou approchées sous charge (voir load_shedding)
+        "degraded": bool(degraded_stages),
+        "degraded_stages": list(degraded_stages or []),
         **extra_props,
     }
     return {
@@ -93,39 +232,36 @@ def build_geojson(path, dist, route_type, travel_go, travel_return,
     }
 
 
-def _save_geojson_gpx(data, output_path="hello/static/hello/data/optimized_routes.geojson"):
-    """Sauvegarde le GeoJSON dans output_path et génère un fichier GPX au même emplacement."""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-        logger.info(f"GeoJSON sauvegardé dans {output_path}")
+GPX_POINTS_PER_CHUNK = 500
 
-    try:
-        with open(output_path, "r", encoding="utf-8") as f:
-            geojson_data = json.load(f)
-    except Exception:
-        geojson_data = data
-
-    gpx = gpxpy.gpx.GPX()
-    for feature in geojson_data.get("features", []):
-        geom = shape(feature["geometry"])
-        if geom.geom_type == "LineString":
-            track = gpxpy.gpx.GPXTrack()
-            gpx.tracks.append(track)
-            segment = gpxpy.gpx.GPXTrackSegment()
-            track.segments.append(segment)
-            for coord in geom.coords:
-                lon, lat = coord[0], coord[1]
-                ele = coord[2] if len(coord) > 2 else None
-                segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=ele))
-
-    gpx_path = os.path.splitext(output_path)[0] + ".gpx"
-    try:
-        with open(gpx_path, "w", encoding="utf-8") as f:
-            f.write(gpx.to_xml())
-        logger.info(f"GPX sauvegardé dans {gpx_path}")
-    except Exception as e:
-        logger.info(f"Erreur lors de la sauvegarde du GPX: {e}")
+
+def iter_gpx(coords, name="Lignes de crêtes"):
+    """
+    Génère le GPX (une trace, un segment) par morceaux, directement depuis les coordonnées
+    [[lon, lat, ele?], ...], sans objets intermédiaires.
+    """
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="lignes-de-cretes" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f"<trk><name>{escape(name)}</name><trkseg>\n"
+    )
+    for start in range(0, len(coords), GPX_POINTS_PER_CHUNK):
+        yield "".join(
+            f'<trkpt lat="{c[1]}" lon="{c[0]}"><ele>{c[2]}</ele></trkpt>\n'
+            if len(c) > 2 and c[2] is not None else f'<trkpt lat="{c[1]}" lon="{c[0]}"></trkpt>\n'
+            for c in coords[start:start + GPX_POINTS_PER_CHUNK]
+        )
+    yield "</trkseg></trk>\n</gpx>\n"
+
+
+def route_coordinates(result):
+    """Coordonnées [[lon, lat, ele], ...] du tracé (LineString) d'un résultat GeoJSON."""
+    coords = []
+    for feature in result.get("features", []):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "LineString":
+            coords.extend(geometry.get("coordinates", []))
+    return coords
 
 
 def save_result(result, address, massif_clean, level, randomness, status_callback):
@@ -136,15 +272,42 @@ def save_result(result, address, massif_clean, level, randomness, status_callbac
     except Exception:
         params_part = f"{slugify(address)}_{massif_clean}"
 
-    ts_ms = int(datetime.utcnow().timestamp() * 1000)
-    filename_base = f"route_{params_part}_{ts_ms}"
-    output_dir = os.path.join(settings.BASE_DIR, "hello", "static", "hello", "data")
-    os.makedirs(output_dir, exist_ok=True)
-
     try:
-        _save_geojson_gpx(result, output_path=os.path.join(output_dir, f"{filename_base}.geojson"))
-        result["generated_filename"] = f"{filename_base}.geojson"
+        # Stockage adressé par contenu ; le GPX n'est produit qu'au téléchargement (vue route_gpx)
+        result["route_id"] = put_route(result)
+        result["generated_filename"] = f"route_{params_part}.geojson"
         update_status("Sauvegarde terminée", status_callback, 98)
     except Exception as e:
         logger.warning(f"erreur sauvegarde : {e}")
         update_status(f"Erreur de sauvegarde : {e}", status_callback, 98)
+
+
+def log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, result):
+    """Enregistre un appel de calcul d'itinéraire (get_route, start_route, worker) dans un fichier CSV."""
+    logs_dir = os.path.join(settings.BASE_DIR, "data", "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    
+    csv_file = os.path.join(logs_dir, "appels_get_route.csv")
+    
+    # Vérifier si le fichier existe pour ajouter l'en-tête si nécessaire
+    file_exists = os.path.isfile(csv_file)
+    
+    with open(csv_file, "a", newline="", encoding="utf-8") as f:
+        fieldnames = ["date_appel", "massif", "address", "level", "randomness", "departure_datetime", "return_datetime", "transit_priority", "pois", "resultat"]
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        
+        if not file_exists:
+            writer.writeheader()
+        
+        writer.writerow({
+            "date_appel": datetime.now().isoformat(),
+            "massif": massif,
+            "address": address,
+            "level": level,
+            "randomness": randomness_str,
+            "departure_datetime": departure_datetime,
+            "return_datetime": return_datetime,
+            "transit_priority": transit_priority,
+            "pois": pois,
+            "resultat": result
+        })
@@ -6,6 +6,7 @@ Contient les fonctions de calcul de distances, recherche de noeuds et géocodage
 import logging
 import math
 import random
+import numpy as np
 import requests
 from shapely.geometry import LineString
 
@@ -47,6 +48,22 @@ def haversine(coord1, coord2):
     return 2 * R * math.asin(math.sqrt(a))
 
 
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Haversine vectorisée (m), angles en degrés."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * np.arcsin(np.sqrt(a))
+
+
+def cumulative_distances(coords):
+    """Distance cumulée (m) le long d'une polyligne de points (lon, lat), premier point à 0."""
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords) < 2:
+        return np.zeros(len(coords))
+    steps = haversine_m(coords[:-1, 1], coords[:-1, 0], coords[1:, 1], coords[1:, 0])
+    return np.concatenate([[0.0], np.cumsum(steps)])
+
+
 def find_nearest_node(G, coord):
     """Trouve le nœud du graphe le plus proche d'une coordonnée (lat, lon)."""
     # Si le graphe a été filtré pour ne contenir que la plus grande composante,
@@ -67,8 +84,8 @@ def _angle_between(p1, p2, p3):
     return max(-1.0, min(1.0, cos_theta))
 
 
-def determine_rotation_direction():
-    return random.choice(["clockwise", "counterclockwise"])
+def determine_rotation_direction(rng=None):
+    return (rng or random).choice(["clockwise", "counterclockwise"])
 
 
 def angle_in_sector(poi_angle, min_angle, max_angle, direction):
@@ -97,20 +114,21 @@ def _path_has_crossing(path_nodes, new_segment_nodes):
 from hello.constants import REUSE_PENALTY_MULTIPLIER
 
 
-def save_original_weights(G):
-    """Sauvegarde les poids originaux du graphe (avant pénalisation)."""
-    weights = {}
-    for u, v, data in G.edges(data=True):
-        weights[(u, v)] = data.get("length", 1.0)
-        weights[(v, u)] = data.get("length", 1.0)
-    return weights
+# Le graphe d'un massif est partagé entre requêtes (load_massif_data) et ne doit jamais être modifié :
+# les pénalités de réutilisation vivent dans un dict {(u, v): longueur pénalisée} propre au calcul.
+
+def edge_length(G, u, v, penalties=None):
+    """Longueur de l'arête (u, v), pénalisée si elle figure dans penalties."""
+    if penalties and (u, v) in penalties:
+        return penalties[(u, v)]
+    return G[u][v].get("length", 1.0)
 
 
-def restore_original_weights(G, original_weights):
-    """Restaure les poids originaux dans le graphe."""
-    for u, v, data in G.edges(data=True):
-        if (u, v) in original_weights:
-            G[u][v]["length"] = original_weights[(u, v)]
+def penalized_weight(penalties, attr="length"):
+    """Fonction de poids networkx appliquant les pénalités (lues à chaque appel, le dict peut évoluer)."""
+    def weight(u, v, data):
+        return penalties.get((u, v), data.get(attr, 1.0))
+    return weight
 
 
 def get_path_length(G, path_nodes):
@@ -135,20 +153,17 @@ def get_path_coordinates(G, path_nodes):
     return coords
 
 
-def penalize_path_edges(G, path_nodes, original_weights, penalty_multiplier=None):
-    """Pénalise les arêtes d'un chemin pour dissuader leur réutilisation."""
+def penalize_path_edges(G, path_nodes, penalties, used_edges=None, base_penalties=None, penalty_multiplier=None):
+    """
+    Pénalise les arêtes d'un chemin pour dissuader leur réutilisation, dans penalties et non dans le graphe.
+    used_edges : compteurs de passage partagés entre appels pour cumuler la pénalité ;
+    base_penalties : pénalités déjà en vigueur, servant de longueurs de base.
+    """
     if penalty_multiplier is None:
         penalty_multiplier = REUSE_PENALTY_MULTIPLIER
-    used_edges = {}
-    for i in range(len(path_nodes) - 1):
-        u, v = path_nodes[i], path_nodes[i + 1]
-        edge_key = (u, v) if (u, v) in original_weights else (v, u)
-        count = used_edges.get(edge_key, 0)
-        used_edges[edge_key] = count + 1
-        new_weight = original_weights[edge_key] * (1 + penalty_multiplier * (count + 1))
-        if G.has_edge(u, v):
-            G[u][v]["length"] = new_weight
-        if G.has_edge(v, u):
-            G[v][u]["length"] = new_weight
-
-
+    used_edges = {} if used_edges is None else used_edges
+    for u, v in zip(path_nodes[:-1], path_nodes[1:]):
+        count = used_edges.get((u, v), 0) + 1
+        used_edges[(u, v)] = count
+        new_weight = edge_length(G, u, v, base_penalties) * (1 + penalty_multiplier * count)
+        penalties[(u, v)] = penalties[(v, u)] = new_weight
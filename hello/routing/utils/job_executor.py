@@ -0,0 +1,302 @@
+"""
+Exécuteur des calculs d'itinéraire, borné par processus web.
+Nombre de calculs simultanés (ROUTING_MAX_WORKERS) et taille de la file d'attente
+(ROUTING_MAX_QUEUE) limités : au-delà, la demande est refusée avec un délai conseillé.
+Expose la position de chaque demande dans la file et des métriques (profondeur, attentes, durées).
+
+Deux backends (ROUTING_EXECUTOR_BACKEND) :
+- "thread" : pool de threads du processus web (un seul cœur utilisé pour le calcul, GIL) ;
+- "process" : pool de processus ; chaque worker précharge les massifs (ROUTING_PRELOAD_MASSIFS),
+  ne reçoit que les paramètres de la demande, renvoie l'avancement par une file IPC
+  et est recyclé après ROUTING_PROCESS_MAX_TASKS calculs.
+"""
+
+import itertools
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RECENT_JOBS = 200           # fenêtre des attentes et durées récentes pour les métriques
+DEFAULT_RETRY_AFTER_S = 5
+
+
+class QueueFull(Exception):
+    """File d'attente pleine ; retry_after : délai conseillé (secondes) avant de réessayer."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"File de calcul pleine, réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+def _summary(values):
+    if not values:
+        return {"avg": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "avg": round(sum(ordered) / len(ordered), 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def _run_route(token, job_id, params, emit):
+    """
+    Calcule l'itinéraire ; emit(token, type, message, progress, partial) signale le démarrage,
+    l'avancement et les résultats intermédiaires de cette soumission.
+    """
+    # Import différé : le module reste léger à importer dans les workers avant leur initialisation
+    from hello.routing.trouver_chemin import compute_best_route
+    from hello.routing.domain.deadline import request_deadline
+
+    emit(token, "started")
+    return compute_best_route(
+        **params,
+        status_callback=lambda message, progress=None, partial=None: emit(token, "progress", message, progress, partial),
+        deadline=request_deadline(job_id),
+    )
+
+
+# --- Côté worker (backend "process") ---
+
+_worker_events = None
+
+
+def _init_worker(events, massifs):
+    """Initialisation d'un worker : Django, file d'événements, préchargement des massifs."""
+    global _worker_events
+    import django
+    django.setup()
+    _worker_events = events
+
+    from hello.routing.utils.files_tools import load_massif_data
+    for massif in massifs:
+        try:
+            load_massif_data(massif)
+        except Exception as e:
+            logger.warning(f"Préchargement du massif {massif} impossible : {e}")
+
+
+def _worker_emit(token, kind, message=None, progress=None, partial=None):
+    _worker_events.put((token, kind, message, progress, partial))
+
+
+def _run_route_in_worker(token, job_id, params):
+    return _run_route(token, job_id, params, _worker_emit)
+
+
+class RoutingExecutor:
+    """
+    Pool à file bornée ; chaque calcul est identifié par son job_id (request_id).
+    Le suivi interne est indexé par un jeton propre à chaque soumission : un calcul annulé qui
+    termine après la resoumission du même job_id ne touche pas au suivi de la nouvelle.
+    """
+
+    def __init__(self, max_workers, max_queue, backend="thread", max_tasks_per_child=None, preload_massifs=()):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.backend = backend
+        self._max_tasks_per_child = max_tasks_per_child
+        self._preload_massifs = list(preload_massifs)
+        self._lock = threading.Lock()
+        self._tokens = itertools.count()
+        self._current = {}              # job_id -> jeton de sa dernière soumission
+        self._queued = OrderedDict()    # jeton -> instant de soumission, dans l'ordre d'arrivée
+        self._running = {}              # jeton -> instant de démarrage
+        self._callbacks = {}            # jeton -> status_callback
+        self._futures = {}              # jeton -> Future, pour l'annulation des calculs en file
+        self._waits = deque(maxlen=RECENT_JOBS)
+        self._durations = deque(maxlen=RECENT_JOBS)
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+        if backend == "process":
+            ctx = multiprocessing.get_context("spawn")
+            self._events = ctx.Queue()
+            self._pool = self._new_process_pool(ctx)
+            threading.Thread(target=self._listen, name="routing-events", daemon=True).start()
+        elif backend == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="routing")
+        else:
+            raise ValueError(f"Backend de calcul inconnu : {backend}")
+
+    def _new_process_pool(self, ctx=None):
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=ctx or multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._events, self._preload_massifs),
+            max_tasks_per_child=self._max_tasks_per_child,
+        )
+
+    def _listen(self):
+        """Relaie les événements des workers (démarrage, avancement) vers les callbacks du processus web."""
+        while True:
+            try:
+                self._event(*self._events.get())
+            except Exception as e:
+                logger.warning(f"Événement de calcul ignoré : {e}")
+
+    def _event(self, token, kind, message=None, progress=None, partial=None):
+        if kind == "started":
+            now = time.monotonic()
+            with self._lock:
+                if token not in self._callbacks:  # événement tardif d'un calcul déjà terminé
+                    return
+                self._waits.append(now - self._queued.pop(token, now))
+                self._running[token] = now
+            message, progress = "Démarrage du calcul du tracé...", 0
+        callback = self._callbacks.get(token)
+        if callback:
+            callback(message, progress, partial=partial)
+
+    def _retry_after(self):
+        # Temps estimé pour écouler la file, à partir des durées récentes
+        avg = sum(self._durations) / len(self._durations) if self._durations else DEFAULT_RETRY_AFTER_S
+        return max(1, math.ceil(avg * (len(self._queued) + 1) / self.max_workers))
+
+    def submit(self, job_id, params, status_callback=None):
+        """
+        Met en file le calcul compute_best_route(**params) ; lève QueueFull si la file est pleine.
+        status_callback(message, progress, partial=None) reçoit l'avancement ; retourne un Future du GeoJSON.
+        """
+        with self._lock:
+            if len(self._queued) >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise QueueFull(self._retry_after())
+            token = f"{job_id}:{next(self._tokens)}"
+            self._current[job_id] = token
+            self._queued[token] = time.monotonic()
+            self._callbacks[token] = status_callback
+            self._counters["submitted"] += 1
+
+        try:
+            pool, future = self._pool_submit(token, job_id, params)
+        except BaseException:
+            # Soumission refusée (pool arrêté...) : le jeton ne doit pas rester compté dans la file
+            with self._lock:
+                self._forget(token, job_id)
+                self._counters["failed"] += 1
+            raise
+        with self._lock:
+            if token in self._callbacks:  # pas encore terminé (callback immédiat d'un Future déjà fini)
+                self._futures[token] = future
+        future.add_done_callback(lambda f: self._finished(token, job_id, f, pool))
+        return future
+
+    def _submit_to(self, pool, token, job_id, params):
+        if self.backend == "process":
+            return pool.submit(_run_route_in_worker, token, job_id, params)
+        return pool.submit(_run_route, token, job_id, params, self._event)
+
+    def _pool_submit(self, token, job_id, params):
+        """Soumet au pool courant, recréé une fois s'il est cassé ; retourne (pool, Future)."""
+        pool = self._pool
+        try:
+            return pool, self._submit_to(pool, token, job_id, params)
+        except BrokenProcessPool:
+            logger.warning("Pool de calcul cassé, recréation")
+            pool = self._replace_pool(pool)
+            return pool, self._submit_to(pool, token, job_id, params)
+
+    def _replace_pool(self, broken):
+        """
+        Remplace le pool cassé `broken` et l'arrête ; sur échecs simultanés, un seul nouveau pool
+        est créé (les suivants trouvent le pool déjà remplacé). Retourne le pool courant.
+        """
+        with self._lock:
+            if self._pool is not broken:
+                return self._pool
+            self._pool = self._new_process_pool()
+            pool = self._pool
+        broken.shutdown(wait=False, cancel_futures=True)
+        return pool
+
+    def cancel(self, job_id):
+        """
+        Retire de la file un calcul pas encore démarré (True si retiré) ; un calcul en cours
+        s'arrête de lui-même à la prochaine vérification de son échéance (request_deadline).
+        """
+        with self._lock:
+            future = self._futures.get(self._current.get(job_id))
+        return future is not None and future.cancel()
+
+    def _forget(self, token, job_id):
+        """Retire le jeton du suivi (appelé sous self._lock) ; retourne son instant de démarrage."""
+        self._queued.pop(token, None)
+        self._callbacks.pop(token, None)
+        self._futures.pop(token, None)
+        if self._current.get(job_id) == token:
+            del self._current[job_id]
+        return self._running.pop(token, None)
+
+    def _finished(self, token, job_id, future, pool):
+        now = time.monotonic()
+        failed = future.cancelled() or future.exception() is not None
+        with self._lock:
+            started = self._forget(token, job_id)
+            if started is not None:
+                self._durations.append(now - started)
+            self._counters["failed" if failed else "completed"] += 1
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            logger.warning("Worker de calcul interrompu, recréation du pool")
+            self._replace_pool(pool)
+
+    def queue_position(self, job_id):
+        """Position (1 = prochaine) dans la file, 0 si en cours de calcul, None si inconnue de ce processus."""
+        with self._lock:
+            token = self._current.get(job_id)
+            if token in self._running:
+                return 0
+            for position, queued_token in enumerate(self._queued, start=1):
+                if queued_token == token:
+                    return position
+        return None
+
+    def queue_depth(self):
+        """Nombre de calculs en attente dans ce processus."""
+        with self._lock:
+            return len(self._queued)
+
+    def metrics(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "backend": self.backend,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": len(self._queued),
+                "running": len(self._running),
+                "oldest_wait_s": round(now - next(iter(self._queued.values())), 3) if self._queued else 0.0,
+                **self._counters,
+                "wait_s": _summary(list(self._waits)),
+                "duration_s": _summary(list(self._durations)),
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Exécuteur du processus, créé au premier usage (après un fork gunicorn)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = RoutingExecutor(
+                settings.ROUTING_MAX_WORKERS, settings.ROUTING_MAX_QUEUE,
+                backend=settings.ROUTING_EXECUTOR_BACKEND,
+                max_tasks_per_child=settings.ROUTING_PROCESS_MAX_TASKS,
+                preload_massifs=settings.ROUTING_PRELOAD_MASSIFS,
+            )
+            logger.info(
+                f"Exécuteur de calcul ({_executor.backend}) : {_executor.max_workers} workers, "
+                f"file de {_executor.max_queue}"
+            )
+        return _executor
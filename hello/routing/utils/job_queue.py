@@ -0,0 +1,205 @@
+"""
+File durable des calculs d'itinéraire (SQLite), partagée entre le web et les workers.
+Le web ne fait qu'enfiler (`enqueue`) et lire l'état ; la commande `manage.py routing_worker`
+prend les demandes (`claim`) avec un délai de visibilité : un calcul dont le worker disparaît
+redevient disponible à l'expiration du bail, dans la limite de max_attempts tentatives.
+Les identifiants sont idempotents : enfiler un job_id en file ou en cours ne crée rien ;
+un job_id terminé est remis en file (nouveau calcul).
+"""
+
+import json
+import logging
+import os
+import time
+from django.conf import settings
+
+from .sqlite_tools import connect
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PATH = os.path.join(settings.BASE_DIR, "data", "state", "routing_jobs.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    worker TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state_visible ON jobs (state, visible_at);
+"""
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def _connect():
+    conn = connect(QUEUE_PATH)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _transaction(fn):
+    """Exécute fn(conn) dans une transaction d'écriture (BEGIN IMMEDIATE) et retourne son résultat."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        result = fn(conn)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def enqueue(job_id, payload, max_attempts=None):
+    """Enfile un calcul ; retourne False si ce job_id est déjà en file ou en cours (rien n'est modifié)."""
+    max_attempts = settings.ROUTING_JOB_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    now = time.time()
+
+    def insert(conn):
+        cursor = conn.execute(
+            "INSERT INTO jobs (id, payload, state, max_attempts, enqueued_at, visible_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET payload = excluded.payload, state = excluded.state, attempts = 0, "
+            "max_attempts = excluded.max_attempts, enqueued_at = excluded.enqueued_at, "
+            "visible_at = excluded.visible_at, worker = NULL, error = NULL "
+            "WHERE jobs.state IN (?, ?)",
+            (job_id, json.dumps(payload, ensure_ascii=False), QUEUED, max_attempts, now, now, DONE, FAILED),
+        )
+        return cursor.rowcount == 1
+
+    return _transaction(insert)
+
+
+def claim(worker_id, visibility_timeout):
+    """
+    Prend la plus ancienne demande disponible (en file, ou en cours dont le bail a expiré).
+    Retourne (job_id, payload, attempts, expired) : expired liste les job_id abandonnés
+    faute de tentatives restantes (à signaler en échec). job_id vaut None si rien n'est disponible.
+    """
+    now = time.time()
+
+    def take(conn):
+        expired = [row[0] for row in conn.execute(
+            "SELECT id FROM jobs WHERE state = ? AND visible_at <= ? AND attempts >= max_attempts",
+            (RUNNING, now),
+        )]
+        if expired:
+            conn.executemany(
+                "UPDATE jobs SET state = ?, visible_at = ?, error = ? WHERE id = ?",
+                [(FAILED, now, "Délai de traitement dépassé", job_id) for job_id in expired],
+            )
+        row = conn.execute(
+            "SELECT id, payload, attempts FROM jobs "
+            "WHERE state IN (?, ?) AND visible_at <= ? AND attempts < max_attempts "
+            "ORDER BY enqueued_at LIMIT 1",
+            (QUEUED, RUNNING, now),
+        ).fetchone()
+        if row is None:
+            return None, None, 0, expired
+        job_id, payload, attempts = row
+        conn.execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, visible_at = ?, worker = ? WHERE id = ?",
+            (RUNNING, now + visibility_timeout, worker_id, job_id),
+        )
+        return job_id, json.loads(payload), attempts + 1, expired
+
+    return _transaction(take)
+
+
+def extend(job_id, worker_id, visibility_timeout):
+    """Prolonge le bail d'un calcul en cours ; False si le worker ne le détient plus."""
+    def touch(conn):
+        cursor = conn.execute(
+            "UPDATE jobs SET visible_at = ? WHERE id = ? AND state = ? AND worker = ?",
+            (time.time() + visibility_timeout, job_id, RUNNING, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    return _transaction(touch)
+
+
+def complete(job_id, worker_id):
+    """Marque le calcul terminé ; False s'il n'est plus en cours pour ce worker (annulé, repris)."""
+    return _transaction(lambda conn: conn.execute(
+        "UPDATE jobs SET state = ?, visible_at = ?, error = NULL WHERE id = ? AND worker = ? AND state = ?",
+        (DONE, time.time(), job_id, worker_id, RUNNING),
+    ).rowcount == 1)
+
+
+def cancel(job_id):
+    """Abandonne un calcul en file ou en cours (sans nouvelle tentative) ; False s'il est déjà terminé."""
+    return _transaction(lambda conn: conn.execute(
+        "UPDATE jobs SET state = ?, visible_at = ?, error = ? WHERE id = ? AND state IN (?, ?)",
+        (FAILED, time.time(), "Calcul annulé", job_id, QUEUED, RUNNING),
+    ).rowcount == 1)
+
+
+def fail(job_id, worker_id, error, retry_delay):
+    """Enregistre un échec ; retourne True si le calcul est remis en file pour une nouvelle tentative."""
+    def record(conn):
+        row = conn.execute(
+            "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND state = ?",
+            (job_id, worker_id, RUNNING),
+        ).fetchone()
+        if row is None:
+            return False
+        retry = row[0] < row[1]
+        conn.execute(
+            "UPDATE jobs SET state = ?, visible_at = ?, error = ? WHERE id = ?",
+            (QUEUED if retry else FAILED, time.time() + retry_delay, error, job_id),
+        )
+        return retry
+
+    return _transaction(record)
+
+
+def purge(older_than_s):
+    """Supprime les demandes terminées (ou abandonnées) depuis plus de older_than_s secondes."""
+    return _transaction(lambda conn: conn.execute(
+        "DELETE FROM jobs WHERE state IN (?, ?) AND visible_at < ?", (DONE, FAILED, time.time() - older_than_s)
+    ).rowcount)
+
+
+def queue_position(job_id):
+    """Position (1 = prochaine) parmi les demandes en file, 0 si en cours, None si terminée ou inconnue."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT state, enqueued_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[0] in (DONE, FAILED):
+            return None
+        if row[0] == RUNNING:
+            return 0
+        ahead = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = ? AND enqueued_at < ?", (QUEUED, row[1])
+        ).fetchone()[0]
+        return ahead + 1
+    finally:
+        conn.close()
+
+
+def queue_depth():
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def queue_stats():
+    """Nombre de demandes par état et ancienneté (s) de la plus vieille demande en file."""
+    conn = _connect()
+    try:
+        stats = {state: 0 for state in (QUEUED, RUNNING, DONE, FAILED)}
+        stats.update(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+        stats["oldest_wait_s"] = round(time.time() - oldest, 3) if oldest else 0.0
+        return stats
+    finally:
+        conn.close()
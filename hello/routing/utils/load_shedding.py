@@ -0,0 +1,90 @@
+"""
+Mode dégradé (délestage) : sous charge, les étapes coûteuses du calcul sont sautées ou approchées
+plutôt que de laisser les demandes dépasser leur délai.
+Déclenchement manuel (ROUTING_DEGRADED_MODE = 'on' / 'off') ou automatique ('auto') :
+- file de calcul d'au moins DEGRADED_QUEUE_DEPTH demandes : toutes les étapes sont dégradées ;
+- latence moyenne d'une API amont au-delà de DEGRADED_UPSTREAM_LATENCY_S : l'étape qui en dépend.
+Les latences sont des moyennes mobiles gardées en mémoire par chaque processus : celui qui reçoit
+la demande et celui qui fait le calcul (worker de la file, process du pool) appliquent chacun
+les étapes liées aux API qu'ils ont vues lentes.
+"""
+
+import logging
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Étapes dégradables, dans l'ordre d'affichage
+TRANSIT_CACHE_ONLY = "transit_cache_only"       # retour TC : réponses Google en cache uniquement
+ELEVATION_NODES_ONLY = "elevation_nodes_only"   # altitudes des nœuds du graphe, sans MNT ni API
+SKIP_NEAR_POIS = "skip_near_pois"               # pas d'extraction des POI proches du tracé
+NO_GPX = "no_gpx"                               # téléchargement GPX refusé
+DEGRADED_STAGES = (TRANSIT_CACHE_ONLY, ELEVATION_NODES_ONLY, SKIP_NEAR_POIS, NO_GPX)
+
+# API amont -> étape dégradée quand elle est lente
+UPSTREAM_STAGES = {
+    "google_routes": TRANSIT_CACHE_ONLY,
+    "open_elevation": ELEVATION_NODES_ONLY,
+}
+
+LATENCY_ALPHA = 0.2             # poids de la dernière mesure dans la moyenne mobile
+LATENCY_TTL_S = 10 * 60         # sans appel depuis ce délai, la latence mesurée est oubliée
+
+
+# API amont -> (moyenne mobile en s, instant monotone de la dernière mesure)
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+
+def _recent(entry, now):
+    return entry is not None and now - entry[1] <= LATENCY_TTL_S
+
+
+def record_upstream_latency(upstream, seconds):
+    """Ajoute une mesure (s) à la moyenne mobile de l'API amont (mémoire du processus, sans E/S)."""
+    now = time.monotonic()
+    with _latencies_lock:
+        entry = _latencies.get(upstream)
+        if _recent(entry, now):
+            seconds = LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * entry[0]
+        _latencies[upstream] = (seconds, now)
+
+
+def upstream_latency(upstream):
+    """Latence moyenne récente (s) de l'API amont mesurée par ce processus, None sans mesure récente."""
+    entry = _latencies.get(upstream)
+    return entry[0] if _recent(entry, time.monotonic()) else None
+
+
+def _ordered(stages):
+    return [stage for stage in DEGRADED_STAGES if stage in stages]
+
+
+def upstream_stages():
+    """Étapes à dégrader (mode 'auto') pour les API amont vues lentes par ce processus."""
+    if settings.ROUTING_DEGRADED_MODE != "auto":
+        return []
+    return _ordered({
+        stage for upstream, stage in UPSTREAM_STAGES.items()
+        if (upstream_latency(upstream) or 0) > settings.DEGRADED_UPSTREAM_LATENCY_S
+    })
+
+
+def merge_stages(*stage_lists):
+    """Union de listes d'étapes, dans l'ordre de DEGRADED_STAGES."""
+    return _ordered({stage for stages in stage_lists for stage in stages})
+
+
+def degraded_stages(queue_depth=None):
+    """Étapes à dégrader pour un calcul lancé maintenant ; queue_depth : demandes en attente."""
+    mode = settings.ROUTING_DEGRADED_MODE
+    if mode == "off":
+        return []
+    if mode == "on":
+        return list(DEGRADED_STAGES)
+
+    if queue_depth is not None and queue_depth >= settings.DEGRADED_QUEUE_DEPTH:
+        return list(DEGRADED_STAGES)
+    return upstream_stages()
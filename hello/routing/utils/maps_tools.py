@@ -1,30 +1,94 @@
 """
 Appels à l'API Google Maps Routes.
+Les réponses, limitées par le FieldMask aux champs lus par le calcul et par le front, sont gardées
+dans le cache "transit" (TRANSIT_RESPONSE_CACHE_TTL) ; en mode dégradé
+(cache_only), seules les réponses en cache sont utilisées. La latence de l'API alimente
+le déclenchement automatique du mode dégradé.
 """
 
+import logging
 import os
+import time
 import requests
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
+from django.core.cache import caches
+
+from hello.constants import TRANSIT_RESPONSE_CACHE_TTL
+from .load_shedding import record_upstream_latency
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 _ROUTES_URL = "https://routes.googleapis.com/directions/v2:computeRoutes"
 
+# Champs lus : durée du trajet, mode et fin de chaque étape, détail des étapes en transport
+# (horaires, arrêts, ligne) affiché par le front (voir compact_route.slim_transit)
+_FIELD_MASK = ",".join(f"routes.legs.{field}" for field in (
+    "duration",
+    "steps.travelMode",
+    "steps.endLocation",
+    "steps.transitDetails.stopDetails",
+    "steps.transitDetails.headsign",
+    "steps.transitDetails.transitLine.name",
+    "steps.transitDetails.transitLine.nameShort",
+    "steps.transitDetails.transitLine.vehicle.name",
+    "steps.transitDetails.transitLine.agencies.uri",
+))
+
+
+class TransitNotCached(RuntimeError):
+    """Mode cache seul : aucune réponse en cache pour ce trajet."""
+
+
+def _local(when):
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        return when.replace(tzinfo=ZoneInfo("Europe/Paris"))
+    return when
 
-def call_maps_routes_api(origin_latlon, destination_latlon, departure_time=None, arrival_time=None):
+
+def _response_key(origin_latlon, destination_latlon, departure_time, arrival_time):
+    """Clé du trajet (extrémités, sens de la contrainte horaire, minute locale) ; None sans horaire."""
+    when = departure_time or arrival_time
+    if when is None:
+        return None
+    return (
+        f"transit_route:{origin_latlon[0]:.5f}:{origin_latlon[1]:.5f}:"
+        f"{destination_latlon[0]:.5f}:{destination_latlon[1]:.5f}:"
+        f"{'dep' if departure_time else 'arr'}:{when.astimezone(ZoneInfo('Europe/Paris')):%Y%m%d%H%M}"
+    )
+
+
+def call_maps_routes_api(origin_latlon, destination_latlon, departure_time=None, arrival_time=None,
+                         cache_only=False):
     """
     Appel à l'API Google Maps Routes v2 en mode TRANSIT.
     origin_latlon, destination_latlon : tuples (lat, lon)
+    cache_only : ne renvoie qu'une réponse en cache (TransitNotCached sinon), sans appel réseau.
     """
+    departure_time, arrival_time = _local(departure_time), _local(arrival_time)
+    key = _response_key(origin_latlon, destination_latlon, departure_time, arrival_time)
+    try:
+        cached = caches["transit"].get(key) if key else None
+    except Exception as e:
+        logger.warning(f"Lecture cache des trajets TC impossible : {e}")
+        cached = None
+    if cached is not None:
+        return cached
+    if cache_only:
+        raise TransitNotCached("Trajet TC absent du cache (mode dégradé)")
+
     def _loc(latlon):
         return {"location": {"latLng": {"latitude": latlon[0], "longitude": latlon[1]}}}
 
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": GOOGLE_MAPS_API_KEY,
-        "X-Goog-FieldMask": "*",
+        "X-Goog-FieldMask": _FIELD_MASK,
     }
     body = {
         "origin": _loc(origin_latlon),
@@ -33,14 +97,21 @@ def call_maps_routes_api(origin_latlon, destination_latlon, departure_time=None,
         "transitPreferences": {"routingPreference": "FEWER_TRANSFERS"},
     }
     if departure_time is not None:
-        if departure_time.tzinfo is None:
-            departure_time = departure_time.replace(tzinfo=ZoneInfo("Europe/Paris"))
         body["departureTime"] = departure_time.isoformat()
     if arrival_time is not None:
-        if arrival_time.tzinfo is None:
-            arrival_time = arrival_time.replace(tzinfo=ZoneInfo("Europe/Paris"))
         body["arrivalTime"] = arrival_time.isoformat()
 
-    r = requests.post(_ROUTES_URL, headers=headers, json=body)
+    started = time.monotonic()
+    try:
+        r = requests.post(_ROUTES_URL, headers=headers, json=body)
+    finally:
+        record_upstream_latency("google_routes", time.monotonic() - started)
     r.raise_for_status()
-    return r.json()
+    data = r.json()
+
+    try:
+        if key:
+            caches["transit"].set(key, data, timeout=TRANSIT_RESPONSE_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Écriture cache des trajets TC impossible : {e}")
+    return data
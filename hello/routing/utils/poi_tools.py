@@ -13,8 +13,10 @@ from shapely.geometry import LineString, Point
 from networkx import NetworkXNoPath, shortest_path
 from django.conf import settings
 from hello.data_preparation.utils import slugify
-from hello.constants import REUSE_PENALTY_MULTIPLIER
-from .geotools import haversine, find_nearest_node, save_original_weights, restore_original_weights, get_path_length, angle_in_sector
+from .geotools import (
+    haversine, find_nearest_node, get_path_length, angle_in_sector, penalized_weight, penalize_path_edges,
+)
+from hello.routing.domain.deadline import BudgetExhausted
 
 
 def get_massif_center(massif_name="Chartreuse"):
@@ -108,12 +110,13 @@ def filter_poi_by_path_distance(poi_data, path_coords, excluded_poi_ids=None, ma
     return {"type": poi_data.get("type", "FeatureCollection"), "features": filtered_features}
 
 
-def collect_buffer_pois(poi_data, start_coord, end_coord, max_distance_m, randomness):
+def collect_buffer_pois(poi_data, start_coord, end_coord, max_distance_m, randomness, rng=None):
     """Collecte les POI dans le buffer autour de la ligne directe, 5 premiers triés par score."""
     direct_line = LineString([start_coord, end_coord])
     buffer_km = 10 if max_distance_m >= 20000 else 2
     buffer_geom = direct_line.buffer(buffer_km / 111.0, cap_style=2)
 
+    rng = rng or random
     pois = []
     for feat in poi_data.get("features", []):
         if buffer_geom.contains(Point(feat["geometry"]["coordinates"])):
@@ -121,7 +124,7 @@ def collect_buffer_pois(poi_data, start_coord, end_coord, max_distance_m, random
             pois.append({
                 "id": feat["properties"].get("titre"),
                 "coord": tuple(feat["geometry"]["coordinates"]),
-                "score": (1 - randomness) * base_score + randomness * random.uniform(0, 1),
+                "score": (1 - randomness) * base_score + randomness * rng.uniform(0, 1),
                 "properties": feat["properties"],
                 "projection": direct_line.project(Point(feat["geometry"]["coordinates"])),
             })
@@ -129,8 +132,15 @@ def collect_buffer_pois(poi_data, start_coord, end_coord, max_distance_m, random
     return pois[:5]
 
 
-def _greedy_poi_selection(G, start_node, pois_by_projection, max_distance_m, original_weights):
-    """Sélection gloutonne des POI dans l'ordre de projection, avec pénalité de réutilisation."""
+def _greedy_poi_selection(G, start_node, pois_by_projection, max_distance_m, penalties, base_penalties=None,
+                          deadline=None):
+    """
+    Sélection gloutonne des POI dans l'ordre de projection, avec pénalité de réutilisation
+    (ajoutée à penalties, le graphe n'est pas modifié ; base_penalties : pénalités de départ).
+    deadline : délai dépassé ou budget épuisé, la sélection s'arrête aux POI déjà retenus ;
+    ses expansions sont comptées par sa fonction de poids, qui interrompt la recherche en cours.
+    """
+    weight = deadline.weight(penalties=penalties) if deadline else penalized_weight(penalties)
     used_edges = {}
     partial_path = [start_node]
     current_node = start_node
@@ -138,36 +148,35 @@ def _greedy_poi_selection(G, start_node, pois_by_projection, max_distance_m, ori
     selected = []
 
     for poi in pois_by_projection:
+        if deadline and deadline.exhausted():
+            logger.warning(f"Budget de recherche épuisé : {len(selected)} POI retenus")
+            break
         poi_node = find_nearest_node(G, poi["coord"][::-1])
         try:
-            segment = shortest_path(G, current_node, poi_node, weight="length")
+            segment = shortest_path(G, current_node, poi_node, weight=weight)
             seg_len = get_path_length(G, segment)
             if seg_len > remaining:
                 continue
             selected.append(poi)
-            for i in range(len(segment) - 1):
-                u, v = segment[i], segment[i + 1]
-                key = (u, v) if (u, v) in original_weights else (v, u)
-                count = used_edges.get(key, 0)
-                used_edges[key] = count + 1
-                new_w = original_weights[key] * (1 + REUSE_PENALTY_MULTIPLIER * (count + 1))
-                if G.has_edge(u, v): G[u][v]["length"] = new_w
-                if G.has_edge(v, u): G[v][u]["length"] = new_w
+            penalize_path_edges(G, segment, penalties, used_edges=used_edges, base_penalties=base_penalties)
             partial_path.extend(segment[1:])
             current_node = poi_node
             remaining -= seg_len
         except NetworkXNoPath:
             continue
+        except BudgetExhausted as e:
+            logger.warning(f"Budget de recherche épuisé en cours de recherche ({e}) : {len(selected)} POI retenus")
+            break
 
     return selected, partial_path, current_node, remaining
 
 
-def _finalize_path_to_end(G, selected, partial_path, start_node, end_node, remaining):
-    """Valide et construit le chemin final jusqu'à l'arrivée."""
+def _finalize_path_to_end(G, selected, partial_path, start_node, end_node, remaining, weight="length"):
+    """Valide et construit le chemin final jusqu'à l'arrivée (weight : poids pénalisé de la sélection)."""
     if not selected:
         return [], []
     try:
-        final_seg = shortest_path(G, partial_path[-1], end_node, weight="length")
+        final_seg = shortest_path(G, partial_path[-1], end_node, weight=weight)
         if get_path_length(G, final_seg) <= remaining:
             return selected, partial_path + final_seg[1:]
 
@@ -177,9 +186,9 @@ def _finalize_path_to_end(G, selected, partial_path, start_node, end_node, remai
             partial_path = [start_node]
             for p in selected:
                 poi_node = find_nearest_node(G, p["coord"][::-1])
-                seg = shortest_path(G, partial_path[-1], poi_node, weight="length")
+                seg = shortest_path(G, partial_path[-1], poi_node, weight=weight)
                 partial_path.extend(seg[1:])
-            final_seg = shortest_path(G, partial_path[-1], end_node, weight="length")
+            final_seg = shortest_path(G, partial_path[-1], end_node, weight=weight)
             return selected, partial_path + final_seg[1:]
         return [], []
     except NetworkXNoPath:
@@ -188,8 +197,11 @@ def _finalize_path_to_end(G, selected, partial_path, start_node, end_node, remai
         return [], []
 
 
-def build_optimal_poi_path(start_coord, end_coord, all_pois, max_distance_m, G):
-    """Sélectionne la séquence optimale de POI et construit le chemin complet."""
+def build_optimal_poi_path(start_coord, end_coord, all_pois, max_distance_m, G, deadline=None, penalties=None):
+    """
+    Sélectionne la séquence optimale de POI et construit le chemin complet.
+    penalties : pénalités de réutilisation déjà en vigueur (ex. aller d'une boucle), non modifiées.
+    """
     start_node = find_nearest_node(G, start_coord[::-1])
     end_node = find_nearest_node(G, end_coord[::-1])
 
@@ -198,16 +210,16 @@ def build_optimal_poi_path(start_coord, end_coord, all_pois, max_distance_m, G):
     except NetworkXNoPath:
         return [], []
 
-    original_weights = save_original_weights(G)
+    search_penalties = dict(penalties or {})
     pois_by_projection = sorted(all_pois, key=lambda x: x["projection"])
 
     selected, partial_path, _, remaining = _greedy_poi_selection(
-        G, start_node, pois_by_projection, max_distance_m, original_weights
+        G, start_node, pois_by_projection, max_distance_m, search_penalties, base_penalties=penalties,
+        deadline=deadline,
     )
     selected, final_path = _finalize_path_to_end(
-        G, selected, partial_path, start_node, end_node, remaining
+        G, selected, partial_path, start_node, end_node, remaining, weight=penalized_weight(search_penalties),
     )
-    restore_original_weights(G, original_weights)
     return selected, final_path
 
 
@@ -229,11 +241,11 @@ def resolve_pois(poi_data, requested_pois, G):
     return selected
 
 
-def sort_pois_polar(pois, massif):
+def sort_pois_polar(pois, massif, rng=None):
     """Trie les POI par angle polaire autour du centre du massif, direction aléatoire."""
     center_lon, center_lat = get_massif_center(massif)
     pois.sort(key=lambda p: math.atan2(p["coord"][1] - center_lat, p["coord"][0] - center_lon))
-    if random.random() < 0.5:
+    if (rng or random).random() < 0.5:
         pois = list(reversed(pois))
     return pois
 
@@ -277,14 +289,15 @@ def find_poi_candidates(current_coord, poi_data, max_distance, visited_pois, pat
     return candidates
 
 
-def select_best_poi(candidates, randomness):
+def select_best_poi(candidates, randomness, rng=None):
     """Sélectionne le meilleur POI avec score composite (base + proximité + bruit)."""
     if not candidates:
         return None
+    rng = rng or random
     scored = []
     for poi in candidates:
         proximity_bonus = max(0, (5000 - poi["distance"]) / 5000) * 0.3
-        scored.append({**poi, "final_score": poi["score"] + proximity_bonus + random.uniform(-randomness, randomness)})
+        scored.append({**poi, "final_score": poi["score"] + proximity_bonus + rng.uniform(-randomness, randomness)})
     return max(scored, key=lambda x: x["final_score"])
 
 
@@ -0,0 +1,66 @@
+"""
+Graines reproductibles, regroupement des demandes identiques et cache des résultats.
+Une demande est identifiée par (paramètres, graine, version des données du massif) ;
+le cache (alias "routes") associe cette clé à l'itinéraire du stockage adressé par contenu
+pendant ROUTE_RESULT_CACHE_TTL secondes.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+from hello.constants import ROUTE_SEED_WINDOW_S
+from .files_tools import massif_data_version
+from .route_store import load_route
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(params):
+    return json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def default_seed(params, now=None):
+    """Graine dérivée des paramètres et de la fenêtre de ROUTE_SEED_WINDOW_S en cours (52 bits)."""
+    window = int((time.time() if now is None else now) // ROUTE_SEED_WINDOW_S)
+    digest = hashlib.sha256(f"{_canonical(params)}|{window}".encode("utf-8")).hexdigest()
+    return int(digest[:13], 16)
+
+
+def request_key(params, seed):
+    """Clé de la demande (32 caractères hexadécimaux), utilisée aussi comme identifiant de calcul."""
+    version = massif_data_version(params.get("massif", ""))
+    return hashlib.sha256(f"{_canonical(params)}|{seed}|{version}".encode("utf-8")).hexdigest()[:32]
+
+
+def get_cached_result(key):
+    """Résultat déjà calculé pour cette clé, ou None (absent, expiré ou évincé du stockage)."""
+    try:
+        entry = caches["routes"].get(key)
+    except Exception as e:
+        logger.warning(f"Lecture cache itinéraires impossible : {e}")
+        return None
+    if not entry:
+        return None
+    result = load_route(entry["route_id"])
+    if result is None:
+        return None
+    result.update(entry)
+    logger.info(f"Itinéraire {entry['route_id']} servi depuis le cache")
+    return result
+
+
+def cache_result(key, result):
+    if not result.get("route_id"):
+        return
+    # Un tracé calculé en mode dégradé ne doit pas être resservi une fois la charge retombée
+    if any(feat.get("properties", {}).get("degraded") for feat in result.get("features", [])):
+        return
+    entry = {"route_id": result["route_id"], "generated_filename": result.get("generated_filename")}
+    try:
+        caches["routes"].set(key, entry, timeout=settings.ROUTE_RESULT_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Écriture cache itinéraires impossible : {e}")
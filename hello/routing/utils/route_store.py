@@ -0,0 +1,142 @@
+"""
+Stockage des itinéraires générés, adressé par contenu.
+Chaque résultat est sérialisé en JSON compact, identifié par le hash de ces octets
+et conservé pré-compressé (gzip, et brotli si disponible) dans ROUTE_STORE_DIR.
+Les itinéraires identiques sont dédupliqués ; les plus anciens sont évincés par âge et par taille totale.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # compression brotli facultative
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ROUTE_KEY_RE = re.compile(r"^[0-9a-f]{32}$")
+EVICTION_INTERVAL_S = 300
+
+_last_eviction = 0.0
+_eviction_lock = threading.Lock()
+
+
+def _route_dir(key):
+    return os.path.join(str(settings.ROUTE_STORE_DIR), key[:2])
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def put_route(result):
+    """Enregistre le résultat (dict GeoJSON) et retourne sa clé (32 caractères hexadécimaux)."""
+    payload = json.dumps(result, separators=(",", ":"), ensure_ascii=False, sort_keys=True).encode("utf-8")
+    key = hashlib.sha256(payload).hexdigest()[:32]
+    route_dir = _route_dir(key)
+    gz_path = os.path.join(route_dir, f"{key}.json.gz")
+
+    if os.path.exists(gz_path):
+        # Déjà présent : on rafraîchit seulement la date (l'éviction par âge repart de zéro)
+        os.utime(gz_path)
+        logger.info(f"Itinéraire {key} déjà stocké (dédupliqué)")
+    else:
+        os.makedirs(route_dir, exist_ok=True)
+        _write_atomic(gz_path, gzip.compress(payload, compresslevel=6, mtime=0))
+        if brotli is not None:
+            _write_atomic(os.path.join(route_dir, f"{key}.json.br"), brotli.compress(payload, quality=9))
+        logger.info(f"Itinéraire {key} stocké ({len(payload)} octets bruts)")
+
+    _maybe_evict()
+    return key
+
+
+def route_variants(key):
+    """Fichiers pré-compressés disponibles pour une clé : {"br": chemin, "gzip": chemin} ; vide si inconnue."""
+    if not ROUTE_KEY_RE.match(key or ""):
+        return {}
+    route_dir = _route_dir(key)
+    variants = {
+        "br": os.path.join(route_dir, f"{key}.json.br"),
+        "gzip": os.path.join(route_dir, f"{key}.json.gz"),
+    }
+    return {encoding: path for encoding, path in variants.items() if os.path.isfile(path)}
+
+
+def load_route(key):
+    """Résultat (dict) d'une clé, ou None."""
+    gz_path = route_variants(key).get("gzip")
+    if gz_path is None:
+        return None
+    with gzip.open(gz_path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def evict_routes(max_bytes=None, max_age_s=None):
+    """
+    Supprime les itinéraires plus vieux que max_age_s, puis les plus anciens
+    jusqu'à repasser sous max_bytes. Retourne le nombre de fichiers supprimés.
+    """
+    max_bytes = settings.ROUTE_STORE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_s = settings.ROUTE_STORE_MAX_AGE_DAYS * 86400 if max_age_s is None else max_age_s
+    root = str(settings.ROUTE_STORE_DIR)
+    if not os.path.isdir(root):
+        return 0
+
+    # Les variantes d'une même clé sont évincées ensemble, selon la date du .gz
+    entries = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            key = filename.split(".", 1)[0]
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = entries.setdefault(key, {"paths": [], "size": 0, "mtime": 0.0})
+            entry["paths"].append(path)
+            entry["size"] += stat.st_size
+            if filename.endswith(".gz") or not entry["mtime"]:
+                entry["mtime"] = stat.st_mtime
+
+    now = time.time()
+    total = sum(e["size"] for e in entries.values())
+    removed = 0
+    for key, entry in sorted(entries.items(), key=lambda kv: kv[1]["mtime"]):
+        if now - entry["mtime"] <= max_age_s and total <= max_bytes:
+            break
+        for path in entry["paths"]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        total -= entry["size"]
+
+    if removed:
+        logger.info(f"Stockage itinéraires : {removed} fichiers évincés, {total} octets restants")
+    return removed
+
+
+def _maybe_evict():
+    """Éviction au plus une fois toutes les EVICTION_INTERVAL_S secondes par processus."""
+    global _last_eviction
+    with _eviction_lock:
+        if time.time() - _last_eviction < EVICTION_INTERVAL_S:
+            return
+        _last_eviction = time.time()
+    try:
+        evict_routes()
+    except Exception as e:
+        logger.warning(f"Erreur éviction stockage itinéraires : {e}")
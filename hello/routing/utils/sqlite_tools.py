@@ -0,0 +1,18 @@
+"""
+Connexions SQLite pour les stockages partagés entre workers (compteurs, caches, files).
+"""
+
+import os
+import sqlite3
+
+
+def connect(path):
+    """
+    Ouvre une connexion SQLite en mode WAL (lectures concurrentes, écritures sérialisées).
+    La connexion est en autocommit : les transactions sont ouvertes explicitement (BEGIN IMMEDIATE).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
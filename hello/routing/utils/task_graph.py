@@ -0,0 +1,28 @@
+"""
+Exécution d'un petit graphe de tâches dépendantes sur un pool de threads.
+Utilisé par l'orchestration pour faire se recouvrir les étapes d'I/O indépendantes.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+def run_task_graph(tasks, executor):
+    """
+    Exécute {nom: (fonction, [dépendances])} sur executor.
+    Chaque fonction reçoit les résultats de ses dépendances en arguments nommés
+    et démarre dès qu'elles sont terminées. Retourne {nom: résultat}.
+    La première exception d'une tâche est relevée (les tâches déjà lancées vont à leur terme).
+    """
+    results, futures = {}, {}
+    pending = dict(tasks)
+    while pending or futures:
+        ready = [name for name, (_, deps) in pending.items() if all(d in results for d in deps)]
+        for name in ready:
+            fn, deps = pending.pop(name)
+            futures[executor.submit(fn, **{d: results[d] for d in deps})] = name
+        if not futures:
+            raise ValueError(f"Dépendances introuvables ou cycliques : {sorted(pending)}")
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[futures.pop(future)] = future.result()
+    return results
@@ -90,17 +90,18 @@ document.addEventListener('DOMContentLoaded', () => {
         if (gmapsWarningModal) gmapsWarningModal.style.display = 'none';
     };
 
-    // Dernier nom de fichier généré côté serveur (ex: "route_... .geojson")
+    // Dernier nom de fichier généré côté serveur (ex: "route_... .geojson") et clé de stockage
     let lastGeneratedFilename = null;
+    let lastRouteId = null;
 
     function triggerGPXDownload() {
         const link = document.createElement('a');
         let gpxName = 'optimized_routes.gpx';
         let href = '/static/hello/data/optimized_routes.gpx';
-        if (lastGeneratedFilename) {
+        if (lastRouteId) {
             // remplacer l'extension .geojson par .gpx
-            gpxName = lastGeneratedFilename.replace(/\.geojson$/i, '.gpx');
-            href = `/static/hello/data/${gpxName}`;
+            if (lastGeneratedFilename) gpxName = lastGeneratedFilename.replace(/\.geojson$/i, '.gpx');
+            href = `/routes/${encodeURIComponent(lastRouteId)}.gpx`;
         }
         link.href = href;
         link.download = gpxName;
@@ -161,6 +162,20 @@ document.addEventListener('DOMContentLoaded', () => {
     let arrowDecorator = null;
     let poiLayer = null;
     let controlElevation = null;
+    let draftLayer = null;
+    let activeRequestId = null;     // calcul en cours, annulé si l'onglet est fermé ou une autre demande lancée
+
+    function cancelRoute(requestId) {
+        const body = new FormData();
+        body.append('request_id', requestId);
+        navigator.sendBeacon('/cancel_route/', body);
+    }
+
+    window.addEventListener('pagehide', () => {
+        if (activeRequestId) {
+            cancelRoute(activeRequestId);
+        }
+    });
 
     // Vérification des dates
     const depInput = document.getElementById('departure_datetime');
@@ -271,14 +286,21 @@ document.addEventListener('DOMContentLoaded', () => {
                 legendDiv.innerHTML = `
                     <p><strong>Distance totale :</strong> ${(totalLength/1000).toFixed(2)} km</p>
                     <p><strong>Dénivelé positif :</strong> ${props.path_elevation ?? 'N/A'} m</p>
-                    <p><strong>Altitude minimale :</strong> ${minEle.toFixed(0)} m</p>
-                    <p><strong>Altitude maximale :</strong> ${maxEle.toFixed(0)} m</p>
+                    <p><strong>Dénivelé négatif :</strong> ${props.path_descent ?? 'N/A'} m</p>
+                    <p><strong>Altitude minimale :</strong> ${(props.elevation_min ?? minEle).toFixed(0)} m</p>
+                    <p><strong>Altitude maximale :</strong> ${(props.elevation_max ?? maxEle).toFixed(0)} m</p>
+                    <p><strong>Pente maximale :</strong> ${props.max_slope ?? 'N/A'} %</p>
                 `;
                 // message d'erreur éventuel sur l'élévation
                 if (props.elevation_error) {
                     legendDiv.innerHTML +=
                         `<p style="color:#ef8409;"><strong>⚠️ Altitude non récupérée</strong></p>`;
                 }
+                // calcul simplifié sous charge (mode dégradé)
+                if (props.degraded) {
+                    legendDiv.innerHTML +=
+                        `<p style="color:#ef8409;"><strong>⚠️ Service dégradé :</strong> tracé calculé en mode simplifié</p>`;
+                }
             }
 
         }, 100); // 100ms pour être sûr que le DOM a pris la taille
@@ -291,6 +313,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (endMarker) { map.removeLayer(endMarker); endMarker = null; }
         if (arrowDecorator) { map.removeLayer(arrowDecorator); arrowDecorator = null; }
         if (poiLayer) { map.removeLayer(poiLayer); poiLayer = null; }
+        if (draftLayer) { map.removeLayer(draftLayer); draftLayer = null; }
     }
 
 
@@ -419,12 +442,85 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     document.querySelectorAll('.floating-modal').forEach(addToggleExclusive);
 
+    // === Format compact (format=compact) ===
+    function decodePolyline(encoded, precisions) {
+        const factors = precisions.map(p => Math.pow(10, p));
+        const current = precisions.map(() => 0);
+        const points = [];
+        let index = 0;
+        while (index < encoded.length) {
+            const point = [];
+            for (let dim = 0; dim < factors.length; dim++) {
+                let result = 0, shift = 0, byte;
+                do {
+                    byte = encoded.charCodeAt(index++) - 63;
+                    result |= (byte & 0x1f) << shift;
+                    shift += 5;
+                } while (byte >= 0x20);
+                current[dim] += (result & 1) ? ~(result >> 1) : (result >> 1);
+                point.push(current[dim] / factors[dim]);
+            }
+            points.push(point);
+        }
+        return points;
+    }
+
+    // Reconstruit le GeoJSON complet : tracé décodé, POI résolus depuis le fichier POI du massif
+    async function expandCompactRoute(data) {
+        const props = { ...data.properties };
+        const coordinates = decodePolyline(data.path, data.precision)
+            .map(([lat, lon, ele]) => [lon, lat, ele]);
+
+        props.near_pois = [];
+        if (props.massif && Array.isArray(props.near_poi_ids) && props.near_poi_ids.length > 0) {
+            try {
+                const res = await fetch(`/data/output/${props.massif}_poi_scores.geojson`);
+                if (res.ok) {
+                    const features = (await res.json()).features || [];
+                    props.near_pois = props.near_poi_ids.map(i => features[i]).filter(Boolean);
+                }
+            } catch (err) {
+                console.warn('Erreur chargement POI :', err);
+            }
+        }
+
+        return {
+            type: 'FeatureCollection',
+            route_id: data.route_id,
+            generated_filename: data.generated_filename,
+            features: [{ type: 'Feature', geometry: { type: 'LineString', coordinates }, properties: props }],
+        };
+    }
+
+    // Résultat intermédiaire du flux d'événements : tracé provisoire affiché avant les altitudes
+    function renderPartial(partial) {
+        if (partial.stage === 'draft_path' && partial.path) {
+            const latlngs = decodePolyline(partial.path, partial.precision);
+            if (draftLayer) { map.removeLayer(draftLayer); }
+            draftLayer = L.polyline(latlngs, { color: '#ef8409', weight: 3, opacity: 0.5, dashArray: '6 6' }).addTo(map);
+            map.fitBounds(draftLayer.getBounds());
+        } else if (partial.stage === 'transit_go' && partial.transit_go) {
+            let arrival = null;
+            (partial.transit_go.routes || []).forEach(route => route.legs.forEach(leg => leg.steps.forEach(step => {
+                arrival = step.transitDetails.stopDetails.arrivalStop.name || arrival;
+            })));
+            if (arrival) {
+                setRouteStatus(`Départ de la randonnée : ${arrival}`);
+            }
+        }
+    }
+
     async function renderRoute(data) {
+        if (data.format === 'compact') {
+            data = await expandCompactRoute(data);
+        }
+        if (draftLayer) { map.removeLayer(draftLayer); draftLayer = null; }
         if (!data.features || data.features.length === 0) {
             throw new Error("Aucun itinéraire trouvé !");
         }
 
         lastGeneratedFilename = data.generated_filename || null;
+        lastRouteId = data.route_id || null;
 
         currentLayer = L.geoJSON(data, { style: { color: '#ef8409', weight: 4, opacity: 0.9 } }).addTo(map);
 
@@ -573,6 +669,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const container = document.getElementById('modals-container');
         const oldBtn = document.getElementById('gpx-download-btn');
         if (oldBtn) oldBtn.remove();
+        // GPX indisponible en mode dégradé (refusé par le serveur)
+        if ((props.degraded_stages || []).includes('no_gpx')) return;
 
         const gpxBtn = document.createElement('button');
         gpxBtn.id = 'gpx-download-btn';
@@ -634,6 +732,11 @@ document.addEventListener('DOMContentLoaded', () => {
         let requestId = null;
         try {
             const startResponse = await fetch(startUrl);
+            if (startResponse.status === 503) {
+                const busy = await startResponse.json().catch(() => null);
+                const retryAfter = busy?.retry_after || startResponse.headers.get('Retry-After');
+                throw new Error(`Serveur occupé, réessayez${retryAfter ? ` dans ${retryAfter} s` : ' plus tard'}.`);
+            }
             if (!startResponse.ok) {
                 throw new Error('Impossible de lancer le calcul du tracé.');
             }
@@ -642,6 +745,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (!requestId) {
                 throw new Error('Réponse invalide du serveur.');
             }
+            if (activeRequestId && activeRequestId !== requestId) {
+                cancelRoute(activeRequestId);
+            }
+            activeRequestId = requestId;
         } catch (err) {
             submitBtn.disabled = false;
             submitBtn.textContent = originalBtnText;
@@ -661,17 +768,24 @@ document.addEventListener('DOMContentLoaded', () => {
 
         const pollStatus = async () => {
             try {
-                const statusResp = await fetch(`/route_status/?request_id=${encodeURIComponent(requestId)}`);
+                const statusResp = await fetch(`/route_status/?request_id=${encodeURIComponent(requestId)}&format=compact`);
                 if (!statusResp.ok) {
                     const errData = await statusResp.json().catch(() => null);
                     throw new Error(errData?.error || 'Erreur de suivi du calcul.');
                 }
 
                 const statusData = await statusResp.json();
-                setRouteStatus(statusData.status || 'Calcul en cours…');
+                if (statusData.queue_position > 0) {
+                    setRouteStatus(`En file d'attente (position ${statusData.queue_position})`);
+                } else {
+                    setRouteStatus(statusData.status || 'Calcul en cours…');
+                }
 
                 if (statusData.finished) {
                     stopPolling();
+                    if (activeRequestId === requestId) {
+                        activeRequestId = null;
+                    }
                     if (statusData.error) {
                         throw new Error(statusData.error);
                     }
@@ -694,8 +808,48 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         };
 
-        await pollStatus();
-        pollTimer = setInterval(pollStatus, 2000);
+        const startPolling = async () => {
+            await pollStatus();
+            if (submitBtn.disabled) {
+                pollTimer = setInterval(pollStatus, 2000);
+            }
+        };
+
+        // Flux d'événements (SSE) ; en cas d'indisponibilité, suivi par requêtes périodiques
+        if (!window.EventSource) {
+            await startPolling();
+            return;
+        }
+        const source = new EventSource(`/route_events/?request_id=${encodeURIComponent(requestId)}`);
+        let received = false;
+        source.addEventListener('status', e => {
+            received = true;
+            const statusData = JSON.parse(e.data);
+            if (statusData.finished) {
+                // Résultat (ou erreur) lu une seule fois sur /route_status/
+                source.close();
+                pollStatus();
+            } else {
+                setRouteStatus(statusData.status || 'Calcul en cours…');
+            }
+        });
+        source.addEventListener('partial', e => {
+            received = true;
+            try {
+                renderPartial(JSON.parse(e.data));
+            } catch (err) {
+                console.warn('Résultat intermédiaire ignoré :', err);
+            }
+        });
+        source.onerror = () => {
+            // Le navigateur reconnecte seul (Last-Event-ID) ; sans aucun événement reçu, repli sur le polling
+            if (!received || source.readyState === EventSource.CLOSED) {
+                source.close();
+                if (submitBtn.disabled && !pollTimer) {
+                    startPolling();
+                }
+            }
+        };
     });
 
 });
@@ -1,3 +1,160 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from hello.routing.domain import progress
+from hello.routing.domain.elevation_profile import hysteresis_gain
+from hello.routing.utils import job_queue
+from hello.routing.utils.compact_route import encode_polyline
+
+
+class JobQueueTests(SimpleTestCase):
+    """File durable : idempotence, bail et tentatives, états terminaux."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(job_queue, "QUEUE_PATH", os.path.join(tmp.name, "jobs.sqlite3"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueue_is_idempotent_until_done(self):
+        self.assertTrue(job_queue.enqueue("job", {"n": 1}, max_attempts=3))
+        self.assertFalse(job_queue.enqueue("job", {"n": 2}, max_attempts=3))
+        self.assertEqual(job_queue.queue_depth(), 1)
+
+        job_id, payload, attempts, _ = job_queue.claim("w1", 60)
+        self.assertEqual((job_id, payload, attempts), ("job", {"n": 1}, 1))
+        self.assertFalse(job_queue.enqueue("job", {"n": 3}, max_attempts=3))
+        self.assertEqual(job_queue.queue_position("job"), 0)
+
+        self.assertTrue(job_queue.complete("job", "w1"))
+        self.assertIsNone(job_queue.queue_position("job"))
+        self.assertTrue(job_queue.enqueue("job", {"n": 4}, max_attempts=3))
+        self.assertEqual(job_queue.queue_position("job"), 1)
+        self.assertEqual(job_queue.claim("w2", 60)[:3], ("job", {"n": 4}, 1))
+
+    def test_expired_lease_is_reclaimed_then_failed(self):
+        job_queue.enqueue("job", {}, max_attempts=2)
+        # Bail déjà expiré : le worker a disparu
+        self.assertEqual(job_queue.claim("w1", -1)[:3], ("job", {}, 1))
+        job_id, _, attempts, expired = job_queue.claim("w2", -1)
+        self.assertEqual((job_id, attempts, expired), ("job", 2, []))
+        self.assertFalse(job_queue.complete("job", "w1"))
+
+        job_id, _, _, expired = job_queue.claim("w3", 60)
+        self.assertIsNone(job_id)
+        self.assertEqual(expired, ["job"])
+        stats = job_queue.queue_stats()
+        self.assertEqual((stats["failed"], stats["running"]), (1, 0))
+
+    def test_complete_refused_after_cancel(self):
+        job_queue.enqueue("job", {}, max_attempts=3)
+        job_queue.claim("w1", 60)
+        self.assertTrue(job_queue.cancel("job"))
+        self.assertFalse(job_queue.complete("job", "w1"))
+        self.assertFalse(job_queue.fail("job", "w1", "erreur", 0))
+        self.assertEqual(job_queue.queue_stats()["failed"], 1)
+
+
+class RouteSubscriberTests(SimpleTestCase):
+    """Abonnés d'un calcul partagé : seul le départ du dernier l'annule."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(progress, "STATUS_PATH", os.path.join(tmp.name, "status.sqlite3"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._close_connection)
+        self._close_connection()
+
+    def _close_connection(self):
+        conn = getattr(progress._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        progress._local.conn = None
+
+    def test_last_unsubscribe_cancels_shared_job(self):
+        progress.initialize_route_status("job")
+        self.assertTrue(progress.subscribe_route("a", "job"))
+        self.assertTrue(progress.subscribe_route("b", "job", running_only=True))
+        self.assertEqual(progress.resolve_route_id("b"), "job")
+
+        self.assertEqual(progress.unsubscribe_route("a"), ("job", False))
+        self.assertFalse(progress.get_route_status("job", include_result=False)["finished"])
+        self.assertFalse(progress.route_cancelled_since("job", 0))
+
+        self.assertEqual(progress.unsubscribe_route("b"), ("job", True))
+        status = progress.get_route_status("job", include_result=False)
+        self.assertTrue(status["finished"])
+        self.assertEqual(status["error"], "Calcul annulé")
+        self.assertTrue(progress.route_cancelled_since("job", 0))
+
+    def test_unknown_client_and_finished_job(self):
+        self.assertEqual(progress.unsubscribe_route("inconnu"), (None, False))
+        progress.initialize_route_status("job")
+        progress.update_route_status("job", finished=True)
+        self.assertFalse(progress.subscribe_route("a", "job", running_only=True))
+        self.assertIsNone(progress.resolve_route_id("a"))
+
+
+def _decode_polyline(encoded, precisions):
+    """Décodage équivalent à decodePolyline (index.js)."""
+    current = [0] * len(precisions)
+    points, index = [], 0
+    while index < len(encoded):
+        point = []
+        for dim, precision in enumerate(precisions):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            current[dim] += ~(result >> 1) if result & 1 else result >> 1
+            point.append(current[dim] / 10 ** precision)
+        points.append(point)
+    return points
+
+
+class PolylineTests(SimpleTestCase):
+    """Encodage polyline du format compact, décodé à la main par le front."""
+
+    def test_google_reference_vector(self):
+        rows = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(rows, (5, 5)), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_three_dimension_round_trip(self):
+        rows = [(45.12345, 5.67891, -12.0), (45.12001, 5.68012, 3.0), (45.11876, 5.67555, -250.0)]
+        decoded = _decode_polyline(encode_polyline(rows, (5, 5, 0)), (5, 5, 0))
+        self.assertEqual(len(decoded), len(rows))
+        for expected, actual in zip(rows, decoded):
+            for e, a in zip(expected, actual):
+                self.assertAlmostEqual(e, a, places=5)
+
+    def test_empty_path(self):
+        self.assertEqual(encode_polyline([], (5, 5)), "")
+
+
+class HysteresisTests(SimpleTestCase):
+    """Dénivelés par hystérésis : le bruit sous le seuil n'est pas compté."""
+
+    def test_noisy_flat_profile(self):
+        values = [1000 + (2 if i % 2 else -2) for i in range(200)]
+        self.assertEqual(hysteresis_gain(values, threshold=5), (0.0, 0.0))
+
+    def test_single_climb(self):
+        # Montée de 2 m par point, bruit de ±3 m : retours de 4 m sous le seuil
+        values = [1000 + i * 2 + (3 if i % 2 else -3) for i in range(51)]
+        ascent, descent = hysteresis_gain(values, threshold=5)
+        self.assertEqual(ascent, max(values) - values[0])
+        self.assertEqual(descent, 0.0)
+
+    def test_climb_then_descent(self):
+        values = [1000, 1200, 1195, 1300, 1100]
+        self.assertEqual(hysteresis_gain(values, threshold=10), (300.0, 200.0))
@@ -6,6 +6,12 @@ urlpatterns = [
     path('get_route/', views.get_route, name='get_route'),  # API GeoJSON
     path('start_route/', views.start_route, name='start_route'),  # Lance le calcul en arrière-plan
     path('route_status/', views.route_status, name='route_status'),  # Suivi d'avancement du calcul
+    path('route_events/', views.route_events, name='route_events'),  # Flux SSE de l'avancement (ASGI)
+    path('cancel_route/', views.cancel_route, name='cancel_route'),  # Annulation d'un calcul en cours
+    path('metrics/', views.metrics, name='metrics'),  # Métriques file de calcul et caches
     path('gares/', views.gares_list, name='gares_list'),  # Liste des gares pour autocomplete
+    path('data/output/<str:massif>_poi_scores.geojson', views.poi_scores, name='poi_scores'),  # Fichier POI d'un massif (async)
+    path('routes/<str:key>.geojson', views.route_geojson, name='route_geojson'),  # Itinéraire stocké (pré-compressé)
+    path('routes/<str:key>.gpx', views.route_gpx, name='route_gpx'),  # GPX généré au téléchargement
 ]
 
@@ -1,17 +1,37 @@
 import traceback
 import os
 import json
-import csv
+import re
+import time
 import uuid
-import threading
-from datetime import datetime
+import asyncio
+from concurrent.futures import CancelledError
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
-from hello.routing.trouver_chemin import compute_best_route
-from hello.routing.domain.progress import initialize_route_status, update_route_status, get_route_status
+from django.views.decorators.csrf import csrf_exempt
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
+from hello.routing.utils.files_tools import route_coordinates, iter_gpx, log_get_route_call
+from hello.routing.utils.route_store import route_variants, load_route
+from hello.routing.utils.compact_route import compact_route
+from hello.routing.utils.job_executor import get_executor, QueueFull, DEFAULT_RETRY_AFTER_S
+from hello.routing.utils import job_queue
+from hello.routing.utils.route_cache import default_seed, request_key, get_cached_result, cache_result
+from hello.routing.utils.load_shedding import degraded_stages, upstream_latency, UPSTREAM_STAGES, NO_GPX
+from hello.routing.domain.elevation_cache import cache_stats
+from hello.routing.domain.progress import (
+    initialize_route_status, update_route_status, get_route_status, get_route_events,
+    subscribe_route, unsubscribe_route, resolve_route_id,
+)
+from hello.routing.domain.deadline import RouteCancelled
 from hello.constants import RANDOMNESS_OPTIONS, RANDOMNESS_DEFAULT
 
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+SSE_HEARTBEAT_S = 15        # commentaire envoyé sur un flux inactif (proxys, détection de déconnexion)
+
 
 def index(request):
     return render(request, "hello/index.html", {
@@ -19,37 +39,62 @@ def index(request):
         "randomness_default": RANDOMNESS_DEFAULT,
     })
 
-def _log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, result):
-    """Enregistre l'appel à get_route dans un fichier CSV."""
-    logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "logs")
-    os.makedirs(logs_dir, exist_ok=True)
-    
-    csv_file = os.path.join(logs_dir, "appels_get_route.csv")
-    
-    # Vérifier si le fichier existe pour ajouter l'en-tête si nécessaire
-    file_exists = os.path.isfile(csv_file)
-    
-    with open(csv_file, "a", newline="", encoding="utf-8") as f:
-        fieldnames = ["date_appel", "massif", "address", "level", "randomness", "departure_datetime", "return_datetime", "transit_priority", "pois", "resultat"]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow({
-            "date_appel": datetime.now().isoformat(),
-            "massif": massif,
-            "address": address,
-            "level": level,
-            "randomness": randomness_str,
-            "departure_datetime": departure_datetime,
-            "return_datetime": return_datetime,
-            "transit_priority": transit_priority,
-            "pois": pois,
-            "resultat": result
-        })
-
-def get_route(request):
+def _request_seed(request, params):
+    """Graine explicite (paramètre `seed`) ou dérivée des paramètres et de la fenêtre de temps en cours."""
+    try:
+        return int(request.GET["seed"])
+    except (KeyError, ValueError):
+        return default_seed(params)
+
+
+def _in_flight(request_id, status_data):
+    """Calcul en cours pour cet identifiant (dans la file, ou statut mis à jour récemment par un autre processus)."""
+    if status_data is None or status_data.get("finished"):
+        return False
+    if _queue_position(request_id) is not None:
+        return True
+    updated_at = datetime.fromisoformat(status_data["updated_at"].replace("Z", "+00:00"))
+    return (datetime.now(timezone.utc) - updated_at).total_seconds() < settings.ROUTING_JOB_VISIBILITY_TIMEOUT
+
+
+async def _compute_route(params, cache_key, randomness_str=None):
+    """
+    Calcule l'itinéraire hors de la boucle ASGI : exécuteur de calcul (threads ou processus)
+    ou, en backend "queue", worker de la file durable dont on attend le statut final.
+    """
+    if settings.ROUTING_EXECUTOR_BACKEND != "queue":
+        future = get_executor().submit(uuid.uuid4().hex, params)
+        return await asyncio.wrap_future(future)
+
+    request_id = cache_key
+    # Abonné au calcul partagé le temps de l'attente : les départs des clients regroupés ne l'annulent pas
+    client_id = uuid.uuid4().hex
+    status_data = await sync_to_async(get_route_status, thread_sensitive=False)(request_id, include_result=False)
+    in_flight = await sync_to_async(_in_flight, thread_sensitive=False)(request_id, status_data)
+    if not (in_flight and await sync_to_async(subscribe_route, thread_sensitive=False)(
+        client_id, request_id, running_only=True
+    )):
+        await sync_to_async(initialize_route_status, thread_sensitive=False)(request_id, "En file d'attente...", 0)
+        await sync_to_async(subscribe_route, thread_sensitive=False)(client_id, request_id)
+        await sync_to_async(job_queue.enqueue, thread_sensitive=False)(
+            request_id, {"params": params, "randomness_str": randomness_str, "cache_key": cache_key}
+        )
+    try:
+        # Au-delà de toutes les tentatives possibles, aucun worker n'a traité la demande
+        deadline = time.monotonic() + settings.ROUTING_JOB_VISIBILITY_TIMEOUT * settings.ROUTING_JOB_MAX_ATTEMPTS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.ROUTE_EVENTS_POLL_INTERVAL_S * 4)
+            status_data = await sync_to_async(get_route_status, thread_sensitive=False)(request_id)
+            if status_data and status_data["finished"]:
+                if status_data["error"]:
+                    raise RuntimeError(status_data["error"])
+                return status_data["result"]
+        raise TimeoutError("Aucun worker de calcul disponible")
+    finally:
+        await sync_to_async(unsubscribe_route, thread_sensitive=False)(client_id, cancel=False)
+
+
+async def get_route(request):
     if request.method == "GET":
         try:
             massif = request.GET.get("massif", "Chartreuse")
@@ -82,32 +127,51 @@ def get_route(request):
                 f"transit_priority='{transit_priority}'"
             )
 
-            # --- Appel logique principale ---
-            geojson_data = compute_best_route(
-                randomness=randomness,
-                massif=massif,
-                departure_time=departure_datetime,
-                return_time=return_datetime,
-                level=level,
-                address=address,
-                transit_priority=transit_priority,
-                pois=pois,
-            )
+            # --- Appel logique principale (ou résultat en cache pour une demande identique) ---
+            # Le calcul passe par l'exécuteur de calcul : la boucle ASGI reste libre pour les autres vues
+            params = {
+                "randomness": randomness,
+                "massif": massif,
+                "departure_time": departure_datetime,
+                "return_time": return_datetime,
+                "level": level,
+                "address": address,
+                "transit_priority": transit_priority,
+                "pois": pois,
+            }
+            seed = _request_seed(request, params)
+            cache_key = request_key(params, seed)
+            geojson_data = await sync_to_async(get_cached_result, thread_sensitive=False)(cache_key)
+            if geojson_data is None:
+                params["seed"] = seed
+                # Hors de la clé de cache : un résultat dégradé n'est pas mis en cache (cache_result)
+                params["degraded"] = await sync_to_async(_degraded_stages, thread_sensitive=False)()
+                geojson_data = await _compute_route(params, cache_key, randomness_str)
+                await sync_to_async(cache_result, thread_sensitive=False)(cache_key, geojson_data)
             print("Itinéraire calculé avec succès.")
 
             # Enregistrement du succès
-            _log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, "Succès")
+            await sync_to_async(log_get_route_call, thread_sensitive=False)(
+                massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, "Succès"
+            )
 
-            # `compute_best_route` now sauvegarde le geojson et le gpx et
-            # ajoute la clé `generated_filename` au GeoJSON retourné.
+            # `compute_best_route` stocke le geojson (servi par route_geojson, gpx produit
+            # au téléchargement par route_gpx) et ajoute les clés `route_id` et `generated_filename`.
+            if request.GET.get("format") == "compact":
+                return JsonResponse(compact_route(geojson_data))
             return JsonResponse(geojson_data)
 
+        except QueueFull as exc:
+            return _busy_response(exc.retry_after)
+
         except Exception as e:
             print("❌ ERREUR SERVEUR INTERNE:")
             print(traceback.format_exc())
             
             # Enregistrement de l'erreur
-            _log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, str(e))
+            await sync_to_async(log_get_route_call, thread_sensitive=False)(
+                massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, str(e)
+            )
             
             return JsonResponse({"error": str(e)}, status=500)
 
@@ -118,9 +182,6 @@ def start_route(request):
     if request.method != "GET":
         return JsonResponse({"error": "Méthode non autorisée"}, status=405)
 
-    request_id = uuid.uuid4().hex
-    initialize_route_status(request_id, "Démarrage du calcul du tracé...", 0)
-
     massif = request.GET.get("massif", "Chartreuse")
     address = request.GET.get("address", "")
     level = request.GET.get("level", "debutant")
@@ -143,53 +204,340 @@ def start_route(request):
     except ValueError:
         randomness = 0.25
 
-    def status_callback(message, progress=None):
-        update_route_status(request_id, message=message, progress=progress)
-
-    def worker():
+    params = {
+        "randomness": randomness,
+        "massif": massif,
+        "departure_time": departure_datetime,
+        "return_time": return_datetime,
+        "level": level,
+        "address": address,
+        "transit_priority": transit_priority,
+        "pois": pois,
+    }
+    seed = _request_seed(request, params)
+    cache_key = request_key(params, seed)
+
+    # Le calcul est identifié par la clé de la demande : les demandes identiques simultanées sont
+    # regroupées sur un seul calcul. Chaque client reçoit son propre identifiant (fourni par le client
+    # pour l'idempotence, sinon aléatoire), abonné au calcul : seul le départ du dernier l'annule.
+    request_id = cache_key
+    client_id = request.GET.get("request_id", "")
+    if not JOB_ID_RE.match(client_id) or client_id == cache_key:
+        client_id = uuid.uuid4().hex
+
+    cached = get_cached_result(cache_key)
+    if cached is not None:
+        initialize_route_status(request_id, "Itinéraire déjà calculé", 100)
+        update_route_status(request_id, message="Calcul terminé", progress=100, finished=True, result=cached)
+        subscribe_route(client_id, request_id)
+        return JsonResponse({"request_id": client_id, "cached": True})
+
+    if (_in_flight(request_id, get_route_status(request_id, include_result=False))
+            and subscribe_route(client_id, request_id, running_only=True)):
+        return JsonResponse({"request_id": client_id, "coalesced": True})
+
+    params["seed"] = seed
+    # Mode dégradé décidé à la soumission, quand la profondeur de la file est connue
+    params["degraded"] = _degraded_stages()
+
+    if settings.ROUTING_EXECUTOR_BACKEND == "queue":
+        # File durable : le calcul est fait par `manage.py routing_worker`
+        depth = job_queue.queue_depth()
+        if depth >= settings.ROUTING_MAX_QUEUE:
+            return _busy_response(DEFAULT_RETRY_AFTER_S * max(1, depth // settings.ROUTING_MAX_WORKERS))
+        initialize_route_status(request_id, "En file d'attente...", 0)
+        subscribe_route(client_id, request_id)
+        job_queue.enqueue(request_id, {"params": params, "randomness_str": randomness_str, "cache_key": cache_key})
+        return JsonResponse({"request_id": client_id})
+
+    initialize_route_status(request_id, "En file d'attente...", 0)
+    subscribe_route(client_id, request_id)
+
+    def status_callback(message, progress=None, partial=None):
+        update_route_status(request_id, message=message, progress=progress, partial=partial)
+
+    def on_done(future):
+        # Exécuté dans le processus web, quel que soit le backend (threads ou processus)
         try:
-            geojson_data = compute_best_route(
-                randomness=randomness,
-                massif=massif,
-                departure_time=departure_datetime,
-                return_time=return_datetime,
-                level=level,
-                address=address,
-                transit_priority=transit_priority,
-                pois=pois,
-                status_callback=status_callback,
-            )
-            _log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, "Succès")
+            geojson_data = future.result()
+            cache_result(cache_key, geojson_data)
+            log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, "Succès")
             update_route_status(request_id, message="Calcul terminé", progress=100, finished=True, result=geojson_data)
+        except (RouteCancelled, CancelledError):
+            # Statut déjà mis à jour par cancel_route (et peut-être remplacé par une nouvelle demande)
+            print(f"Calcul {request_id} annulé")
         except Exception as exc:
             error_message = str(exc)
             print("❌ ERREUR SERVEUR INTERNE (background):")
             print(traceback.format_exc())
-            _log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, error_message)
+            log_get_route_call(massif, address, level, randomness_str, departure_datetime, return_datetime, transit_priority, pois, error_message)
             update_route_status(request_id, message=f"Erreur : {error_message}", progress=100, finished=True, error=error_message)
 
-    thread = threading.Thread(target=worker, daemon=True)
-    thread.start()
+    try:
+        future = get_executor().submit(request_id, params, status_callback=status_callback)
+    except QueueFull as exc:
+        update_route_status(request_id, message="Serveur occupé", progress=100, finished=True, error=str(exc))
+        return _busy_response(exc.retry_after)
+    future.add_done_callback(on_done)
+
+    return JsonResponse({"request_id": client_id})
 
-    return JsonResponse({"request_id": request_id})
 
+@csrf_exempt
+def cancel_route(request):
+    """
+    Désabonne le client d'un calcul lancé par start_route (nouvelle demande, fermeture de l'onglet).
+    Le calcul, partagé par les demandes identiques regroupées, n'est annulé qu'au départ de son
+    dernier abonné : retiré de la file s'il n'a pas démarré, sinon arrêté à sa prochaine vérification
+    d'échéance. Sans jeton CSRF (navigator.sendBeacon) : l'identifiant client, aléatoire et connu
+    de lui seul, sert de jeton ; la clé du calcul, dérivable des paramètres, n'est pas acceptée.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
 
-def route_status(request):
+    client_id = request.POST.get("request_id")
+    if not client_id:
+        return JsonResponse({"error": "request_id requis"}, status=400)
+
+    request_id, cancelled = unsubscribe_route(client_id)
+    if request_id is None:
+        return JsonResponse({"error": "Demande introuvable"}, status=404)
+    if cancelled:
+        if settings.ROUTING_EXECUTOR_BACKEND == "queue":
+            job_queue.cancel(request_id)
+        else:
+            get_executor().cancel(request_id)
+    return JsonResponse({"request_id": client_id, "cancelled": cancelled})
+
+
+def _current_queue_depth():
+    if settings.ROUTING_EXECUTOR_BACKEND == "queue":
+        return job_queue.queue_depth()
+    return get_executor().queue_depth()
+
+
+def _degraded_stages():
+    """Étapes dégradées pour une demande soumise maintenant (charge de la file, latences amont)."""
+    return degraded_stages(_current_queue_depth())
+
+
+def _busy_response(retry_after):
+    response = JsonResponse({"error": "Serveur occupé, réessayez plus tard", "retry_after": retry_after}, status=503)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def _queue_position(request_id):
+    if settings.ROUTING_EXECUTOR_BACKEND == "queue":
+        return job_queue.queue_position(request_id)
+    return get_executor().queue_position(request_id)
+
+
+def _status_payload(client_id, compact):
+    request_id = resolve_route_id(client_id)
+    status_data = get_route_status(request_id) if request_id else None
+    if status_data is None:
+        return None
+    # Le client ne voit que son identifiant, jamais la clé du calcul partagé
+    status_data["request_id"] = client_id
+    if not status_data.get("finished"):
+        status_data["queue_position"] = _queue_position(request_id)
+    if compact and status_data.get("result"):
+        status_data = {**status_data, "result": compact_route(status_data["result"])}
+    return status_data
+
+
+async def route_status(request):
     if request.method != "GET":
         return JsonResponse({"error": "Méthode non autorisée"}, status=405)
 
-    request_id = request.GET.get("request_id")
-    if not request_id:
+    client_id = request.GET.get("request_id")
+    if not client_id:
         return JsonResponse({"error": "request_id requis"}, status=400)
 
-    status_data = get_route_status(request_id)
+    # Lecture SQLite hors de la boucle ASGI, sans attendre le thread des vues synchrones
+    status_data = await sync_to_async(_status_payload, thread_sensitive=False)(
+        client_id, request.GET.get("format") == "compact"
+    )
     if status_data is None:
         return JsonResponse({"error": "Demande introuvable"}, status=404)
 
     return JsonResponse(status_data)
 
 
-def gares_list(request):
+async def route_events(request):
+    """
+    Flux Server-Sent Events de l'avancement d'un calcul (servi par ASGI) : événements "status"
+    (même contenu que /route_status/, sans le résultat) et "partial" (transport aller choisi,
+    tracé provisoire). Le flux se termine au statut final ; le résultat se lit ensuite sur
+    /route_status/. Reprise après coupure via l'en-tête Last-Event-ID.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
+
+    client_id = request.GET.get("request_id")
+    if not client_id:
+        return JsonResponse({"error": "request_id requis"}, status=400)
+    request_id = await sync_to_async(resolve_route_id, thread_sensitive=False)(client_id)
+    if request_id is None or await sync_to_async(get_route_status, thread_sensitive=False)(
+            request_id, include_result=False) is None:
+        return JsonResponse({"error": "Demande introuvable"}, status=404)
+
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or 0)
+    except ValueError:
+        last_id = 0
+
+    read_events = sync_to_async(get_route_events, thread_sensitive=False)
+
+    async def stream():
+        nonlocal last_id
+        yield "retry: 2000\n\n"
+        deadline = time.monotonic() + settings.ROUTE_EVENTS_MAX_DURATION_S
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            events = await read_events(request_id, last_id)
+            for event_id, kind, data in events:
+                last_id = event_id
+                if kind == "status":
+                    data = {**data, "request_id": client_id}
+                yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                if kind == "status" and data.get("finished"):
+                    return
+            if events:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > SSE_HEARTBEAT_S:
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(settings.ROUTE_EVENTS_POLL_INTERVAL_S)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # pas de mise en tampon par nginx
+    return response
+
+
+def metrics(request):
+    """
+    Métriques du processus : file de calcul (profondeur, attentes, durées), cache d'altitudes,
+    mode dégradé en cours et latences des API amont.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
+
+    if settings.ROUTING_EXECUTOR_BACKEND == "queue":
+        routing = {"backend": "queue", **job_queue.queue_stats()}
+    else:
+        routing = get_executor().metrics()
+    return JsonResponse({
+        "routing": routing,
+        "elevation_cache": cache_stats(),
+        "degraded_stages": _degraded_stages(),
+        "upstream_latency_s": {upstream: upstream_latency(upstream) for upstream in UPSTREAM_STAGES},
+    })
+
+
+ROUTE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _accepted_encodings(request):
+    return {part.split(";")[0].strip() for part in request.headers.get("Accept-Encoding", "").split(",")}
+
+
+def _not_modified(request, etag):
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = ROUTE_CACHE_CONTROL
+        return response
+    return None
+
+
+def route_geojson(request, key):
+    """Sert un itinéraire stocké, pré-compressé (brotli ou gzip selon le client), avec ETag et cache long."""
+    if request.method != "GET":
+        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
+
+    variants = route_variants(key)
+    if not variants:
+        return JsonResponse({"error": "Itinéraire introuvable"}, status=404)
+
+    # Contenu adressé par hash : la clé est un ETag fort et le fichier ne change jamais
+    etag = f'"{key}"'
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+
+    accepted = _accepted_encodings(request)
+    encoding = next((enc for enc in ("br", "gzip") if enc in variants and enc in accepted), None)
+    if encoding:
+        response = FileResponse(open(variants[encoding], "rb"), content_type="application/geo+json")
+        response["Content-Encoding"] = encoding
+    else:
+        response = HttpResponse(json.dumps(load_route(key), separators=(",", ":")), content_type="application/geo+json")
+    response["ETag"] = etag
+    response["Cache-Control"] = ROUTE_CACHE_CONTROL
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def route_gpx(request, key):
+    """Génère le GPX d'un itinéraire stocké à la demande, en flux."""
+    if request.method != "GET":
+        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
+
+    result = load_route(key)
+    if result is None:
+        return JsonResponse({"error": "Itinéraire introuvable"}, status=404)
+
+    etag = f'"{key}-gpx"'
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+
+    # Mode dégradé : la génération GPX est refusée pour libérer le serveur
+    if NO_GPX in _degraded_stages():
+        return _busy_response(DEFAULT_RETRY_AFTER_S)
+
+    response = StreamingHttpResponse(iter_gpx(route_coordinates(result)), content_type="application/gpx+xml")
+    response["Content-Disposition"] = f'attachment; filename="{key}.gpx"'
+    response["ETag"] = etag
+    response["Cache-Control"] = ROUTE_CACHE_CONTROL
+    return response
+
+
+_gares_cache = {}   # chemin -> (mtime, liste des gares)
+
+
+def _load_gares(geojson_path):
+    """Liste simplifiée des gares, relue seulement si le fichier a changé."""
+    mtime = os.path.getmtime(geojson_path)
+    cached = _gares_cache.get(geojson_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(geojson_path, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+
+    results = []
+    for feat in data.get("features", []):
+        props = feat.get("properties", {})
+        libelle = props.get("libelle") or props.get("name") or ""
+        code = props.get("code_uic") or props.get("idgaia")
+        # geometry coordinates [lon, lat]
+        geom = feat.get("geometry") or {}
+        coords = geom.get("coordinates") if geom else None
+        lon = coords[0] if coords and len(coords) >= 2 else None
+        lat = coords[1] if coords and len(coords) >= 2 else None
+
+        if libelle:
+            results.append({"name": libelle, "code_uic": code, "lon": lon, "lat": lat})
+
+    _gares_cache[geojson_path] = (mtime, results)
+    return results
+
+
+async def gares_list(request):
     """Retourne une liste simplifiée des gares pour l'autocomplete.
     Format: [{"name": ..., "code_uic": ..., "lon": ..., "lat": ...}, ...]
     """
@@ -202,25 +550,44 @@ def gares_list(request):
         project_root = os.path.abspath(os.path.join(current_dir, ".."))
         geojson_path = os.path.join(project_root, "data", "input", "liste-des-gares.geojson")
 
-        with open(geojson_path, "r", encoding="utf-8") as fh:
-            data = json.load(fh)
-
-        results = []
-        for feat in data.get("features", []):
-            props = feat.get("properties", {})
-            libelle = props.get("libelle") or props.get("name") or ""
-            code = props.get("code_uic") or props.get("idgaia")
-            # geometry coordinates [lon, lat]
-            geom = feat.get("geometry") or {}
-            coords = geom.get("coordinates") if geom else None
-            lon = coords[0] if coords and len(coords) >= 2 else None
-            lat = coords[1] if coords and len(coords) >= 2 else None
-
-            if libelle:
-                results.append({"name": libelle, "code_uic": code, "lon": lon, "lat": lat})
-
+        results = await sync_to_async(_load_gares, thread_sensitive=False)(geojson_path)
         return JsonResponse(results, safe=False)
 
     except Exception as e:
         print("Erreur gares_list:", e)
         return JsonResponse({"error": str(e)}, status=500)
+
+
+_poi_cache = {}     # chemin -> (mtime, contenu, etag)
+
+
+def _load_poi_file(path):
+    mtime = os.path.getmtime(path)
+    cached = _poi_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached
+    with open(path, "rb") as fh:
+        content = fh.read()
+    cached = (mtime, content, f'"{int(mtime)}-{len(content)}"')
+    _poi_cache[path] = cached
+    return cached
+
+
+async def poi_scores(request, massif):
+    """Fichier POI d'un massif (data/output/<massif>_poi_scores.geojson), gardé en mémoire, avec ETag."""
+    if request.method != "GET":
+        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
+
+    path = os.path.join(settings.BASE_DIR, "data", "output", f"{massif}_poi_scores.geojson")
+    try:
+        _, content, etag = await sync_to_async(_load_poi_file, thread_sensitive=False)(path)
+    except FileNotFoundError:
+        return JsonResponse({"error": "Fichier POI introuvable"}, status=404)
+
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type="application/geo+json")
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=3600"
+    return response
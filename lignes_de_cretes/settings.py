@@ -123,6 +123,77 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Caches
+# "transit" : cache fichier partagé entre les workers gunicorn (échecs TC récents,
+#             réponses Google Routes réduites aux champs utilisés)
+# "routes" : clé de demande -> itinéraire stocké (cache de résultats)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'transit': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'data' / 'cache' / 'transit',
+        'OPTIONS': {'MAX_ENTRIES': 50_000},
+    },
+    'routes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'data' / 'cache' / 'routes',
+        'OPTIONS': {'MAX_ENTRIES': 10_000},
+    },
+}
+
+# Demandes identiques (paramètres, graine, version des données) servies depuis le cache pendant ce délai (s)
+ROUTE_RESULT_CACHE_TTL = 15 * 60
+
+# Altitudes
+# Tuiles MNT GeoTIFF échantillonnées localement ; Open-Elevation en repli pour les points non couverts
+
+ELEVATION_DEM_DIR = BASE_DIR / 'data' / 'input' / 'dem'
+ELEVATION_REMOTE_FALLBACK = True
+
+# Itinéraires générés : stockage adressé par contenu, hors des fichiers statiques
+
+ROUTE_STORE_DIR = BASE_DIR / 'data' / 'routes'
+ROUTE_STORE_MAX_BYTES = 500 * 1024 * 1024
+ROUTE_STORE_MAX_AGE_DAYS = 30
+
+# Calculs d'itinéraire en arrière-plan (par processus web) : calculs simultanés et file d'attente bornés
+
+ROUTING_MAX_WORKERS = 2
+ROUTING_MAX_QUEUE = 16
+
+# "thread" (pool de threads du processus web), "process" (pool de processus : tous les cœurs,
+# massifs préchargés au démarrage des workers, recyclage après ROUTING_PROCESS_MAX_TASKS calculs)
+# ou "queue" (file durable SQLite traitée par `manage.py routing_worker`)
+ROUTING_EXECUTOR_BACKEND = 'thread'
+ROUTING_PROCESS_MAX_TASKS = 50
+ROUTING_PRELOAD_MASSIFS = []
+
+# File durable : tentatives par calcul, bail d'un worker (s) et délai avant nouvelle tentative (s)
+ROUTING_JOB_MAX_ATTEMPTS = 3
+ROUTING_JOB_VISIBILITY_TIMEOUT = 600
+ROUTING_JOB_RETRY_DELAY_S = 30
+
+# Statuts des calculs (data/state/route_status.sqlite3) supprimés après ce délai sans mise à jour (s)
+ROUTE_STATUS_TTL_S = 24 * 3600
+
+# Échéance d'un calcul (s) : au-delà, le meilleur tracé partiel est finalisé ou le calcul abandonné.
+# Inférieure au --timeout de gunicorn (180 s, entrypoint.sh) pour que get_route réponde toujours
+ROUTE_DEADLINE_S = 150
+
+# Flux SSE /route_events/ : intervalle de lecture du journal d'événements (s) et durée maximale d'un flux (s)
+ROUTE_EVENTS_POLL_INTERVAL_S = 0.25
+ROUTE_EVENTS_MAX_DURATION_S = 15 * 60
+
+# Mode dégradé (délestage, hello/routing/utils/load_shedding.py) : 'auto', 'on' ou 'off'.
+# En 'auto' : dégradé si la file atteint DEGRADED_QUEUE_DEPTH demandes, ou, pour l'étape concernée,
+# si la latence moyenne d'une API amont (Google Routes, Open-Elevation) dépasse DEGRADED_UPSTREAM_LATENCY_S
+ROUTING_DEGRADED_MODE = 'auto'
+DEGRADED_QUEUE_DEPTH = 8
+DEGRADED_UPSTREAM_LATENCY_S = 5
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 